@@ -0,0 +1,241 @@
+"""
+Compressed GPS breadcrumb history.
+
+Points are kept per driver per day in append-only files,
+BREADCRUMB_DIR/<driver_id>/<YYYY-MM-DD>.bin. Every flush appends one chunk:
+a varint byte length, a varint point count, then the points as zigzag
+varints - the first point absolute, the rest as deltas from the previous
+point. Coordinates are stored in 1e-5 degree units (about 1 m) and times
+in whole seconds, so a 10-second ping on the road costs about 5 bytes and
+a year of pings for the fleet fits on a small volume. A chunk torn by a
+crash is cut off before the next append to its file.
+
+Range queries decode only the days they span. Douglas-Peucker simplification
+thins a track for map display without moving its corners.
+"""
+import os
+import logging
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BREADCRUMB_DIR = Path(os.getenv("BREADCRUMB_DIR", "./data/breadcrumbs"))
+COORDINATE_SCALE = 100000  # 1e-5 degrees
+EARTH_RADIUS_METERS = 6371000.0
+
+Point = Tuple[float, float, int]  # lat, lng, epoch seconds
+
+def write_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+def zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+def unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+def encode_chunk(points: List[Point]) -> bytes:
+    """One length-prefixed chunk of delta-encoded points"""
+    body = bytearray()
+    write_varint(len(points), body)
+    prev = (0, 0, 0)
+    for lat, lng, ts in points:
+        current = (round(lat * COORDINATE_SCALE), round(lng * COORDINATE_SCALE), int(ts))
+        for value, previous in zip(current, prev):
+            write_varint(zigzag(value - previous), body)
+        prev = current
+    chunk = bytearray()
+    write_varint(len(body), chunk)
+    return bytes(chunk + body)
+
+def decode_points(body) -> List[Point]:
+    """The points of one chunk body; raises if they do not fill it exactly"""
+    count, pos = read_varint(body, 0)
+    points: List[Point] = []
+    lat = lng = ts = 0
+    for _ in range(count):
+        value, pos = read_varint(body, pos)
+        lat += unzigzag(value)
+        value, pos = read_varint(body, pos)
+        lng += unzigzag(value)
+        value, pos = read_varint(body, pos)
+        ts += unzigzag(value)
+        points.append((lat / COORDINATE_SCALE, lng / COORDINATE_SCALE, ts))
+    if pos != len(body):
+        raise ValueError("Breadcrumb chunk length does not match its points")
+    return points
+
+def decode_chunks(data: bytes) -> Iterator[Point]:
+    view = memoryview(data)
+    pos = 0
+    while pos < len(data):
+        try:
+            length, pos = read_varint(data, pos)
+        except IndexError:
+            # A crash mid-append can leave part of a length prefix
+            logger.warning("Truncated breadcrumb chunk ignored")
+            return
+        end = pos + length
+        if end > len(data):
+            logger.warning("Truncated breadcrumb chunk ignored")
+            return
+        try:
+            yield from decode_points(view[pos:end])
+        except (IndexError, ValueError):
+            # A torn chunk written before appends repaired the tail swallows the next one
+            logger.warning("Corrupt breadcrumb chunk ignored")
+        pos = end
+
+def intact_length(data: bytes) -> int:
+    """Bytes up to the end of the last whole chunk; anything after is a torn append"""
+    pos = 0
+    while pos < len(data):
+        try:
+            length, start = read_varint(data, pos)
+        except IndexError:
+            break
+        if start + length > len(data):
+            break
+        pos = start + length
+    return pos
+
+def local_meters(points: np.ndarray) -> np.ndarray:
+    """Equirectangular projection of (lat, lng) rows to meters around their mean latitude"""
+    lat0 = np.radians(points[:, 0].mean())
+    return np.column_stack([
+        np.radians(points[:, 1]) * np.cos(lat0) * EARTH_RADIUS_METERS,
+        np.radians(points[:, 0]) * EARTH_RADIUS_METERS,
+    ])
+
+def douglas_peucker(points: List[Point], tolerance_meters: float) -> List[Point]:
+    """Keep the points needed to stay within tolerance_meters of the original track"""
+    if len(points) < 3 or tolerance_meters <= 0:
+        return list(points)
+    xy = local_meters(np.array([(p[0], p[1]) for p in points], dtype=float))
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        segment = xy[last] - xy[first]
+        offsets = xy[first + 1:last] - xy[first]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        index = int(distances.argmax())
+        if distances[index] > tolerance_meters:
+            split = first + 1 + index
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return [p for p, kept in zip(points, keep) if kept]
+
+def track_miles(points: List[Point]) -> float:
+    if len(points) < 2:
+        return 0.0
+    coords = np.radians(np.array([(p[0], p[1]) for p in points], dtype=float))
+    dlat = np.diff(coords[:, 0])
+    dlng = np.diff(coords[:, 1])
+    a = np.sin(dlat / 2) ** 2 + np.cos(coords[:-1, 0]) * np.cos(coords[1:, 0]) * np.sin(dlng / 2) ** 2
+    meters = 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    return float(meters.sum() / 1609.34)
+
+def valid_driver_id(driver_id: str) -> bool:
+    """Whether a driver id can name its directory without leaving BREADCRUMB_DIR"""
+    return bool(driver_id) and driver_id not in (".", "..") and not any(c in driver_id for c in "/\\\0")
+
+class BreadcrumbStore:
+    """Per-driver, per-day compressed point files"""
+
+    def __init__(self, root: Path = BREADCRUMB_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self._checked: Set[Path] = set()
+
+    def _driver_dir(self, driver_id: str) -> Path:
+        if not valid_driver_id(driver_id):
+            raise ValueError(f"Invalid driver id for breadcrumbs: {driver_id!r}")
+        return self.root / driver_id
+
+    def _path(self, driver_id: str, day: str) -> Path:
+        return self._driver_dir(driver_id) / f"{day}.bin"
+
+    def append(self, driver_id: str, points: Iterable[Point]):
+        """Append points to their day files, one chunk per day"""
+        by_day: Dict[str, List[Point]] = {}
+        for point in points:
+            by_day.setdefault(datetime.fromtimestamp(point[2]).strftime("%Y-%m-%d"), []).append(point)
+        with self._lock:
+            for day, day_points in by_day.items():
+                path = self._path(driver_id, day)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                if path not in self._checked:
+                    self._repair_tail(path)
+                    self._checked.add(path)
+                try:
+                    with open(path, "ab") as f:
+                        f.write(encode_chunk(day_points))
+                except OSError:
+                    self._checked.discard(path)
+                    raise
+
+    def _repair_tail(self, path: Path):
+        """
+        Cut off a chunk torn by a crash mid-append, so the next chunk starts on
+        a chunk boundary instead of being swallowed by the torn chunk's length.
+        Only the first append to a file in this process needs to look.
+        """
+        if not path.exists():
+            return
+        data = path.read_bytes()
+        intact = intact_length(data)
+        if intact < len(data):
+            logger.warning(f"Dropping {len(data) - intact} torn bytes from {path}")
+            os.truncate(path, intact)
+
+    def day(self, driver_id: str, day: str) -> List[Point]:
+        path = self._path(driver_id, day)
+        if not path.exists():
+            return []
+        return list(decode_chunks(path.read_bytes()))
+
+    def query(self, driver_id: str, start: datetime, end: datetime) -> List[Point]:
+        """Points with start <= time < end, in time order"""
+        start_ts, end_ts = start.timestamp(), end.timestamp()
+        points: List[Point] = []
+        day = start.date()
+        while day <= end.date():
+            points.extend(p for p in self.day(driver_id, day.isoformat()) if start_ts <= p[2] < end_ts)
+            day += timedelta(days=1)
+        points.sort(key=lambda p: p[2])
+        return points
+
+    def size_bytes(self, driver_id: Optional[str] = None) -> int:
+        root = self._driver_dir(driver_id) if driver_id else self.root
+        if not root.exists():
+            return 0
+        return sum(path.stat().st_size for path in root.rglob("*.bin"))
+
+breadcrumb_store = BreadcrumbStore()
@@ -0,0 +1,279 @@
+"""
+Cached Prophet demand models for production forecasting.
+
+A series is one location's daily production of one product ("total" or a
+pallet type), identified as "<location_id>" or "<location_id>:<product>".
+Fitting Prophet takes seconds, so each series' model is fitted once per
+version of its data and kept in memory and on disk
+(FORECAST_MODEL_DIR/<series>.json, via prophet.serialize.model_to_json).
+The version is a hash of the series' daily totals. A fit also precomputes
+FORECAST_HORIZON_DAYS of predictions, so requests are answered by slicing
+that list.
+
+A new production entry schedules a background refit of its location's
+series; until that finishes the previous model keeps answering, marked stale.
+
+FORECAST_ENGINE chooses between Prophet and the vectorized Holt-Winters
+forecaster (holt_winters.py), which needs no fitted-model cache.
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from datetime import date, datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FORECAST_MODEL_DIR = Path(os.getenv("FORECAST_MODEL_DIR", "./data/forecast_models"))
+FORECAST_HORIZON_DAYS = int(os.getenv("FORECAST_HORIZON_DAYS", "60"))
+MIN_FORECAST_DAYS = 7
+MIN_REORDER_PALLETS = 50
+SERVICE_LEVEL_Z = 1.65  # 95% service level
+# "auto": Holt-Winters for short and medium histories, Prophet once a series has
+# FORECAST_PROPHET_MIN_DAYS days; "holt_winters" or "prophet" force one engine
+FORECAST_ENGINE = os.getenv("FORECAST_ENGINE", "auto")
+FORECAST_PROPHET_MIN_DAYS = int(os.getenv("FORECAST_PROPHET_MIN_DAYS", "180"))
+
+# Forecastable products and the production entry field holding their pallets
+PRODUCT_FIELDS = {
+    "total": "total_pallets",
+    "8lb": "pallets_8lb",
+    "20lb": "pallets_20lb",
+    "block_ice": "pallets_block_ice",
+}
+
+def series_id(location_id: str, product: str = "total") -> str:
+    return location_id if product == "total" else f"{location_id}:{product}"
+
+def split_series(series: str) -> Tuple[str, str]:
+    location_id, _, product = series.partition(":")
+    return location_id, product or "total"
+
+def forecast_engine(history_days: int, policy: str = FORECAST_ENGINE) -> str:
+    """Engine for a series with this many days of history"""
+    from .holt_winters import MIN_HISTORY_DAYS
+
+    if policy == "prophet" or history_days < MIN_HISTORY_DAYS:
+        return "prophet"
+    if policy == "holt_winters" or history_days < FORECAST_PROPHET_MIN_DAYS:
+        return "holt_winters"
+    return "prophet"
+
+def reorder_point(avg_demand: float, std_demand: float, product: str = "total") -> float:
+    """Safety stock reorder point; the 50-pallet floor applies to total production"""
+    point = avg_demand + SERVICE_LEVEL_Z * std_demand
+    return max(point, MIN_REORDER_PALLETS) if product == "total" else point
+
+def entry_day(entry: dict) -> date:
+    value = entry.get("date")
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).date()
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+def daily_totals(entries: List[dict], field: str = "total_pallets") -> Dict[date, float]:
+    totals: Dict[date, float] = {}
+    for entry in entries:
+        day = entry_day(entry)
+        totals[day] = totals.get(day, 0.0) + float(entry.get(field, 0) or 0)
+    return dict(sorted(totals.items()))
+
+def totals_version(totals: Dict[date, float]) -> str:
+    digest = hashlib.sha1()
+    for day, total in totals.items():
+        digest.update(f"{day.isoformat()}={total};".encode())
+    return digest.hexdigest()[:16]
+
+def fit_prophet(totals: Dict[date, float]):
+    import pandas as pd
+    from prophet import Prophet
+
+    df = pd.DataFrame({"ds": pd.to_datetime(list(totals)), "y": list(totals.values())})
+    model = Prophet(
+        daily_seasonality=True,
+        weekly_seasonality=True,
+        yearly_seasonality=False,
+        interval_width=0.8
+    )
+    model.fit(df)
+    return model
+
+def forecast_rows(model, days: int) -> List[Dict]:
+    """The next `days` predictions after the model's history"""
+    future = model.make_future_dataframe(periods=days)
+    forecast = model.predict(future).tail(days)
+    return [
+        {
+            "ds": row.ds.strftime("%Y-%m-%d"),
+            "yhat": max(0.0, float(row.yhat)),
+            "yhat_lower": max(0.0, float(row.yhat_lower)),
+            "yhat_upper": max(0.0, float(row.yhat_upper)),
+        }
+        for row in forecast.itertuples()
+    ]
+
+def fit_series(totals: Dict[date, float], horizon: int = FORECAST_HORIZON_DAYS) -> Dict:
+    """Fit one series and precompute its predictions; plain data, so process pools can return it"""
+    from prophet.serialize import model_to_json
+
+    model = fit_prophet(totals)
+    demand = np.array(list(totals.values()), dtype=float)
+    return {
+        "model": model_to_json(model),
+        "forecast": forecast_rows(model, horizon),
+        "avg_demand": float(demand.mean()),
+        "std_demand": float(demand.std()),
+        "_model": model,
+    }
+
+class FittedForecast:
+    """A location's fitted model, its precomputed predictions and history statistics"""
+
+    def __init__(self, series: str, version: str, fitted_at: str, model_json: str,
+                 forecast: List[Dict], avg_demand: float, std_demand: float):
+        self.series = series
+        self.version = version
+        self.fitted_at = fitted_at
+        self.model_json = model_json
+        self.forecast = forecast
+        self.avg_demand = avg_demand
+        self.std_demand = std_demand
+        self._model = None
+
+    def rows(self, days: int) -> List[Dict]:
+        if days <= len(self.forecast):
+            return self.forecast[:days]
+        if self._model is None:
+            from prophet.serialize import model_from_json
+
+            self._model = model_from_json(self.model_json)
+        return forecast_rows(self._model, days)
+
+    def to_dict(self) -> Dict:
+        return {
+            "series": self.series,
+            "version": self.version,
+            "fitted_at": self.fitted_at,
+            "model": self.model_json,
+            "forecast": self.forecast,
+            "avg_demand": self.avg_demand,
+            "std_demand": self.std_demand,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "FittedForecast":
+        return cls(data["series"], data["version"], data["fitted_at"], data["model"],
+                   data["forecast"], data["avg_demand"], data["std_demand"])
+
+class ForecastModelCache:
+    """Per-series fitted models, refitted in the background when production data changes"""
+
+    def __init__(self, model_dir: Path = FORECAST_MODEL_DIR):
+        self.model_dir = model_dir
+        # Returns the production entries of a location; set by the API
+        self.history_source: Optional[Callable[[str], List[dict]]] = None
+        self.models: Dict[str, FittedForecast] = {}
+        self.versions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._fit_locks: Dict[str, threading.Lock] = {}
+        self._queued: set = set()
+        self._worker: Optional[threading.Thread] = None
+
+    def _path(self, series: str) -> Path:
+        return self.model_dir / f"{series.replace('/', '_').replace(':', '__')}.json"
+
+    def totals(self, series: str) -> Dict[date, float]:
+        location_id, product = split_series(series)
+        entries = self.history_source(location_id) if self.history_source else []
+        return daily_totals(entries, PRODUCT_FIELDS[product])
+
+    def current_version(self, series: str) -> str:
+        version = self.versions.get(series)
+        if version is None:
+            version = self.versions[series] = totals_version(self.totals(series))
+        return version
+
+    def _stored(self, series: str) -> Optional[FittedForecast]:
+        fitted = self.models.get(series)
+        if fitted is None and self._path(series).exists():
+            try:
+                fitted = FittedForecast.from_dict(json.loads(self._path(series).read_text()))
+                self.models[series] = fitted
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable forecast model for {series}: {e}")
+        return fitted
+
+    def get(self, series: str) -> Optional[FittedForecast]:
+        """
+        The series' fitted forecast if there is one, fresh or not. A stale
+        one schedules a refit; use is_fresh() to tell them apart.
+        """
+        fitted = self._stored(series)
+        if fitted is not None and fitted.version != self.current_version(series):
+            self.schedule_refit(series)
+        return fitted
+
+    def is_fresh(self, fitted: FittedForecast) -> bool:
+        return fitted.version == self.current_version(fitted.series)
+
+    def store(self, series: str, version: str, result: Dict) -> FittedForecast:
+        """Keep a fit (made here or by a batch worker) in memory and on disk"""
+        fitted = FittedForecast(series, version, datetime.now().isoformat(), result["model"],
+                                result["forecast"], result["avg_demand"], result["std_demand"])
+        fitted._model = result.get("_model")
+        self.models[series] = fitted
+        try:
+            self.model_dir.mkdir(parents=True, exist_ok=True)
+            self._path(series).write_text(json.dumps(fitted.to_dict()))
+        except OSError as e:
+            logger.warning(f"Could not persist forecast model for {series}: {e}")
+        return fitted
+
+    def refit(self, series: str) -> FittedForecast:
+        """Fit synchronously (one fit per series at a time) and store the result"""
+        with self._lock:
+            fit_lock = self._fit_locks.setdefault(series, threading.Lock())
+        with fit_lock:
+            totals = self.totals(series)
+            version = totals_version(totals)
+            fitted = self.models.get(series)
+            if fitted is not None and fitted.version == version:
+                return fitted
+            fitted = self.store(series, version, fit_series(totals))
+            logger.info(f"Fitted demand model for {series} on {len(totals)} days (version {version})")
+            return fitted
+
+    def invalidate(self, location_id: str, refit: bool = True):
+        """Production data of a location changed; refit the series that have models"""
+        for product in PRODUCT_FIELDS:
+            series = series_id(location_id, product)
+            self.versions.pop(series, None)
+            if refit and (self.models.get(series) is not None or self._path(series).exists()):
+                self.schedule_refit(series)
+
+    def schedule_refit(self, series: str):
+        with self._lock:
+            self._queued.add(series)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._drain, daemon=True)
+                self._worker.start()
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._queued:
+                    self._worker = None
+                    return
+                series = self._queued.pop()
+            try:
+                self.refit(series)
+            except Exception as e:
+                logger.error(f"Background demand model refit for {series} failed: {e}")
+
+forecast_cache = ForecastModelCache()
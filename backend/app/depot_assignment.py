@@ -0,0 +1,80 @@
+"""
+Customer -> branch assignment from coordinates.
+
+Every geocoded customer belongs to the nearest depot (a Voronoi partition of
+the service area), computed for a whole import at once with a vectorized
+haversine over the customers x depots matrix. With mode="drive_time" the
+offline road network's many-to-many search ranks depots by travel time
+instead; customers it cannot snap keep the straight-line answer.
+"""
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_MILES = 3959.0
+ASSIGNMENT_MODES = ("distance", "drive_time")
+
+def haversine_miles(points: np.ndarray, depots: np.ndarray) -> np.ndarray:
+    """Great-circle miles between every point (n, 2) and depot (m, 2), as an (n, m) array"""
+    points = np.radians(points)
+    depots = np.radians(depots)
+    lat = points[:, 0][:, None]
+    depot_lat = depots[:, 0][None, :]
+    a = (np.sin((depot_lat - lat) / 2) ** 2
+         + np.cos(lat) * np.cos(depot_lat) * np.sin((depots[:, 1][None, :] - points[:, 1][:, None]) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def nearest_depots(points: np.ndarray, depots: np.ndarray, mode: str = "distance") -> Tuple[np.ndarray, np.ndarray]:
+    """Index of the closest depot for each point and the cost to it (miles, or seconds for drive_time)"""
+    costs = haversine_miles(points, depots)
+    if mode == "drive_time":
+        from .road_network import road_network
+
+        if road_network.is_available():
+            drive = np.full(costs.shape, np.inf)
+            try:
+                result = road_network.distance_matrix([tuple(p) for p in points], [tuple(d) for d in depots])
+                for (i, j), (_, seconds) in result.items():
+                    drive[i, j] = seconds
+                reachable = np.isfinite(drive).any(axis=1)
+                nearest = np.where(reachable, drive.argmin(axis=1), costs.argmin(axis=1))
+                cost = np.where(reachable, drive[np.arange(len(points)), nearest], costs[np.arange(len(points)), nearest])
+                return nearest, cost
+            except Exception as e:
+                logger.warning(f"Road network depot assignment failed, using straight-line distance: {e}")
+        else:
+            logger.warning("No road network loaded; assigning depots by straight-line distance")
+    nearest = costs.argmin(axis=1)
+    return nearest, costs[np.arange(len(points)), nearest]
+
+def assign_nearest_depots(customers: List[dict], depots: Dict[str, Tuple[float, float]],
+                          mode: str = "distance") -> Dict[str, int]:
+    """
+    Set location_id on every customer that has coordinates to its nearest
+    depot. Customers are updated in place; returns how many were assigned
+    and how many changed branch.
+    """
+    if mode not in ASSIGNMENT_MODES:
+        raise ValueError(f"Unknown depot assignment mode: {mode}")
+    located = [
+        c for c in customers
+        if isinstance(c.get("coordinates"), dict)
+        and c["coordinates"].get("lat") is not None and c["coordinates"].get("lng") is not None
+    ]
+    if not located or not depots:
+        return {"assigned": 0, "changed": 0}
+
+    location_ids = list(depots)
+    points = np.array([[c["coordinates"]["lat"], c["coordinates"]["lng"]] for c in located], dtype=float)
+    nearest, _ = nearest_depots(points, np.array([depots[loc_id] for loc_id in location_ids], dtype=float), mode)
+
+    changed = 0
+    for customer, index in zip(located, nearest.tolist()):
+        location_id = location_ids[index]
+        if customer.get("location_id") != location_id:
+            customer["location_id"] = location_id
+            changed += 1
+    return {"assigned": len(located), "changed": changed}
@@ -0,0 +1,149 @@
+import os
+import math
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .google_maps import google_maps
+
+logger = logging.getLogger(__name__)
+
+METERS_PER_MILE = 1609.34
+AVERAGE_SPEED_MPH = float(os.getenv("ROUTING_AVERAGE_SPEED_MPH", "40"))
+
+Coordinate = Tuple[float, float]
+
+def haversine_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Calculate distance between two points using haversine formula"""
+    R = 3959  # Earth's radius in miles
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lng = math.radians(lng2 - lng1)
+
+    a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lng/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+
+    return R * c
+
+def estimate_travel_seconds(distance_meters: float) -> int:
+    """Estimate driving time for a distance at the configured average speed"""
+    return int(distance_meters / METERS_PER_MILE / AVERAGE_SPEED_MPH * 3600)
+
+class DistanceMatrixCache:
+    """Pairwise driving distance (meters) and duration (seconds) cache keyed by rounded coordinates"""
+
+    def __init__(self, precision: int = 5):
+        self.precision = precision
+        self._entries: Dict[Tuple[Coordinate, Coordinate], Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, coordinate: Coordinate) -> Coordinate:
+        return (round(coordinate[0], self.precision), round(coordinate[1], self.precision))
+
+    def get(self, origin: Coordinate, destination: Coordinate) -> Optional[Tuple[int, int]]:
+        return self._entries.get((self._key(origin), self._key(destination)))
+
+    def put(self, origin: Coordinate, destination: Coordinate, meters: int, seconds: int):
+        with self._lock:
+            self._entries[(self._key(origin), self._key(destination))] = (int(meters), int(seconds))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def build(self, coordinates: List[Coordinate]) -> Tuple[List[List[int]], List[List[int]]]:
+        """
+        Return (distance_matrix, time_matrix) for the coordinates, fetching only
+        uncached pairs: from the local road network if one is loaded, then
+        Google Maps, then straight-line estimates.
+        """
+        size = len(coordinates)
+        keys = [self._key(c) for c in coordinates]
+        entries = self._entries
+        missing = [
+            (i, j) for i in range(size) for j in range(size)
+            if i != j and (keys[i], keys[j]) not in entries
+        ]
+        if missing:
+            self._fill_missing(coordinates, missing)
+
+        distance_matrix = [[0] * size for _ in range(size)]
+        time_matrix = [[0] * size for _ in range(size)]
+        for i in range(size):
+            distance_row = distance_matrix[i]
+            time_row = time_matrix[i]
+            for j in range(size):
+                if i != j:
+                    distance_row[j], time_row[j] = entries[(keys[i], keys[j])]
+        return distance_matrix, time_matrix
+
+    def _fill_missing(self, coordinates: List[Coordinate], missing: List[Tuple[int, int]]):
+        from .road_network import road_network
+
+        elements = {}
+        origin_nodes = sorted({i for i, _ in missing})
+        destination_nodes = sorted({j for _, j in missing})
+        if road_network.is_available():
+            try:
+                result = road_network.distance_matrix(
+                    [coordinates[i] for i in origin_nodes],
+                    [coordinates[j] for j in destination_nodes]
+                )
+                for (row, column), value in result.items():
+                    elements[(origin_nodes[row], destination_nodes[column])] = value
+            except Exception as e:
+                logger.warning(f"Road network matrix failed: {e}")
+
+        if google_maps.is_configured() and any(pair not in elements for pair in missing):
+            origin_nodes = sorted({i for i, j in missing if (i, j) not in elements})
+            destination_nodes = sorted({j for i, j in missing if (i, j) not in elements})
+            try:
+                result = google_maps.distance_matrix(
+                    [coordinates[i] for i in origin_nodes],
+                    [coordinates[j] for j in destination_nodes]
+                )
+                # Merge every returned element into the cache, not just the missing ones
+                for (row, column), element in result.items():
+                    i, j = origin_nodes[row], destination_nodes[column]
+                    elements[(i, j)] = (element['distance']['value'], element['duration']['value'])
+            except Exception as e:
+                logger.warning(f"Distance matrix API failed: {e}")
+
+        for (i, j), (meters, seconds) in elements.items():
+            if i != j:
+                self.put(coordinates[i], coordinates[j], meters, seconds)
+
+        for i, j in missing:
+            if (i, j) not in elements:
+                lat1, lng1 = coordinates[i]
+                lat2, lng2 = coordinates[j]
+                meters = int(haversine_distance(lat1, lng1, lat2, lng2) * METERS_PER_MILE)
+                self.put(coordinates[i], coordinates[j], meters, estimate_travel_seconds(meters))
+
+distance_matrix_cache = DistanceMatrixCache()
+
+def haversine_matrices(coordinates: List[Coordinate]) -> Tuple[List[List[int]], List[List[int]]]:
+    """Vectorized straight-line distance (meters) and travel time (seconds) matrices, no network"""
+    import numpy as np
+
+    points = np.radians(np.asarray(coordinates, dtype=float).reshape(-1, 2))
+    lat = points[:, 0][:, None]
+    lng = points[:, 1][:, None]
+    a = (np.sin((lat.T - lat) / 2) ** 2
+         + np.cos(lat) * np.cos(lat.T) * np.sin((lng.T - lng) / 2) ** 2)
+    miles = 2 * 3959 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    meters = (miles * METERS_PER_MILE).astype(np.int64)
+    seconds = (miles / AVERAGE_SPEED_MPH * 3600).astype(np.int64)
+    return meters.tolist(), seconds.tolist()
+
+def build_matrices(coordinates: List[Coordinate]) -> Tuple[List[List[int]], List[List[int]]]:
+    """Distance (meters) and travel time (seconds) matrices drawn from the shared cache"""
+    return distance_matrix_cache.build(coordinates)
+
+def create_distance_matrix(coordinates: List[Coordinate]) -> List[List[int]]:
+    """Create distance matrix using Google Maps API or haversine fallback"""
+    return build_matrices(coordinates)[0]
@@ -0,0 +1,160 @@
+"""
+Driver-to-route assignment.
+
+Routes of one day are matched to drivers with the Hungarian algorithm
+(scipy's linear_sum_assignment) on a cost matrix of routes x drivers.
+A driver is eligible for a route only if they are based at the route's
+branch, are licensed for its vehicle type, are not driving another route
+at that time and the route fits inside their shift. Among eligible pairs
+the cost is the driver's resulting weekly hours squared, so long routes go
+to the drivers with the fewest hours and total hours even out. Matching
+repeats for routes left over, so a driver can run several short routes a
+day.
+"""
+import logging
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .route_optimizer import parse_time_of_day, ROUTE_DAY_START, ROUTE_DAY_END
+
+logger = logging.getLogger(__name__)
+
+INELIGIBLE_COST = 1e12
+# Leaving a route without a driver costs more than any balancing difference,
+# so as many routes (and hours) as possible are covered before hours are evened out
+UNASSIGNED_COST = 1e9
+# Added to the cost of drivers from another branch when cross-branch assignment is allowed
+CROSS_BRANCH_PENALTY_HOURS = 8.0
+
+def route_hours(route: dict) -> float:
+    return float(route.get("estimated_duration_hours") or 0)
+
+def route_day(route: dict) -> str:
+    return str(route.get("date") or date.today())
+
+def route_interval(route: dict) -> Tuple[int, int]:
+    start = route_start_seconds(route)
+    return start, start + int(route_hours(route) * 3600)
+
+def route_start_seconds(route: dict) -> int:
+    """Time of day the route leaves, estimated from its first stop arrival"""
+    arrivals = []
+    for stop in route.get("stops", []):
+        try:
+            arrivals.append(datetime.fromisoformat(stop["estimated_arrival"]))
+        except (KeyError, TypeError, ValueError):
+            continue
+    if not arrivals:
+        return parse_time_of_day(ROUTE_DAY_START)
+    first = min(arrivals)
+    return first.hour * 3600 + first.minute * 60
+
+def week_of(day: str) -> Tuple[int, int]:
+    try:
+        return tuple(date.fromisoformat(day[:10]).isocalendar())[:2]
+    except ValueError:
+        return tuple(date.today().isocalendar())[:2]
+
+# Checks run in this order; for a route nobody can take, the reason from the
+# driver who passed the most checks is reported
+INELIGIBILITY_REASONS = [
+    "no driver based at the route's location",
+    "no driver licensed for the vehicle",
+    "all eligible drivers are on another route at that time",
+    "route does not fit any driver's shift",
+]
+
+def ineligibility(route: dict, driver: dict, vehicle: Optional[dict], booked: List[Tuple[int, int]],
+                  allow_cross_branch: bool = False) -> Optional[str]:
+    """Why a driver cannot take a route, or None if they can"""
+    if not allow_cross_branch and driver.get("location_id") != route.get("location_id"):
+        return INELIGIBILITY_REASONS[0]
+    licensed = driver.get("licensed_vehicle_types")
+    vehicle_type = (vehicle or {}).get("vehicle_type")
+    vehicle_type = getattr(vehicle_type, "value", vehicle_type)
+    if licensed is not None and vehicle_type and vehicle_type not in [getattr(t, "value", t) for t in licensed]:
+        return INELIGIBILITY_REASONS[1]
+    start, end = route_interval(route)
+    if any(start < booked_end and booked_start < end for booked_start, booked_end in booked):
+        return INELIGIBILITY_REASONS[2]
+    shift_start = parse_time_of_day(driver.get("shift_start") or ROUTE_DAY_START)
+    shift_end = parse_time_of_day(driver.get("shift_end") or ROUTE_DAY_END)
+    if start < shift_start or end > shift_end:
+        return INELIGIBILITY_REASONS[3]
+    return None
+
+def assign_drivers(routes: List[dict], drivers: List[dict], vehicles: Dict[str, dict],
+                   booked_routes: List[dict], allow_cross_branch: bool = False) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Match routes to drivers without overlapping any driver's routes.
+
+    booked_routes are routes that already have a driver; they count towards
+    weekly hours and block that driver's time. Returns {route_id: driver_id}
+    and, for routes left without a driver, {route_id: reason}.
+    """
+    weekly_hours: Dict[Tuple[str, Tuple[int, int]], float] = {}
+    busy: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}
+
+    def book(driver_id: str, route: dict):
+        busy.setdefault((driver_id, route_day(route)), []).append(route_interval(route))
+        key = (driver_id, week_of(route_day(route)))
+        weekly_hours[key] = weekly_hours.get(key, 0.0) + route_hours(route)
+
+    driver_ids = {driver["id"] for driver in drivers}
+    for booked in booked_routes:
+        if booked.get("driver_id") in driver_ids:
+            book(booked["driver_id"], booked)
+
+    assignments: Dict[str, str] = {}
+    unassigned: Dict[str, str] = {}
+    by_day: Dict[str, List[dict]] = {}
+    for route in routes:
+        by_day.setdefault(route_day(route), []).append(route)
+
+    from scipy.optimize import linear_sum_assignment
+
+    for day in sorted(by_day):
+        pending = by_day[day]
+        if not drivers:
+            unassigned.update({route["id"]: "no active drivers" for route in pending})
+            continue
+        week = week_of(day)
+        # Each round gives every driver at most one more route; stop when a round matches nothing
+        while pending:
+            costs = np.full((len(pending), len(drivers)), INELIGIBLE_COST)
+            reasons: Dict[str, str] = {}
+            for i, route in enumerate(pending):
+                vehicle = vehicles.get(route.get("vehicle_id"))
+                for j, driver in enumerate(drivers):
+                    reason = ineligibility(route, driver, vehicle, busy.get((driver["id"], day), []), allow_cross_branch)
+                    if reason:
+                        previous = reasons.get(route["id"])
+                        if previous is None or INELIGIBILITY_REASONS.index(reason) > INELIGIBILITY_REASONS.index(previous):
+                            reasons[route["id"]] = reason
+                        continue
+                    hours = weekly_hours.get((driver["id"], week), 0.0) + route_hours(route)
+                    if driver.get("location_id") != route.get("location_id"):
+                        hours += CROSS_BRANCH_PENALTY_HOURS
+                    costs[i, j] = hours * hours
+
+            # One "no driver" column per route lets every row be matched; short routes are dropped first
+            unassigned_costs = np.array([UNASSIGNED_COST * (1 + route_hours(route)) for route in pending])
+            padded = np.hstack([costs, np.repeat(unassigned_costs[:, None], len(pending), axis=1)])
+            rows, columns = linear_sum_assignment(padded)
+            matched = set()
+            for i, j in zip(rows, columns):
+                if j >= len(drivers) or costs[i, j] >= INELIGIBLE_COST:
+                    continue
+                assignments[pending[i]["id"]] = drivers[j]["id"]
+                book(drivers[j]["id"], pending[i])
+                matched.add(pending[i]["id"])
+            if not matched:
+                for route in pending:
+                    unassigned[route["id"]] = reasons[route["id"]]
+                break
+            pending = [route for route in pending if route["id"] not in matched]
+
+    logger.info(f"Assigned drivers to {len(assignments)} of {len(routes)} routes")
+    return assignments, unassigned
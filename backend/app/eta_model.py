@@ -0,0 +1,273 @@
+"""
+Local ETA model learned from our own GPS history.
+
+Training mines the breadcrumb store for driving legs - the stretches between
+two stationary periods of a track - and records each leg's straight-line
+miles, duration and hour of the week it started. Legs are grouped by road
+class and hour of week (7 x 24) and each cell's speed is the median pace of
+its legs, shrunk towards the class average when the cell has few samples.
+The road graph does not keep OSM highway tags, so the class is taken from
+leg length: short hops are town driving, long legs are highway driving, and
+straight-line speeds fold in each class's typical detour.
+
+Service times per customer are the median observed dwell (from geofence
+departures) once a customer has MIN_SERVICE_VISITS visits.
+
+Prediction for all remaining stops of a route is a few NumPy vector
+operations: leg miles, class lookup, speed lookup by the hour each leg
+starts (refined in a second pass) and a cumulative sum.
+
+    python -m app.eta_model train --days 90
+"""
+import os
+import json
+import logging
+import argparse
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .breadcrumb_store import breadcrumb_store, BreadcrumbStore, EARTH_RADIUS_METERS
+from .distance_matrix import haversine_distance, AVERAGE_SPEED_MPH, METERS_PER_MILE
+from .route_optimizer import DEFAULT_SERVICE_MINUTES
+
+logger = logging.getLogger(__name__)
+
+ETA_MODEL_FILE = os.getenv("ETA_MODEL_FILE", "./data/eta_model.npz")
+ETA_SOURCE = os.getenv("ETA_SOURCE", "local")  # "local" or "google"
+
+ROAD_CLASSES = ("local", "arterial", "highway")
+ROAD_CLASS_BOUNDS_MILES = np.array([2.0, 10.0])
+HOURS_PER_WEEK = 168
+# A cell with this many legs gets half its own speed and half the class average
+SHRINKAGE_LEGS = 5
+MIN_SERVICE_VISITS = 3
+
+STAY_RADIUS_METERS = 100.0
+STAY_MIN_SECONDS = 120
+MIN_LEG_MILES = 0.2
+MAX_LEG_MPH = 80.0
+
+Leg = Tuple[float, float, int]  # straight-line miles, seconds, hour of week at start
+
+def hour_of_week(when: datetime) -> int:
+    return when.weekday() * 24 + when.hour
+
+def road_class(miles: np.ndarray) -> np.ndarray:
+    return np.searchsorted(ROAD_CLASS_BOUNDS_MILES, miles, side="right")
+
+def leg_miles(points: np.ndarray) -> np.ndarray:
+    """Great-circle miles between consecutive (lat, lng) rows"""
+    coords = np.radians(points)
+    dlat = np.diff(coords[:, 0])
+    dlng = np.diff(coords[:, 1])
+    a = np.sin(dlat / 2) ** 2 + np.cos(coords[:-1, 0]) * np.cos(coords[1:, 0]) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0, 1))) / METERS_PER_MILE
+
+def extract_legs(points: Sequence[Tuple[float, float, int]]) -> List[Leg]:
+    """Driving legs between stationary periods of one time-ordered track"""
+    if len(points) < 3:
+        return []
+    track = np.array(points, dtype=float)
+    stays: List[Tuple[int, int]] = []  # (first, last) point index of each stationary period
+    anchor = 0
+    for i in range(1, len(track) + 1):
+        moved = i == len(track) or (
+            haversine_distance(points[anchor][0], points[anchor][1], points[i][0], points[i][1]) * METERS_PER_MILE
+            > STAY_RADIUS_METERS
+        )
+        if moved:
+            if track[i - 1, 2] - track[anchor, 2] >= STAY_MIN_SECONDS:
+                stays.append((anchor, i - 1))
+            anchor = i
+    legs = []
+    for (_, leave), (arrive, _) in zip(stays, stays[1:]):
+        miles = float(leg_miles(track[[leave, arrive], :2])[0])
+        seconds = float(track[arrive, 2] - track[leave, 2])
+        if miles < MIN_LEG_MILES or seconds <= 0 or miles / seconds * 3600 > MAX_LEG_MPH:
+            continue
+        legs.append((miles, seconds, hour_of_week(datetime.fromtimestamp(track[leave, 2]))))
+    return legs
+
+class EtaModel:
+    """Speed profiles by road class and hour of week plus per-customer service times"""
+
+    def __init__(self, speeds_mph: Optional[np.ndarray] = None, samples: Optional[np.ndarray] = None,
+                 service_minutes: Optional[Dict[str, float]] = None, trained_at: Optional[str] = None):
+        self.speeds_mph = speeds_mph if speeds_mph is not None else np.full((len(ROAD_CLASSES), HOURS_PER_WEEK), AVERAGE_SPEED_MPH)
+        self.samples = samples if samples is not None else np.zeros((len(ROAD_CLASSES), HOURS_PER_WEEK), dtype=np.int64)
+        self.service_minutes = service_minutes or {}
+        self.trained_at = trained_at
+        # Seconds per straight-line mile, the form prediction needs
+        self._pace = 3600.0 / self.speeds_mph
+
+    @classmethod
+    def fit(cls, legs: List[Leg], dwell_minutes: Dict[str, List[float]]) -> "EtaModel":
+        speeds = np.full((len(ROAD_CLASSES), HOURS_PER_WEEK), AVERAGE_SPEED_MPH)
+        samples = np.zeros((len(ROAD_CLASSES), HOURS_PER_WEEK), dtype=np.int64)
+        if legs:
+            data = np.array(legs, dtype=float)
+            classes = road_class(data[:, 0])
+            hours = data[:, 2].astype(int)
+            pace = data[:, 1] / data[:, 0]
+            for k in range(len(ROAD_CLASSES)):
+                in_class = classes == k
+                if not in_class.any():
+                    continue
+                class_pace = float(np.median(pace[in_class]))
+                for hour in np.unique(hours[in_class]):
+                    cell = pace[in_class & (hours == hour)]
+                    samples[k, hour] = len(cell)
+                    weight = len(cell) / (len(cell) + SHRINKAGE_LEGS)
+                    speeds[k, hour] = 3600.0 / (weight * float(np.median(cell)) + (1 - weight) * class_pace)
+                unseen = samples[k] == 0
+                speeds[k, unseen] = 3600.0 / class_pace
+        service = {
+            customer_id: float(np.median(minutes))
+            for customer_id, minutes in dwell_minutes.items() if len(minutes) >= MIN_SERVICE_VISITS
+        }
+        return cls(speeds, samples, service, datetime.now().isoformat())
+
+    def service_seconds(self, customer_ids: Sequence[Optional[str]], explicit_minutes: Sequence[Optional[float]]) -> np.ndarray:
+        """Configured service time if set, else learned, else the default"""
+        return np.array([
+            float(explicit) * 60 if explicit is not None
+            else self.service_minutes.get(customer_id, DEFAULT_SERVICE_MINUTES) * 60
+            for customer_id, explicit in zip(customer_ids, explicit_minutes)
+        ])
+
+    def predict(self, origin: Tuple[float, float], stops: np.ndarray, service_seconds: np.ndarray,
+                start: datetime, initial_wait_seconds: float = 0.0) -> np.ndarray:
+        """Seconds from start until arrival at each stop, visited in order from origin"""
+        if len(stops) == 0:
+            return np.zeros(0)
+        points = np.vstack([np.asarray(origin, dtype=float)[None, :], stops])
+        miles = leg_miles(points)
+        classes = road_class(miles)
+        first_hour = hour_of_week(start)
+        # Seconds elapsed before each leg starts: service at the previous stops plus driving so far
+        waits = np.concatenate([[initial_wait_seconds], service_seconds[:-1]])
+        travel = miles * self._pace[classes, first_hour]
+        for _ in range(2):
+            departures = np.cumsum(waits) + np.concatenate([[0.0], np.cumsum(travel)[:-1]])
+            hours = (first_hour + (start.minute * 60 + departures) // 3600).astype(int) % HOURS_PER_WEEK
+            travel = miles * self._pace[classes, hours]
+        return np.cumsum(waits) + np.cumsum(travel)
+
+    def save(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path, speeds_mph=self.speeds_mph, samples=self.samples,
+            meta=np.array(json.dumps({"service_minutes": self.service_minutes, "trained_at": self.trained_at}))
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "EtaModel":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(data["speeds_mph"], data["samples"], meta["service_minutes"], meta["trained_at"])
+
+    def summary(self) -> Dict:
+        return {
+            "trained_at": self.trained_at,
+            "legs": int(self.samples.sum()),
+            "customers_with_service_times": len(self.service_minutes),
+            "mean_speed_mph": {
+                name: round(float(np.average(self.speeds_mph[k], weights=self.samples[k] if self.samples[k].any() else None)), 1)
+                for k, name in enumerate(ROAD_CLASSES)
+            },
+        }
+
+def collect_legs(store: BreadcrumbStore, start: datetime, end: datetime) -> List[Leg]:
+    """Legs from every driver's breadcrumbs between start and end"""
+    legs: List[Leg] = []
+    if not store.root.exists():
+        return legs
+    for driver_dir in sorted(p for p in store.root.iterdir() if p.is_dir()):
+        day = start.date()
+        while day <= end.date():
+            points = store.day(driver_dir.name, day.isoformat())
+            if points:
+                points.sort(key=lambda p: p[2])
+                legs.extend(extract_legs(points))
+            day += timedelta(days=1)
+    return legs
+
+def dwell_history(routes: Sequence[dict]) -> Dict[str, List[float]]:
+    """Observed dwell minutes per customer from completed route stops"""
+    history: Dict[str, List[float]] = {}
+    for route in routes:
+        for stop in route.get("stops", []):
+            if stop.get("dwell_minutes") is not None and stop.get("customer_id"):
+                history.setdefault(stop["customer_id"], []).append(float(stop["dwell_minutes"]))
+    return history
+
+def train_model(days: int = 90, dwell_minutes: Optional[Dict[str, List[float]]] = None,
+                store: BreadcrumbStore = breadcrumb_store) -> EtaModel:
+    end = datetime.now()
+    legs = collect_legs(store, end - timedelta(days=days), end)
+    model = EtaModel.fit(legs, dwell_minutes or {})
+    logger.info(f"Trained ETA model on {len(legs)} legs and {len(model.service_minutes)} customer service times")
+    return model
+
+class EtaModelHolder:
+    """Loads the trained model once; falls back to flat average speeds when none exists"""
+
+    def __init__(self, path: str = ETA_MODEL_FILE):
+        self.path = path
+        self._model: Optional[EtaModel] = None
+        self._lock = threading.Lock()
+
+    def model(self) -> EtaModel:
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    model = EtaModel()
+                    if self.path and os.path.exists(self.path):
+                        try:
+                            model = EtaModel.load(self.path)
+                        except Exception as e:
+                            logger.error(f"Could not load ETA model {self.path}: {e}")
+                    self._model = model
+        return self._model
+
+    def replace(self, model: EtaModel):
+        model.save(self.path)
+        self._model = model
+
+eta_model = EtaModelHolder()
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local ETA model from breadcrumb history")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train = subparsers.add_parser("train")
+    train.add_argument("--days", type=int, default=90)
+    train.add_argument("--output", default=ETA_MODEL_FILE)
+    train.add_argument("--data", default="data/arctic_ice_data.json", help="Saved app data with completed route stops")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    end = datetime.now()
+    legs = collect_legs(breadcrumb_store, end - timedelta(days=args.days), end)
+    # Hold out every fifth leg to report accuracy against the flat average-speed estimate
+    held_out = legs[4::5]
+    model = EtaModel.fit([leg for i, leg in enumerate(legs) if i % 5 != 4], {})
+    if held_out:
+        data = np.array(held_out, dtype=float)
+        predicted = data[:, 0] * model._pace[road_class(data[:, 0]), data[:, 2].astype(int)]
+        flat = data[:, 0] / AVERAGE_SPEED_MPH * 3600
+        print(f"Held-out legs: {len(held_out)}  MAE model {np.abs(predicted - data[:, 1]).mean() / 60:.1f} min"
+              f"  flat {np.abs(flat - data[:, 1]).mean() / 60:.1f} min")
+    routes = []
+    if os.path.exists(args.data):
+        with open(args.data) as f:
+            routes = list((json.load(f).get("routes") or {}).values())
+    model = EtaModel.fit(legs, dwell_history(routes))
+    model.save(args.output)
+    print(json.dumps(model.summary(), indent=2))
+
+if __name__ == "__main__":
+    main()
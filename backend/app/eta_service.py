@@ -0,0 +1,140 @@
+"""
+Coalesced, throttled ETA recomputation.
+
+Pings only record the route's newest driver position; older unprocessed
+positions are overwritten, so a burst of pings costs one recomputation.
+A background worker recomputes a route's ETAs (a Google Distance Matrix
+call) when its last computation is older than ETA_MIN_INTERVAL_SECONDS,
+when the driver has deviated - moved more than ETA_DEVIATION_METERS
+further from the next stop than when ETAs were last computed - or when
+the route was invalidated because its stops changed.
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from .distance_matrix import haversine_distance, METERS_PER_MILE
+
+logger = logging.getLogger(__name__)
+
+ETA_MIN_INTERVAL_SECONDS = float(os.getenv("ETA_MIN_INTERVAL_SECONDS", "120"))
+ETA_DEVIATION_METERS = float(os.getenv("ETA_DEVIATION_METERS", "800"))
+ETA_WORKER_TICK_SECONDS = float(os.getenv("ETA_WORKER_TICK_SECONDS", "1"))
+
+# compute(route_id, position) refreshes the route's ETAs and returns the
+# (lat, lng) of its next pending stop, or None when there is none
+EtaCompute = Callable[[str, Dict], Optional[Tuple[float, float]]]
+
+def meters_between(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    return haversine_distance(a[0], a[1], b[0], b[1]) * METERS_PER_MILE
+
+class RouteEtaState:
+    __slots__ = ("computed_at", "position", "target", "stale")
+
+    def __init__(self):
+        self.computed_at = 0.0
+        self.position: Optional[Tuple[float, float]] = None
+        self.target: Optional[Tuple[float, float]] = None
+        self.stale = True
+
+class EtaService:
+    """Background worker that recomputes route ETAs at most once per interval"""
+
+    def __init__(self, min_interval: float = ETA_MIN_INTERVAL_SECONDS, deviation_meters: float = ETA_DEVIATION_METERS):
+        self.min_interval = min_interval
+        self.deviation_meters = deviation_meters
+        self.compute: Optional[EtaCompute] = None
+        self.listeners: List[Callable[[str], None]] = []
+        self.routes: Dict[str, RouteEtaState] = {}
+        self._pending: Dict[str, Dict] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.submitted = 0
+        self.computed = 0
+
+    def submit(self, route_id: str, position: Dict):
+        """Record the newest position of a route's driver; O(1), never blocks"""
+        self._pending[route_id] = position
+        self.submitted += 1
+        self._ensure_started()
+        if route_id not in self.routes or self.routes[route_id].stale:
+            self._wake.set()
+
+    def add_listener(self, listener: Callable[[str], None]):
+        """Call listener(route_id) on the event loop after a route's ETAs were recomputed"""
+        self.listeners.append(listener)
+
+    def invalidate(self, route_id: str):
+        """Stops changed; recompute on the next position without waiting for the interval"""
+        state = self.routes.get(route_id)
+        if state is not None:
+            state.stale = True
+            if route_id in self._pending and self._wake is not None:
+                self._wake.set()
+
+    def is_due(self, route_id: str, position: Dict, now: float) -> bool:
+        state = self.routes.get(route_id)
+        if state is None or state.stale or now - state.computed_at >= self.min_interval:
+            return True
+        if state.target is None or state.position is None:
+            return False
+        point = (position["lat"], position["lng"])
+        return meters_between(point, state.target) - meters_between(state.position, state.target) > self.deviation_meters
+
+    def _ensure_started(self):
+        if self._task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=ETA_WORKER_TICK_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            now = time.time()
+            due = [route_id for route_id, position in self._pending.items() if self.is_due(route_id, position, now)]
+            for route_id in due:
+                position = self._pending.pop(route_id)
+                await self._recompute(route_id, position)
+
+    async def _recompute(self, route_id: str, position: Dict):
+        state = self.routes.setdefault(route_id, RouteEtaState())
+        state.stale = False
+        state.computed_at = time.time()
+        state.position = (position["lat"], position["lng"])
+        if self.compute is None:
+            return
+        try:
+            state.target = await run_in_threadpool(self.compute, route_id, position)
+            self.computed += 1
+        except Exception as e:
+            logger.warning(f"ETA recomputation for route {route_id} failed: {e}")
+            return
+        for listener in self.listeners:
+            try:
+                listener(route_id)
+            except Exception as e:
+                logger.warning(f"ETA listener failed for route {route_id}: {e}")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "routes": len(self.routes),
+            "waiting": len(self._pending),
+            "submitted": self.submitted,
+            "computed": self.computed,
+        }
+
+eta_service = EtaService()
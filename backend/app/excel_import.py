@@ -1,14 +1,20 @@
-import pandas as pd
+from __future__ import annotations
+
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import TYPE_CHECKING, List, Dict, Any
 import logging
 import re
 from fastapi import UploadFile
 
+if TYPE_CHECKING:
+    import pandas as pd  # imported by the functions that read spreadsheets
+
 logger = logging.getLogger(__name__)
 
 def clean_excel_data(df: pd.DataFrame) -> pd.DataFrame:
     """Clean and standardize Excel data"""
+    import pandas as pd
+
     required_cols = ['Type', 'Date', 'Name', 'Amount']
     missing_cols = [col for col in required_cols if col not in df.columns]
     if missing_cols:
@@ -36,6 +42,8 @@ def clean_excel_data(df: pd.DataFrame) -> pd.DataFrame:
 
 def extract_timesheet_sales_data(df: pd.DataFrame, date_from_filename: str = None) -> pd.DataFrame:
     """Extract sales data from timesheet format and convert to standard format"""
+    import pandas as pd
+
     sales_data = []
 
     for i, row in df.iterrows():
@@ -81,6 +89,8 @@ def extract_timesheet_sales_data(df: pd.DataFrame, date_from_filename: str = Non
 
 def extract_customers_from_excel(df: pd.DataFrame, location_id: str = "loc_3", location_name: str = "Lufkin") -> List[Dict[str, Any]]:
     """Extract unique customers from Excel data with proper location mapping"""
+    import pandas as pd
+
     customers = []
     unique_customers = df['Name'].unique()
 
@@ -157,6 +167,8 @@ def extract_customers_from_excel(df: pd.DataFrame, location_id: str = "loc_3", l
 
 def extract_orders_from_excel(df: pd.DataFrame, location_id: str = "loc_3", location_name: str = "Lufkin") -> List[Dict[str, Any]]:
     """Extract orders from Excel data"""
+    import pandas as pd
+
     orders = []
 
     location_config = {
@@ -239,6 +251,8 @@ def calculate_financial_metrics(df: pd.DataFrame) -> Dict[str, Any]:
 
 def extract_customers_from_customer_list(df: pd.DataFrame, location_id: str = "loc_3", location_name: str = "Lufkin") -> List[Dict[str, Any]]:
     """Extract customers from customer list format (Customer, Address, Main Phone)"""
+    import pandas as pd
+
     customers = []
 
     location_config = {
@@ -327,6 +341,8 @@ def extract_customers_from_customer_list(df: pd.DataFrame, location_id: str = "l
 
 def process_customer_excel_files(file_paths: List[str], location_id: str = "loc_3", location_name: str = "Lufkin") -> Dict[str, Any]:
     """Process customer list Excel files and return customer data"""
+    import pandas as pd
+
     all_customers = []
 
     location_sheet_map = {
@@ -420,6 +436,8 @@ def process_customer_excel_files(file_paths: List[str], location_id: str = "loc_
 
 def extract_customers_from_order_sheet(df: pd.DataFrame, location_id: str, location_name: str) -> List[Dict[str, Any]]:
     """Extract customers from order sheet format"""
+    import pandas as pd
+
     customers = []
     unique_customers = {}
     
@@ -467,6 +485,8 @@ def extract_customers_from_order_sheet(df: pd.DataFrame, location_id: str, locat
 
 def extract_orders_from_order_sheet(df: pd.DataFrame, location_id: str, location_name: str) -> List[Dict[str, Any]]:
     """Extract orders from order sheet format"""
+    import pandas as pd
+
     orders = []
     
     for i, row in df.iterrows():
@@ -500,6 +520,8 @@ def extract_orders_from_order_sheet(df: pd.DataFrame, location_id: str, location
 
 def process_order_sheet_files(file_paths: List[str], location_id: str = "loc_3", location_name: str = "Lufkin") -> Dict[str, Any]:
     """Process order sheet Excel files and return customer and order data"""
+    import pandas as pd
+
     all_customers = []
     all_orders = []
     
@@ -555,6 +577,8 @@ def process_order_sheet_files(file_paths: List[str], location_id: str = "loc_3",
 
 def process_route_excel_files(files: List[UploadFile], location_id: str) -> dict:
     """Process route Excel files and create route data"""
+    import pandas as pd
+
     import uuid
     from datetime import datetime, date
     
@@ -640,6 +664,8 @@ def process_route_excel_files(files: List[UploadFile], location_id: str) -> dict
 
 def process_excel_files(file_paths: List[str], location_id: str = "loc_3", location_name: str = "Lufkin") -> Dict[str, Any]:
     """Process multiple Excel files and return consolidated data"""
+    import pandas as pd
+
     all_data = []
 
     for file_path in file_paths:
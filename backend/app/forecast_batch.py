@@ -0,0 +1,164 @@
+"""
+Nightly batch forecasting of every location x product series.
+
+Once a night (FORECAST_BATCH_HOUR, local time) the batch groups production
+entries into series, skips those with too little history or whose data has
+not changed since their stored forecast, and fits the rest in a pool of
+spawned worker processes - Prophet fits are CPU-bound, so threads would not
+overlap them. Series the engine policy gives to Holt-Winters are fitted
+together in one vectorized call in this process instead. Results are stored
+as forecast rows (with reorder points) and in the model cache, so the API
+answers from the table and only fits on demand for series the batch has not
+covered.
+"""
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .demand_forecast import (
+    forecast_cache, fit_series, daily_totals, totals_version, reorder_point, series_id, forecast_engine,
+    PRODUCT_FIELDS, MIN_FORECAST_DAYS, FORECAST_HORIZON_DAYS, SERVICE_LEVEL_Z
+)
+from .holt_winters import forecast_series
+
+logger = logging.getLogger(__name__)
+
+FORECAST_BATCH_WORKERS = int(os.getenv("FORECAST_BATCH_WORKERS", str(min(4, os.cpu_count() or 1))))
+FORECAST_BATCH_HOUR = int(os.getenv("FORECAST_BATCH_HOUR", "2"))
+FORECAST_BATCH_ENABLED = os.getenv("FORECAST_BATCH_ENABLED", "true").lower() == "true"
+
+def _fit_worker(series: str, totals: List[Tuple[str, float]], horizon: int) -> Dict:
+    """Worker: fit one series; the fitted Prophet object stays in the worker"""
+    result = fit_series({date.fromisoformat(day): value for day, value in totals}, horizon)
+    result.pop("_model", None)
+    return result
+
+def forecast_row(series: str, location_id: str, product: str, version: str, result: Dict,
+                 method: str = "prophet") -> Dict:
+    avg_demand, std_demand = result["avg_demand"], result["std_demand"]
+    return {
+        "id": series,
+        "location_id": location_id,
+        "product": product,
+        "version": version,
+        "generated_at": datetime.now().isoformat(),
+        "method": method,
+        "forecast": result["forecast"],
+        "reorder_point": round(reorder_point(avg_demand, std_demand, product), 0),
+        "safety_stock": round(SERVICE_LEVEL_Z * std_demand, 1),
+        "historical_avg": round(avg_demand, 1),
+    }
+
+class ForecastBatch:
+    """Runs the batch in a background thread, nightly or on request"""
+
+    def __init__(self, workers: int = FORECAST_BATCH_WORKERS):
+        self.workers = max(1, workers)
+        # Set by the API: all production entries, the stored rows, and where new rows go
+        self.entries_source: Optional[Callable[[], List[dict]]] = None
+        self.rows_source: Optional[Callable[[], Dict[str, Dict]]] = None
+        self.on_complete: Optional[Callable[[List[Dict]], None]] = None
+        self.running = False
+        self.last_run: Optional[Dict] = None
+        self._lock = threading.Lock()
+        self._scheduler: Optional[threading.Thread] = None
+
+    def pending_series(self, force: bool = False) -> List[Tuple[str, str, str, Dict[date, float], str]]:
+        """(series, location, product, totals, version) for every series that needs a fit"""
+        by_location: Dict[str, List[dict]] = {}
+        for entry in self.entries_source() if self.entries_source else []:
+            by_location.setdefault(entry.get("location_id", "loc_1"), []).append(entry)
+        stored = self.rows_source() if self.rows_source else {}
+        pending = []
+        for location_id, entries in sorted(by_location.items()):
+            for product, field in PRODUCT_FIELDS.items():
+                totals = daily_totals(entries, field)
+                if len(totals) < MIN_FORECAST_DAYS or not any(totals.values()):
+                    continue
+                series = series_id(location_id, product)
+                version = totals_version(totals)
+                if not force and (stored.get(series) or {}).get("version") == version:
+                    continue
+                pending.append((series, location_id, product, totals, version))
+        return pending
+
+    def run(self, force: bool = False) -> Dict:
+        """Fit all changed series in parallel and hand the rows to on_complete"""
+        with self._lock:
+            if self.running:
+                return {"status": "already_running"}
+            self.running = True
+        started = time.perf_counter()
+        rows, failed = [], []
+        try:
+            pending = self.pending_series(force)
+            smoothed = [p for p in pending if forecast_engine(len(p[3])) == "holt_winters"]
+            pending = [p for p in pending if forecast_engine(len(p[3])) == "prophet"]
+            if smoothed:
+                results = forecast_series([totals for _, _, _, totals, _ in smoothed], FORECAST_HORIZON_DAYS)
+                for (series, location_id, product, _, version), result in zip(smoothed, results):
+                    rows.append(forecast_row(series, location_id, product, version, result, "holt_winters"))
+            if pending:
+                # Spawned workers do not inherit the API's threads or in-memory data
+                with ProcessPoolExecutor(max_workers=min(self.workers, len(pending)),
+                                         mp_context=multiprocessing.get_context("spawn")) as pool:
+                    futures = {
+                        pool.submit(_fit_worker, series, [(d.isoformat(), v) for d, v in totals.items()],
+                                    FORECAST_HORIZON_DAYS): (series, location_id, product, version)
+                        for series, location_id, product, totals, version in pending
+                    }
+                    for future in as_completed(futures):
+                        series, location_id, product, version = futures[future]
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            logger.error(f"Batch forecast for {series} failed: {e}")
+                            failed.append(series)
+                            continue
+                        forecast_cache.store(series, version, result)
+                        rows.append(forecast_row(series, location_id, product, version, result))
+            if rows and self.on_complete:
+                self.on_complete(rows)
+        finally:
+            self.last_run = {
+                "finished_at": datetime.now().isoformat(),
+                "seconds": round(time.perf_counter() - started, 1),
+                "fitted": len(rows),
+                "failed": failed,
+            }
+            self.running = False
+        logger.info(f"Forecast batch fitted {len(rows)} series ({len(failed)} failed) in {self.last_run['seconds']}s")
+        return self.last_run
+
+    def run_in_background(self, force: bool = False) -> bool:
+        if self.running:
+            return False
+        threading.Thread(target=self.run, args=(force,), daemon=True).start()
+        return True
+
+    def start_scheduler(self, hour: int = FORECAST_BATCH_HOUR):
+        """Run the batch every night at the given hour"""
+        if self._scheduler is not None:
+            return
+
+        def loop():
+            while True:
+                now = datetime.now()
+                next_run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+                if next_run <= now:
+                    next_run += timedelta(days=1)
+                time.sleep((next_run - now).total_seconds())
+                try:
+                    self.run()
+                except Exception as e:
+                    logger.error(f"Nightly forecast batch failed: {e}")
+
+        self._scheduler = threading.Thread(target=loop, daemon=True)
+        self._scheduler.start()
+
+forecast_batch = ForecastBatch()
@@ -0,0 +1,228 @@
+import os
+import json
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .google_maps import google_maps
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_BATCH_SIZE = int(os.getenv("GEOCODE_BATCH_SIZE", "25"))
+GEOCODE_WORKERS = int(os.getenv("GEOCODE_WORKERS", "4"))
+GEOCODE_CACHE_FILE = Path(os.getenv("GEOCODE_CACHE_FILE", "./data/geocode_cache.jsonl"))
+GEOCODE_JOBS_FILE = Path(os.getenv("GEOCODE_JOBS_FILE", "./data/geocode_jobs.json"))
+
+def normalize_address(address: str) -> str:
+    return " ".join(str(address or "").lower().replace(",", " ").split())
+
+def customer_address(customer: dict) -> str:
+    """Full geocodable address for a customer record"""
+    parts = [customer.get("address", "")]
+    for field in ("city", "state", "zip_code"):
+        value = str(customer.get(field) or "").strip()
+        if value and value.lower() not in str(customer.get("address", "")).lower():
+            parts.append(value)
+    return ", ".join(p for p in parts if p)
+
+def needs_geocoding(customer: dict) -> bool:
+    return not customer.get("coordinates") and bool(str(customer.get("address") or "").strip())
+
+class GeocodingJob:
+    """Progress of one background geocoding run"""
+
+    def __init__(self, source: str, total: int, job_id: Optional[str] = None, assign_depots: bool = False):
+        self.id = job_id or str(uuid.uuid4())
+        self.source = source
+        self.assign_depots = assign_depots
+        self.status = "queued"
+        self.total = total
+        self.geocoded = 0
+        self.from_cache = 0
+        self.not_found = 0
+        self.errors = 0
+        self.created_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+
+    @property
+    def processed(self) -> int:
+        return self.geocoded + self.from_cache + self.not_found + self.errors
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "source": self.source,
+            "assign_depots": self.assign_depots,
+            "status": self.status,
+            "total": self.total,
+            "processed": self.processed,
+            "geocoded": self.geocoded,
+            "from_cache": self.from_cache,
+            "not_found": self.not_found,
+            "errors": self.errors,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class BatchGeocoder:
+    """
+    Geocodes imported customers in the background, in rate-limited batches.
+
+    Every result (including addresses Google cannot find) is appended to a
+    JSON-lines address cache as each batch finishes, so an interrupted run
+    resumes where it stopped and an address is never looked up twice. The
+    customer data itself is persisted once, when the job completes.
+    """
+
+    def __init__(self, cache_file: Path = GEOCODE_CACHE_FILE, jobs_file: Path = GEOCODE_JOBS_FILE):
+        self.cache_file = cache_file
+        self.jobs_file = jobs_file
+        self.jobs: Dict[str, GeocodingJob] = {}
+        self._cache: Optional[Dict[str, Optional[dict]]] = None
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._queued_ids: set = set()
+
+    def _load_cache(self) -> Dict[str, Optional[dict]]:
+        if self._cache is None:
+            cache = {}
+            if self.cache_file.exists():
+                with open(self.cache_file) as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                            cache[entry["address"]] = entry.get("coordinates")
+                        except (ValueError, KeyError):
+                            continue
+            self._cache = cache
+        return self._cache
+
+    def _append_cache(self, results: Dict[str, Optional[dict]]):
+        if not results:
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_file, "a") as f:
+            for address, coordinates in results.items():
+                f.write(json.dumps({"address": address, "coordinates": coordinates}) + "\n")
+
+    def lookup(self, address: str) -> Optional[dict]:
+        """Cached coordinates for an address, without any network I/O"""
+        with self._lock:
+            return self._load_cache().get(normalize_address(address))
+
+    def _save_jobs(self):
+        try:
+            self.jobs_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.jobs_file, "w") as f:
+                json.dump([job.to_dict() for job in self.jobs.values()][-50:], f, indent=2)
+        except OSError as e:
+            logger.warning(f"Could not save geocoding jobs: {e}")
+
+    def submit(self, customers: List[dict], source: str, persist: Callable[[], None],
+               job_id: Optional[str] = None, assign_depots: bool = False) -> GeocodingJob:
+        """
+        Start geocoding the customers that have an address but no coordinates.
+        assign_depots is only recorded so a resumed job persists the same way.
+        """
+        with self._lock:
+            # Customers already waiting in another job are not queued twice
+            pending = [c for c in customers if needs_geocoding(c) and id(c) not in self._queued_ids]
+            self._queued_ids.update(id(c) for c in pending)
+        job = GeocodingJob(source, len(pending), job_id, assign_depots)
+        self.jobs[job.id] = job
+        self._save_jobs()
+        if pending:
+            threading.Thread(target=self._run, args=(job, pending, persist), daemon=True).start()
+        else:
+            job.status = "completed"
+            job.finished_at = datetime.now()
+        return job
+
+    def _run(self, job: GeocodingJob, customers: List[dict], persist: Callable[[], None]):
+        # One job at a time keeps the request rate under the shared limiter
+        with self._run_lock:
+            job.status = "running"
+            self._save_jobs()
+            try:
+                with self._lock:
+                    cache = self._load_cache()
+                by_address: Dict[str, List[dict]] = {}
+                addresses: Dict[str, str] = {}
+                for customer in customers:
+                    address = customer_address(customer)
+                    key = normalize_address(address)
+                    if key in cache:
+                        if cache[key]:
+                            customer["coordinates"] = dict(cache[key])
+                            job.from_cache += 1
+                        else:
+                            job.not_found += 1
+                    else:
+                        by_address.setdefault(key, []).append(customer)
+                        addresses.setdefault(key, address)
+
+                keys = list(by_address)
+                if keys and not google_maps.is_configured():
+                    logger.warning(f"Geocoding job {job.id}: Google Maps API key not configured")
+                    job.errors += sum(len(by_address[k]) for k in keys)
+                    keys = []
+
+                with ThreadPoolExecutor(max_workers=GEOCODE_WORKERS) as executor:
+                    for start in range(0, len(keys), GEOCODE_BATCH_SIZE):
+                        batch = keys[start:start + GEOCODE_BATCH_SIZE]
+                        results = {}
+                        for key, outcome in zip(batch, executor.map(self._geocode, [addresses[k] for k in batch])):
+                            group = by_address[key]
+                            if outcome == "error":
+                                job.errors += len(group)
+                                continue
+                            results[key] = outcome
+                            for customer in group:
+                                if outcome:
+                                    customer["coordinates"] = dict(outcome)
+                                    job.geocoded += 1
+                                else:
+                                    job.not_found += 1
+                        with self._lock:
+                            cache.update(results)
+                            self._append_cache(results)
+                        logger.info(f"Geocoding job {job.id}: {job.processed}/{job.total}")
+
+                job.status = "completed"
+            except Exception as e:
+                logger.error(f"Geocoding job {job.id} failed: {e}")
+                job.status = "failed"
+            finally:
+                with self._lock:
+                    self._queued_ids.difference_update(id(c) for c in customers)
+                job.finished_at = datetime.now()
+                try:
+                    persist()
+                except Exception as e:
+                    logger.error(f"Geocoding job {job.id} could not persist customers: {e}")
+                self._save_jobs()
+
+    @staticmethod
+    def _geocode(address: str):
+        """Coordinates, None if the address is unknown, or "error" if it should be retried later"""
+        try:
+            return google_maps.geocode(address)
+        except Exception as e:
+            logger.warning(f"Geocoding failed for {address}: {e}")
+            return "error"
+
+    def unfinished_jobs(self) -> List[Dict]:
+        """Jobs from the previous process that were still queued or running"""
+        if not self.jobs_file.exists():
+            return []
+        try:
+            with open(self.jobs_file) as f:
+                return [job for job in json.load(f) if job.get("status") in ("queued", "running")]
+        except (OSError, ValueError):
+            return []
+
+batch_geocoder = BatchGeocoder()
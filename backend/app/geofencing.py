@@ -0,0 +1,196 @@
+"""
+Geofence arrival/departure detection for route stops.
+
+Pending stops are indexed in a uniform grid of GEOFENCE_CELL_DEGREES cells,
+larger than the exit radius, so a GPS point only has to be compared with the
+fences in its own and the eight neighbouring cells - constant time on
+average however many stops are indexed. A driver entering the arrival
+radius of a stop on their route produces an arrival; leaving the (larger)
+exit radius produces a departure with the dwell time. Departures after less
+than GEOFENCE_MIN_DWELL_SECONDS are drive-bys and put the stop back.
+
+Fences are keyed by a stop id that survives a replan renumbering the stops,
+and a driver already at a stop keeps their arrival when its route is
+re-indexed.
+"""
+import os
+import math
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .distance_matrix import haversine_distance, METERS_PER_MILE
+
+logger = logging.getLogger(__name__)
+
+GEOFENCE_RADIUS_METERS = float(os.getenv("GEOFENCE_RADIUS_METERS", "150"))
+GEOFENCE_EXIT_METERS = float(os.getenv("GEOFENCE_EXIT_METERS", "250"))
+GEOFENCE_MIN_DWELL_SECONDS = float(os.getenv("GEOFENCE_MIN_DWELL_SECONDS", "60"))
+GEOFENCE_MAX_ACCURACY_METERS = float(os.getenv("GEOFENCE_MAX_ACCURACY_METERS", "100"))
+GEOFENCE_CELL_DEGREES = 0.01  # about 1.1 km north-south, 0.95 km east-west at 31N
+
+class Fence:
+    __slots__ = ("route_id", "stop_id", "stop_number", "customer_id", "lat", "lng", "cell")
+
+    def __init__(self, route_id: str, stop_id: str, stop_number: int, customer_id: Optional[str],
+                 lat: float, lng: float):
+        self.route_id = route_id
+        self.stop_id = stop_id
+        self.stop_number = stop_number
+        self.customer_id = customer_id
+        self.lat = lat
+        self.lng = lng
+        self.cell = grid_cell(lat, lng)
+
+def grid_cell(lat: float, lng: float) -> Tuple[int, int]:
+    return (math.floor(lat / GEOFENCE_CELL_DEGREES), math.floor(lng / GEOFENCE_CELL_DEGREES))
+
+def meters_to(fence: Fence, lat: float, lng: float) -> float:
+    return haversine_distance(lat, lng, fence.lat, fence.lng) * METERS_PER_MILE
+
+class DwellStats:
+    """Running count, mean and variance of dwell minutes (Welford)"""
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, minutes: float):
+        self.count += 1
+        delta = minutes - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (minutes - self.mean)
+
+    def to_dict(self) -> Dict:
+        std = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+        return {"visits": self.count, "mean_minutes": round(self.mean, 1), "std_minutes": round(std, 1)}
+
+class GeofenceEngine:
+    """Spatial grid of stop fences plus the per-driver inside/outside state"""
+
+    def __init__(self):
+        self.grid: Dict[Tuple[int, int], List[Fence]] = {}
+        self.route_fences: Dict[str, Dict[str, Fence]] = {}
+        self.inside: Dict[str, Tuple[Fence, float]] = {}  # driver_id -> (fence, entered at)
+        self.dwell: Dict[str, DwellStats] = {}
+        self._lock = threading.Lock()
+
+    def index_route(self, route_id: str, stops: List[Tuple[str, int, Optional[str], float, float]]):
+        """
+        Replace a route's fences with (stop_id, stop_number, customer_id, lat, lng)
+        of its pending stops. Drivers inside one of the route's fences stay there,
+        moved to the new fence of the same stop if it has one.
+        """
+        with self._lock:
+            self._drop(route_id)
+            fences = {
+                stop_id: Fence(route_id, stop_id, number, customer_id, lat, lng)
+                for stop_id, number, customer_id, lat, lng in stops
+            }
+            self.route_fences[route_id] = fences
+            for fence in fences.values():
+                self.grid.setdefault(fence.cell, []).append(fence)
+            for driver_id, (fence, entered) in self.inside.items():
+                if fence.route_id == route_id and fence.stop_id in fences:
+                    self.inside[driver_id] = (fences[fence.stop_id], entered)
+
+    def drop_route(self, route_id: str):
+        """Forget a route's fences and any driver standing in one of them"""
+        with self._lock:
+            self._drop(route_id)
+            for driver_id in [d for d, (fence, _) in self.inside.items() if fence.route_id == route_id]:
+                del self.inside[driver_id]
+
+    def _drop(self, route_id: str):
+        for fence in self.route_fences.pop(route_id, {}).values():
+            self._unlink(fence)
+
+    def _unlink(self, fence: Fence):
+        cell = self.grid.get(fence.cell)
+        if cell is not None:
+            try:
+                cell.remove(fence)
+            except ValueError:
+                pass
+            if not cell:
+                del self.grid[fence.cell]
+
+    def is_indexed(self, route_id: str) -> bool:
+        return route_id in self.route_fences
+
+    def check(self, driver_id: str, route_id: Optional[str], lat: float, lng: float, ts: float,
+              accuracy: Optional[float] = None) -> List[Dict]:
+        """Arrival/departure events caused by one GPS point"""
+        if accuracy and accuracy > GEOFENCE_MAX_ACCURACY_METERS:
+            return []
+        events = []
+        with self._lock:
+            current = self.inside.get(driver_id)
+            if current is not None:
+                fence, entered = current
+                if meters_to(fence, lat, lng) <= GEOFENCE_EXIT_METERS:
+                    return []
+                del self.inside[driver_id]
+                dwell_seconds = ts - entered
+                if dwell_seconds < GEOFENCE_MIN_DWELL_SECONDS:
+                    events.append(self._event("drive_by", driver_id, fence, ts, dwell_seconds))
+                else:
+                    # Served: the stop no longer needs a fence
+                    self.route_fences.get(fence.route_id, {}).pop(fence.stop_id, None)
+                    self._unlink(fence)
+                    if fence.customer_id:
+                        self.dwell.setdefault(fence.customer_id, DwellStats()).add(dwell_seconds / 60)
+                    events.append(self._event("departure", driver_id, fence, ts, dwell_seconds))
+
+            if route_id is None:
+                return events
+            row, column = grid_cell(lat, lng)
+            nearest, nearest_meters = None, GEOFENCE_RADIUS_METERS
+            for cell in ((row + dr, column + dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1)):
+                for fence in self.grid.get(cell, ()):
+                    if fence.route_id != route_id:
+                        continue
+                    meters = meters_to(fence, lat, lng)
+                    if meters <= nearest_meters:
+                        nearest, nearest_meters = fence, meters
+            if nearest is not None:
+                self.inside[driver_id] = (nearest, ts)
+                events.append(self._event("arrival", driver_id, nearest, ts))
+        return events
+
+    @staticmethod
+    def _event(kind: str, driver_id: str, fence: Fence, ts: float, dwell_seconds: Optional[float] = None) -> Dict:
+        event = {
+            "type": kind,
+            "driver_id": driver_id,
+            "route_id": fence.route_id,
+            "stop_id": fence.stop_id,
+            "stop_number": fence.stop_number,
+            "customer_id": fence.customer_id,
+            "ts": ts,
+        }
+        if dwell_seconds is not None:
+            event["dwell_seconds"] = round(dwell_seconds)
+        return event
+
+    def record_history(self, customer_id: str, dwell_minutes: float):
+        """Seed dwell statistics from stops completed before a restart"""
+        self.dwell.setdefault(customer_id, DwellStats()).add(dwell_minutes)
+
+    def dwell_stats(self, customer_id: Optional[str] = None) -> Dict:
+        if customer_id is not None:
+            stats = self.dwell.get(customer_id)
+            return stats.to_dict() if stats else DwellStats().to_dict()
+        return {cid: stats.to_dict() for cid, stats in self.dwell.items()}
+
+    def stats(self) -> Dict:
+        return {
+            "routes": len(self.route_fences),
+            "fences": sum(len(fences) for fences in self.route_fences.values()),
+            "cells": len(self.grid),
+            "drivers_at_stop": len(self.inside),
+        }
+
+geofence_engine = GeofenceEngine()
@@ -0,0 +1,150 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Google caps a Distance Matrix request at 25 origins, 25 destinations and
+# (on the standard plan) 100 elements; requests are tiled to stay inside both.
+MAX_LOCATIONS_PER_SIDE = 25
+MAX_ELEMENTS_PER_REQUEST = int(os.getenv("GOOGLE_MAPS_MAX_ELEMENTS", "100"))
+MATRIX_WORKERS = int(os.getenv("GOOGLE_MAPS_MATRIX_WORKERS", "8"))
+ELEMENTS_PER_SECOND = float(os.getenv("GOOGLE_MAPS_ELEMENTS_PER_SECOND", "1000"))
+# Geocoding is limited per request (Google's default quota is 50 QPS), not per element
+GEOCODE_REQUESTS_PER_SECOND = float(os.getenv("GOOGLE_MAPS_GEOCODE_PER_SECOND", "40"))
+
+Location = Union[str, Tuple[float, float]]
+
+class RateLimiter:
+    """Thread-safe token bucket, refilled continuously at `rate` tokens per second"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+def matrix_tiles(num_origins: int, num_destinations: int) -> List[Tuple[range, range]]:
+    """Split an origins x destinations matrix into blocks the API accepts"""
+    destination_block = min(MAX_LOCATIONS_PER_SIDE, num_destinations, MAX_ELEMENTS_PER_REQUEST)
+    origin_block = max(1, min(MAX_LOCATIONS_PER_SIDE, num_origins, MAX_ELEMENTS_PER_REQUEST // destination_block))
+    return [
+        (range(o, min(o + origin_block, num_origins)), range(d, min(d + destination_block, num_destinations)))
+        for o in range(0, num_origins, origin_block)
+        for d in range(0, num_destinations, destination_block)
+    ]
+
+class GoogleMapsClient:
+    """Process-wide Google Maps client sharing one pooled HTTP session"""
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+        self.rate_limiter = RateLimiter(ELEMENTS_PER_SECOND)
+        self.geocode_limiter = RateLimiter(GEOCODE_REQUESTS_PER_SECOND)
+
+    @property
+    def api_key(self) -> str:
+        return os.getenv('GOOGLE_MAPS_API_KEY', '')
+
+    def is_configured(self) -> bool:
+        return bool(self.api_key)
+
+    def reset(self):
+        """Drop the shared client, e.g. after the API key or base URL changed"""
+        with self._lock:
+            self._client = None
+
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import googlemaps
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MATRIX_WORKERS)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._client = googlemaps.Client(
+                        key=self.api_key,
+                        requests_session=session,
+                        base_url=os.getenv("GOOGLE_MAPS_BASE_URL", "https://maps.googleapis.com"),
+                        timeout=30
+                    )
+        return self._client
+
+    def geocode(self, address: str) -> Optional[dict]:
+        """Geocode an address to {"lat", "lng"}"""
+        self.geocode_limiter.acquire()
+        result = self.client().geocode(address)
+        if result:
+            location = result[0]['geometry']['location']
+            return {'lat': location['lat'], 'lng': location['lng']}
+        return None
+
+    def distance_matrix(self, origins: List[Location], destinations: List[Location],
+                        **kwargs) -> Dict[Tuple[int, int], dict]:
+        """
+        Fetch a driving distance matrix of any size.
+
+        The matrix is tiled into requests within the API limits which run
+        concurrently on the shared client under the element rate limit.
+        Returns the OK elements keyed by (origin index, destination index);
+        failed tiles are logged and simply missing from the result.
+        """
+        params = {"mode": "driving", "units": "imperial"}
+        params.update(kwargs)
+        client = self.client()
+        elements: Dict[Tuple[int, int], dict] = {}
+
+        def fetch(tile: Tuple[range, range]):
+            origin_range, destination_range = tile
+            self.rate_limiter.acquire(len(origin_range) * len(destination_range))
+            try:
+                result = client.distance_matrix(
+                    origins=[origins[i] for i in origin_range],
+                    destinations=[destinations[j] for j in destination_range],
+                    **params
+                )
+            except Exception as e:
+                logger.warning(f"Distance matrix tile failed: {e}")
+                return {}
+            tile_elements = {}
+            if result.get('status') == 'OK':
+                for row_offset, row in enumerate(result['rows']):
+                    for column_offset, element in enumerate(row['elements']):
+                        if element.get('status') == 'OK':
+                            tile_elements[(origin_range[row_offset], destination_range[column_offset])] = element
+            else:
+                logger.warning(f"Distance matrix tile returned status {result.get('status')}")
+            return tile_elements
+
+        tiles = matrix_tiles(len(origins), len(destinations))
+        if len(tiles) == 1:
+            elements.update(fetch(tiles[0]))
+        else:
+            with ThreadPoolExecutor(max_workers=min(MATRIX_WORKERS, len(tiles))) as executor:
+                for tile_elements in executor.map(fetch, tiles):
+                    elements.update(tile_elements)
+        return elements
+
+google_maps = GoogleMapsClient()
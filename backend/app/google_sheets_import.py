@@ -1,16 +1,20 @@
-import gspread
-import pandas as pd
-from google.auth.exceptions import GoogleAuthError
-from typing import List, Dict, Any
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, List, Dict, Any
 import logging
 import json
 import os
 from .excel_import import extract_customers_from_excel, extract_orders_from_excel, calculate_financial_metrics
 
+if TYPE_CHECKING:
+    import pandas as pd  # gspread and pandas are imported when a sheet is read
+
 logger = logging.getLogger(__name__)
 
 def authenticate_google_sheets():
     """Authenticate with Google Sheets API using service account"""
+    import gspread
+
     try:
         service_account_json = os.getenv("GOOGLE_SHEETS_SERVICE_ACCOUNT_JSON")
         if not service_account_json:
@@ -39,6 +43,10 @@ def authenticate_google_sheets():
 
 def get_google_sheets_data(sheets_url: str, worksheet_name: str = None) -> pd.DataFrame:
     """Read data from Google Sheets and convert to pandas DataFrame"""
+    import gspread
+    import pandas as pd
+    from google.auth.exceptions import GoogleAuthError
+
     try:
         gc = authenticate_google_sheets()
         
@@ -103,6 +111,8 @@ def get_google_sheets_data(sheets_url: str, worksheet_name: str = None) -> pd.Da
 
 def process_google_sheets_data(sheets_url: str, location_id: str = "loc_3", location_name: str = "Lufkin", worksheet_name: str = None) -> Dict[str, Any]:
     """Process Google Sheets data and return consolidated customer/order data"""
+    import pandas as pd
+
     try:
         df = get_google_sheets_data(sheets_url, worksheet_name)
         data_format = detect_data_format(df)
@@ -165,6 +175,8 @@ def detect_data_format(df: pd.DataFrame) -> str:
 
 def extract_customers_from_customer_data(df: pd.DataFrame, location_id: str = "loc_3", location_name: str = "Lufkin") -> List[Dict[str, Any]]:
     """Extract customers from customer-only data format (Customer/Address/Phone)"""
+    import pandas as pd
+
     customers = []
     
     location_config = {
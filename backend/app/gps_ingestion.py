@@ -0,0 +1,192 @@
+"""
+GPS ping ingestion.
+
+A ping is recorded in O(1) on the request path: it goes into the driver's
+in-memory ring buffer, replaces their latest position and joins a pending
+batch. A background flusher appends pending pings to the compressed
+breadcrumb store every few seconds, one flush at a time, and persists other
+state marked dirty (route ETAs) at most once per interval. That state is
+saved on the event loop, where the handlers that change it run, never from a
+worker thread. Consumers such as ETA updates and geofencing are fed
+asynchronously from a bounded queue so slow work never blocks a ping.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from .breadcrumb_store import breadcrumb_store, BreadcrumbStore, valid_driver_id
+
+logger = logging.getLogger(__name__)
+
+GPS_BUFFER_SIZE = int(os.getenv("GPS_BUFFER_SIZE", "720"))  # two hours at one ping per 10 s
+GPS_FLUSH_INTERVAL_SECONDS = float(os.getenv("GPS_FLUSH_INTERVAL_SECONDS", "15"))
+GPS_FLUSH_BATCH_SIZE = int(os.getenv("GPS_FLUSH_BATCH_SIZE", "500"))
+GPS_QUEUE_SIZE = int(os.getenv("GPS_QUEUE_SIZE", "10000"))
+
+PingConsumer = Callable[[str, dict], Awaitable[None]]
+
+def ping_time(value) -> float:
+    """Epoch seconds from an ISO string, epoch seconds or epoch milliseconds; now if missing"""
+    if isinstance(value, (int, float)):
+        return value / 1000 if value > 1e11 else float(value)
+    if isinstance(value, str) and value:
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    return time.time()
+
+class GpsIngestion:
+    """Ring buffers, latest positions, batched breadcrumb persistence and a consumer queue"""
+
+    def __init__(self, buffer_size: int = GPS_BUFFER_SIZE, store: BreadcrumbStore = breadcrumb_store):
+        self.buffer_size = buffer_size
+        self.store = store
+        self.tracks: Dict[str, Deque[dict]] = {}
+        self.latest: Dict[str, dict] = {}
+        self.consumers: List[PingConsumer] = []
+        self.persist_state: Optional[Callable[[], None]] = None
+        self._pending: List[dict] = []
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._state_dirty = False
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.received = 0
+        self.dropped = 0
+        self.flushed = 0
+
+    def subscribe(self, consumer: PingConsumer):
+        self.consumers.append(consumer)
+
+    def mark_state_dirty(self):
+        """Ask the next flush to persist application state (instead of saving on every ping)"""
+        self._state_dirty = True
+
+    def ingest(self, driver_id: str, data: dict) -> dict:
+        """Record one ping; O(1) apart from the queue hand-off"""
+        ping = {
+            "lat": data.get("lat"),
+            "lng": data.get("lng"),
+            "timestamp": data.get("timestamp"),
+            "ts": ping_time(data.get("timestamp")),
+            "route_id": data.get("route_id"),
+            "speed": data.get("speed", 0),
+            "heading": data.get("heading", 0),
+            "accuracy": data.get("accuracy", 0),
+        }
+        track = self.tracks.get(driver_id)
+        if track is None:
+            track = self.tracks[driver_id] = deque(maxlen=self.buffer_size)
+        track.append(ping)
+        self.latest[driver_id] = ping
+        self.received += 1
+        with self._pending_lock:
+            self._pending.append(dict(ping, driver_id=driver_id))
+            flush_now = len(self._pending) >= GPS_FLUSH_BATCH_SIZE
+        self._ensure_started()
+        if self._queue is not None:
+            if self._queue.full():
+                # Consumers only need fresh positions; drop the oldest queued ping
+                self._queue.get_nowait()
+                self.dropped += 1
+            self._queue.put_nowait((driver_id, ping))
+        if flush_now and not self._flush_lock.locked():
+            threading.Thread(target=self.flush_breadcrumbs, daemon=True).start()
+        return ping
+
+    def recent(self, driver_id: str, limit: Optional[int] = None) -> List[dict]:
+        track = self.tracks.get(driver_id) or ()
+        points = list(track)
+        return points[-limit:] if limit else points
+
+    def flush_breadcrumbs(self):
+        """Append pending pings to the breadcrumb store; concurrent callers wait their turn"""
+        with self._flush_lock:
+            self._flush_pending()
+
+    def _flush_pending(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        by_driver: Dict[str, List[tuple]] = {}
+        for ping in pending:
+            if not valid_driver_id(ping["driver_id"]):
+                logger.warning(f"GPS ping for invalid driver id {ping['driver_id']!r} not stored")
+                continue
+            if isinstance(ping["lat"], (int, float)) and isinstance(ping["lng"], (int, float)):
+                by_driver.setdefault(ping["driver_id"], []).append((ping["lat"], ping["lng"], int(ping["ts"])))
+        try:
+            for driver_id, points in by_driver.items():
+                self.store.append(driver_id, points)
+            self.flushed += len(pending)
+        except OSError as e:
+            logger.error(f"Could not persist {len(pending)} GPS pings: {e}")
+            with self._pending_lock:
+                self._pending[:0] = pending
+
+    def persist_dirty_state(self):
+        """Persist state marked dirty; call from the event loop, which owns that state"""
+        if self._state_dirty and self.persist_state:
+            self._state_dirty = False
+            try:
+                self.persist_state()
+            except Exception as e:
+                logger.error(f"Could not persist state after GPS updates: {e}")
+
+    def flush(self):
+        """Persist pending pings and any state marked dirty"""
+        self.flush_breadcrumbs()
+        self.persist_dirty_state()
+
+    def _ensure_started(self):
+        """Start the consumer and flush loops on the running event loop, once"""
+        if self._queue is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._queue = asyncio.Queue(maxsize=GPS_QUEUE_SIZE)
+        self._tasks = [loop.create_task(self._dispatch()), loop.create_task(self._flush_loop())]
+
+    async def _dispatch(self):
+        while True:
+            driver_id, ping = await self._queue.get()
+            for consumer in self.consumers:
+                try:
+                    await consumer(driver_id, ping)
+                except Exception as e:
+                    logger.warning(f"GPS consumer {getattr(consumer, '__name__', consumer)} failed: {e}")
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(GPS_FLUSH_INTERVAL_SECONDS)
+            await loop.run_in_executor(None, self.flush_breadcrumbs)
+            self.persist_dirty_state()
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._queue = None
+        self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "drivers": len(self.tracks),
+            "received": self.received,
+            "flushed": self.flushed,
+            "pending": len(self._pending),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "dropped": self.dropped,
+        }
+
+gps_ingestion = GpsIngestion()
@@ -0,0 +1,151 @@
+"""
+Vectorized Holt-Winters forecasting for many daily series at once.
+
+Additive Holt-Winters with a damped trend and weekly seasonality:
+
+    level   l_t = a (y_t - s_{t-m}) + (1 - a)(l_{t-1} + phi b_{t-1})
+    trend   b_t = b (l_t - l_{t-1}) + (1 - b) phi b_{t-1}
+    season  s_t = g (y_t - l_{t-1} - phi b_{t-1}) + (1 - g) s_{t-m}
+
+All series are placed on one calendar (S x T, NaN where a day has no data)
+and run through the recursions together for every (a, b, g) of a small grid,
+so one pass over the days updates S x G states with array operations. Each
+series keeps the parameters with the lowest one-step-ahead squared error;
+that error's spread gives the prediction intervals (the ETS(A,A,A) h-step
+variance). Fitting thousands of series takes seconds; one series takes a
+couple of milliseconds, with no Prophet/Stan import.
+"""
+import itertools
+import logging
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SEASON_LENGTH = 7
+DAMPING = 0.98
+MIN_HISTORY_DAYS = 2 * SEASON_LENGTH
+INTERVAL_Z = 1.2816  # 80% interval, as the Prophet models use
+ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.7)
+BETAS = (0.0, 0.01, 0.05, 0.1)
+GAMMAS = (0.05, 0.1, 0.2, 0.4)
+PARAMETER_GRID = np.array(list(itertools.product(ALPHAS, BETAS, GAMMAS)))  # (G, 3)
+
+class HoltWintersBatch:
+    """Fitted states of S series, ready to forecast"""
+
+    def __init__(self, level: np.ndarray, trend: np.ndarray, season: np.ndarray, last_index: np.ndarray,
+                 sigma: np.ndarray, params: np.ndarray, last_dates: List[date]):
+        self.level = level            # (S,)
+        self.trend = trend            # (S,)
+        self.season = season          # (S, m), indexed by calendar day % m
+        self.last_index = last_index  # (S,) calendar index of each series' last observation
+        self.sigma = sigma            # (S,) one-step error standard deviation
+        self.params = params          # (S, 3) alpha, beta, gamma
+        self.last_dates = last_dates
+
+    def forecast(self, horizon: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(yhat, lower, upper), each (S, horizon), for the days after each series' last observation"""
+        steps = np.arange(1, horizon + 1)
+        damped = np.cumsum(DAMPING ** steps)                                    # phi + ... + phi^h
+        season_index = (self.last_index[:, None] + steps[None, :]) % SEASON_LENGTH
+        seasonal = np.take_along_axis(self.season, season_index, axis=1)
+        yhat = self.level[:, None] + damped[None, :] * self.trend[:, None] + seasonal
+
+        alpha, beta, gamma = (self.params[:, k][:, None] for k in range(3))
+        j = steps[None, :-1] if horizon > 1 else np.zeros((1, 0))
+        c = alpha * (1 + j * beta) + gamma * (j % SEASON_LENGTH == 0)
+        variance = self.sigma[:, None] ** 2 * np.concatenate(
+            [np.ones((len(self.level), 1)), 1 + np.cumsum(c ** 2, axis=1)], axis=1
+        )
+        spread = INTERVAL_Z * np.sqrt(variance)
+        return yhat, yhat - spread, yhat + spread
+
+def align(series: List[Dict[date, float]]) -> Tuple[np.ndarray, date]:
+    """Place daily series on one calendar; (S x T values with NaN gaps, first calendar day)"""
+    first = min(min(s) for s in series)
+    last = max(max(s) for s in series)
+    values = np.full((len(series), (last - first).days + 1), np.nan)
+    for row, totals in enumerate(series):
+        days = np.array([(day - first).days for day in totals])
+        values[row, days] = list(totals.values())
+    return values, first
+
+def fit(series: List[Dict[date, float]]) -> HoltWintersBatch:
+    """Fit every series (each needs at least MIN_HISTORY_DAYS days) over the parameter grid"""
+    values, first_day = align(series)
+    count, days = values.shape
+    observed = ~np.isnan(values)
+    start = observed.argmax(axis=1)
+    last_index = days - 1 - observed[:, ::-1].argmax(axis=1)
+
+    # Initial level and season from each series' first week, trend from the first two weeks
+    rows = np.arange(count)[:, None]
+    first_week = values[rows, start[:, None] + np.arange(SEASON_LENGTH)]
+    second_week = values[rows, np.minimum(start[:, None] + SEASON_LENGTH + np.arange(SEASON_LENGTH), days - 1)]
+    level0 = np.nanmean(first_week, axis=1)
+    trend0 = np.nan_to_num((np.nanmean(second_week, axis=1) - level0) / SEASON_LENGTH)
+    season0 = np.zeros((count, SEASON_LENGTH))
+    calendar_slot = (start[:, None] + np.arange(SEASON_LENGTH)) % SEASON_LENGTH
+    np.put_along_axis(season0, calendar_slot, np.nan_to_num(first_week - level0[:, None]), axis=1)
+
+    grid = len(PARAMETER_GRID)
+    alpha, beta, gamma = (PARAMETER_GRID[:, k][None, :] for k in range(3))
+    level = np.repeat(level0[:, None], grid, axis=1)
+    trend = np.repeat(trend0[:, None], grid, axis=1)
+    season = np.repeat(season0[:, None, :], grid, axis=1)   # (S, G, m)
+    sse = np.zeros((count, grid))
+    errors = np.zeros(count)
+
+    for t in range(days):
+        active = observed[:, t] & (t >= start + SEASON_LENGTH)
+        if not active.any():
+            continue
+        slot = t % SEASON_LENGTH
+        y = np.nan_to_num(values[:, t])[:, None]
+        prior = level + DAMPING * trend
+        seasonal = season[:, :, slot]
+        error = y - prior - seasonal
+        new_level = alpha * (y - seasonal) + (1 - alpha) * prior
+        new_trend = beta * (new_level - level) + (1 - beta) * DAMPING * trend
+        new_season = gamma * (y - prior) + (1 - gamma) * seasonal
+        mask = active[:, None]
+        sse += np.where(mask, error ** 2, 0.0)
+        level = np.where(mask, new_level, level)
+        trend = np.where(mask, new_trend, trend)
+        season[:, :, slot] = np.where(mask, new_season, seasonal)
+        errors += active
+
+    best = sse.argmin(axis=1)
+    pick = np.arange(count)
+    sigma = np.sqrt(sse[pick, best] / np.maximum(errors, 1))
+    last_dates = [first_day + timedelta(days=int(i)) for i in last_index]
+    return HoltWintersBatch(level[pick, best], trend[pick, best], season[pick, best], last_index,
+                            sigma, PARAMETER_GRID[best], last_dates)
+
+def forecast_series(series: List[Dict[date, float]], horizon: int) -> List[Dict]:
+    """Fit and forecast each series; rows and history statistics in the Prophet result shape"""
+    if not series:
+        return []
+    batch = fit(series)
+    yhat, lower, upper = batch.forecast(horizon)
+    results = []
+    for i, totals in enumerate(series):
+        demand = np.array(list(totals.values()), dtype=float)
+        results.append({
+            "forecast": [
+                {
+                    "ds": (batch.last_dates[i] + timedelta(days=k + 1)).isoformat(),
+                    "yhat": max(0.0, float(yhat[i, k])),
+                    "yhat_lower": max(0.0, float(lower[i, k])),
+                    "yhat_upper": max(0.0, float(upper[i, k])),
+                }
+                for k in range(horizon)
+            ],
+            "avg_demand": float(demand.mean()),
+            "std_demand": float(demand.std()),
+            "params": dict(zip(("alpha", "beta", "gamma"), batch.params[i].tolist())),
+        })
+    return results
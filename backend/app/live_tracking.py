@@ -0,0 +1,124 @@
+"""
+WebSocket fan-out of live driver positions and ETAs.
+
+Clients subscribe to topics - "route:<id>", "driver:<id>" or
+"location:<id>" - and the ingestion path publishes each update once to the
+topics it concerns. A message is serialized once and placed on the bounded
+queue of every subscriber of those topics; a per-connection sender task
+drains the queue. A slow client only delays itself: when its queue is full
+the oldest message is dropped, since a newer position supersedes it.
+"""
+import os
+import json
+import asyncio
+import logging
+from typing import Callable, Dict, Iterable, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+logger = logging.getLogger(__name__)
+
+TRACKING_QUEUE_SIZE = int(os.getenv("TRACKING_QUEUE_SIZE", "32"))
+TOPIC_PREFIXES = ("route", "driver", "location")
+
+class Subscriber:
+    """One WebSocket connection with its topics and outgoing queue"""
+
+    def __init__(self, websocket: WebSocket, queue_size: int = TRACKING_QUEUE_SIZE):
+        self.websocket = websocket
+        self.topics: Set[str] = set()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, text: str):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(text)
+
+    async def send_loop(self):
+        while True:
+            await self.websocket.send_text(await self.queue.get())
+
+class LiveTracker:
+    """Topic registry that publishes updates to subscribed WebSockets"""
+
+    def __init__(self):
+        self.topics: Dict[str, Set[Subscriber]] = {}
+        self.subscribers: Set[Subscriber] = set()
+        self.published = 0
+
+    def subscribe(self, subscriber: Subscriber, topic: str):
+        subscriber.topics.add(topic)
+        self.topics.setdefault(topic, set()).add(subscriber)
+
+    def unsubscribe(self, subscriber: Subscriber, topic: str):
+        subscriber.topics.discard(topic)
+        watchers = self.topics.get(topic)
+        if watchers is not None:
+            watchers.discard(subscriber)
+            if not watchers:
+                del self.topics[topic]
+
+    def publish(self, topics: Iterable[str], message: Dict):
+        """Queue a message for every subscriber of any of the topics, at most once each"""
+        recipients = set()
+        for topic in topics:
+            recipients.update(self.topics.get(topic, ()))
+        if not recipients:
+            return
+        text = json.dumps(message, default=str)
+        for subscriber in recipients:
+            subscriber.offer(text)
+        self.published += 1
+
+    async def serve(self, websocket: WebSocket, authorize: Callable[[str], bool],
+                    initial_topics: Iterable[str] = (), snapshot: Optional[Callable[[str], Optional[Dict]]] = None):
+        """
+        Run an accepted connection until it closes. Clients send
+        {"action": "subscribe" | "unsubscribe", "topics": [...]}; topics the
+        caller may not watch are rejected with an error message.
+        """
+        subscriber = Subscriber(websocket)
+        self.subscribers.add(subscriber)
+        sender = asyncio.create_task(subscriber.send_loop())
+
+        def change(action: str, topics: Iterable[str]):
+            for topic in topics:
+                if action == "unsubscribe":
+                    self.unsubscribe(subscriber, topic)
+                    continue
+                if topic.split(":", 1)[0] not in TOPIC_PREFIXES or not authorize(topic):
+                    subscriber.offer(json.dumps({"type": "error", "topic": topic, "detail": "Cannot subscribe to topic"}))
+                    continue
+                self.subscribe(subscriber, topic)
+                current = snapshot(topic) if snapshot else None
+                if current:
+                    subscriber.offer(json.dumps(current, default=str))
+
+        try:
+            change("subscribe", initial_topics)
+            while True:
+                request = await websocket.receive_json()
+                action = request.get("action")
+                if action in ("subscribe", "unsubscribe"):
+                    change(action, request.get("topics") or [])
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        except Exception as e:
+            logger.warning(f"Live tracking connection closed: {e}")
+        finally:
+            sender.cancel()
+            for topic in list(subscriber.topics):
+                self.unsubscribe(subscriber, topic)
+            self.subscribers.discard(subscriber)
+
+    def stats(self) -> Dict:
+        return {
+            "connections": len(self.subscribers),
+            "topics": len(self.topics),
+            "published": self.published,
+            "dropped": sum(s.dropped for s in self.subscribers),
+        }
+
+live_tracker = LiveTracker()
@@ -1,10 +1,15 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, status, Query
+# Installed first so the startup profile sees every import below
+from .startup_profile import startup_profiler
+startup_profiler.start()
+
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, status, Query, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime, date, timedelta
 from enum import Enum
 import os
@@ -13,23 +18,45 @@ import tempfile
 import os
 import logging
 import json
-import math
+import time
+import asyncio
 from pathlib import Path
 from dotenv import load_dotenv
 from .excel_import import process_excel_files, process_customer_excel_files, process_route_excel_files
 from .google_sheets_import import process_google_sheets_data, test_google_sheets_connection
 from .quickbooks_integration import QuickBooksClient, map_arctic_customer_to_qb, map_arctic_order_to_qb_invoice, map_arctic_payment_to_qb
 from .weather_service import weather_service
+from .distance_matrix import haversine_distance, build_matrices, estimate_travel_seconds, METERS_PER_MILE
+from .route_heuristics import solve_heuristic
+from .google_maps import google_maps
+from .road_network import road_network
+from .route_optimizer import (
+    optimize_with_ortools, order_load, vehicle_capacity, VEHICLE_TYPE_CAPACITIES, customer_time_window, customer_service_seconds,
+    seconds_to_datetime, parse_time_of_day, ROUTE_DAY_START, ROUTE_DAY_END,
+    SolverTelemetry, recent_telemetry, clamp_time_limit
+)
+from .solution_cache import solution_cache, fingerprint, SOLVER_MODEL_VERSION
+from .geocoding import batch_geocoder, customer_address, needs_geocoding
+from .depot_assignment import assign_nearest_depots, ASSIGNMENT_MODES
+from .driver_assignment import assign_drivers
+from .scenario_planner import scenario_runner, MAX_SCENARIOS
+from .territory_planner import territory_planner, sheet_weekday, WEEKDAYS, DEFAULT_PLANNING_DAYS
+from .gps_ingestion import gps_ingestion
+from .breadcrumb_store import breadcrumb_store, douglas_peucker, track_miles, valid_driver_id
+from .eta_service import eta_service
+from .live_tracking import live_tracker
+from .geofencing import geofence_engine
+from .eta_model import eta_model, train_model, dwell_history, ETA_SOURCE
+from .demand_forecast import forecast_cache, series_id, reorder_point, forecast_engine, PRODUCT_FIELDS, SERVICE_LEVEL_Z
+from .holt_winters import forecast_series
+from .forecast_batch import forecast_batch, FORECAST_BATCH_ENABLED
 try:
     from .monitoring_service import router as monitoring_service
 except ImportError:
     monitoring_service = None
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from prophet import Prophet
-from sklearn.linear_model import LinearRegression
 import numpy as np
-import pandas as pd
 
 load_dotenv()
 
@@ -145,6 +172,7 @@ class Location(BaseModel):
     zip_code: str
     location_type: LocationType
     is_active: bool = True
+    coordinates: Optional[dict] = None
 
 class User(BaseModel):
     id: str
@@ -154,6 +182,9 @@ class User(BaseModel):
     role: UserRole
     location_id: str
     is_active: bool = True
+    shift_start: Optional[str] = None  # "HH:MM", drivers only
+    shift_end: Optional[str] = None
+    licensed_vehicle_types: Optional[List[VehicleType]] = None  # any vehicle if unset
 
 class UserInDB(User):
     hashed_password: str
@@ -184,6 +215,11 @@ class Customer(BaseModel):
     payment_terms: int = 30
     is_active: bool = True
     coordinates: Optional[dict] = None
+    delivery_window_start: Optional[str] = None  # "HH:MM" earliest accepted delivery
+    delivery_window_end: Optional[str] = None  # "HH:MM" latest accepted delivery
+    service_time_minutes: int = 15
+    visits_per_week: int = 1
+    delivery_days: Optional[List[str]] = None  # weekdays the customer accepts deliveries; any if unset
 
 class Product(BaseModel):
     id: str
@@ -198,6 +234,7 @@ class Vehicle(BaseModel):
     license_plate: str
     vehicle_type: VehicleType
     capacity_pallets: int
+    capacity_weight_lbs: Optional[int] = None  # defaults from the reefer type
     location_id: str
     is_active: bool = True
     last_maintenance: Optional[date] = None
@@ -206,6 +243,7 @@ class VehicleCreate(BaseModel):
     license_plate: str
     vehicle_type: VehicleType
     capacity_pallets: int
+    capacity_weight_lbs: Optional[int] = None  # defaults from the reefer type
     location_id: str
     is_active: bool = True
     last_maintenance: Optional[date] = None
@@ -242,6 +280,41 @@ class Order(BaseModel):
     payment_method: Optional[PaymentMethod] = None
     notes: Optional[str] = None
 
+class RouteReplanRequest(BaseModel):
+    location_id: str
+    add_order_ids: Optional[List[str]] = None  # defaults to all unrouted pending orders
+    remove_order_ids: List[str] = []
+    unavailable_vehicle_ids: List[str] = []
+    time_limit_seconds: float = 3
+
+class ScenarioVehicle(BaseModel):
+    location_id: str
+    vehicle_type: VehicleType
+    capacity_pallets: Optional[int] = None
+    capacity_weight_lbs: Optional[int] = None
+
+class ScenarioStopMove(BaseModel):
+    to_location_id: str
+    customer_ids: List[str] = []
+    city: Optional[str] = None  # every customer in this city
+
+class RouteScenario(BaseModel):
+    name: str
+    remove_vehicle_ids: List[str] = []
+    add_vehicles: List[ScenarioVehicle] = []
+    move_stops: List[ScenarioStopMove] = []
+
+class RouteScenarioRequest(BaseModel):
+    location_ids: List[str]
+    scenarios: List[RouteScenario]
+    include_baseline: bool = True
+    time_limit_seconds: float = 5
+
+class WeeklyPlanRequest(BaseModel):
+    location_id: str
+    days: List[str] = DEFAULT_PLANNING_DAYS
+    route_time_limit_seconds: Optional[float] = None
+
 class WorkOrder(BaseModel):
     id: str
     vehicle_id: str
@@ -347,28 +420,24 @@ class EmployeeCertification(BaseModel):
     blockchain_hash: Optional[str] = None
 
 def calculate_distance(addr1: str, addr2: str, coordinates1: Optional[dict] = None, coordinates2: Optional[dict] = None) -> float:
-    """Enhanced distance calculation using Google Maps API or haversine fallback"""
+    """Enhanced distance calculation using the local road network, Google Maps API or haversine fallback"""
     try:
-        import googlemaps
-        gmaps = googlemaps.Client(key=os.getenv('GOOGLE_MAPS_API_KEY', ''))
-
+        coordinates1 = coordinates1 or batch_geocoder.lookup(addr1)
+        coordinates2 = coordinates2 or batch_geocoder.lookup(addr2)
         if coordinates1 and coordinates2:
             origin = (coordinates1['lat'], coordinates1['lng'])
             destination = (coordinates2['lat'], coordinates2['lng'])
+            road_result = road_network.distance_matrix([origin], [destination])
+            if (0, 0) in road_result:
+                return road_result[(0, 0)][0] / METERS_PER_MILE
         else:
             origin = addr1
             destination = addr2
 
-        result = gmaps.distance_matrix(
-            origins=[origin],
-            destinations=[destination],
-            mode="driving",
-            units="imperial",
-            avoid="tolls"
-        )
+        result = google_maps.distance_matrix([origin], [destination], avoid="tolls")
 
-        if result['status'] == 'OK' and result['rows'][0]['elements'][0]['status'] == 'OK':
-            distance_miles = result['rows'][0]['elements'][0]['distance']['value'] * 0.000621371
+        if (0, 0) in result:
+            distance_miles = result[(0, 0)]['distance']['value'] * 0.000621371
             return distance_miles
         else:
             if coordinates1 and coordinates2:
@@ -390,229 +459,93 @@ def calculate_distance(addr1: str, addr2: str, coordinates1: Optional[dict] = No
             hash2 = hash(addr2) % 1000
             return abs(hash1 - hash2) / 10.0
 
-def haversine_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
-    """Calculate distance between two points using haversine formula"""
-    R = 3959  # Earth's radius in miles
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lng = math.radians(lng2 - lng1)
-
-    a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lng/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-
-    return R * c
-
 def geocode_address(address: str) -> Optional[dict]:
     """Geocode address using Google Maps API"""
+    cached = batch_geocoder.lookup(address)
+    if cached:
+        return cached
     try:
-        import googlemaps
-        gmaps = googlemaps.Client(key=os.getenv('GOOGLE_MAPS_API_KEY', ''))
-        result = gmaps.geocode(address)
-
-        if result:
-            location = result[0]['geometry']['location']
-            return {'lat': location['lat'], 'lng': location['lng']}
-        return None
+        return google_maps.geocode(address)
     except Exception as e:
         logging.warning(f"Geocoding failed for {address}: {e}")
         return None
 
-def optimize_route_ai(customers: List[dict], orders: List[dict], vehicle: dict, depot_address: str) -> List[dict]:
-    print(f"DEBUG AI: Starting optimization with {len(orders)} orders, {len(customers)} customers")
+def as_coordinate_tuple(coordinates) -> Optional[tuple]:
+    """Normalize stored coordinates ({"lat", "lng"} or [lat, lng]) to a (lat, lng) tuple"""
+    if not coordinates:
+        return None
+    if isinstance(coordinates, dict):
+        return (coordinates["lat"], coordinates["lng"])
+    return (coordinates[0], coordinates[1])
+
+DEFAULT_DEPOT_COORDINATES = (31.1391, -93.2044)
+
+def location_depot_coordinates(location_id: str) -> tuple:
+    """Depot coordinates of a branch, falling back to the Leesville plant"""
+    location = locations_db.get(location_id) or {}
+    return as_coordinate_tuple(location.get("coordinates")) or DEFAULT_DEPOT_COORDINATES
+
+def optimize_route_ai(customers: List[dict], orders: List[dict], vehicle: dict,
+                      depot_coordinates: tuple = DEFAULT_DEPOT_COORDINATES) -> List[dict]:
+    """
+    Fallback single-vehicle route builder: capacity-aware nearest neighbour on a
+    KD-tree followed by 2-opt/Or-opt, using stored customer coordinates only.
+    """
     if not orders:
-        print("DEBUG AI: No orders provided")
         return []
 
+    customers_by_id = {c["id"]: c for c in customers}
     stops = []
+    coordinates = [depot_coordinates]
     for order in orders:
-        customer = next((c for c in customers if c["id"] == order["customer_id"]), None)
-        if customer:
-            if "quantity" in order:
-                quantity_pallets = max(1, order["quantity"] // 50)
-                original_quantity = order["quantity"]
-            elif "items" in order and order["items"]:
-                total_quantity = sum(item.get("quantity", 1) for item in order["items"])
-                quantity_pallets = max(1, total_quantity // 50)
-                original_quantity = total_quantity
-            else:
-                quantity_pallets = 1
-                original_quantity = 1
-
-            stops.append({
-                "order_id": order["id"],
-                "customer_id": customer["id"],
-                "address": customer["address"],
-                "quantity": quantity_pallets,
-                "original_quantity": original_quantity,
-                "customer_name": customer["name"]
-            })
-            print(f"DEBUG AI: Added stop for customer {customer['name']} with {original_quantity} units = {quantity_pallets} pallets")
-        else:
-            print(f"DEBUG AI: No customer found for order {order['id']} with customer_id {order['customer_id']}")
+        customer = customers_by_id.get(order["customer_id"])
+        if not customer:
+            logger.debug(f"No customer found for order {order['id']} with customer_id {order['customer_id']}")
+            continue
+        position = as_coordinate_tuple(customer.get("coordinates"))
+        if position is None:
+            logger.debug(f"Skipping order {order['id']}: customer {customer['id']} is not geocoded")
+            continue
+        coordinates.append(position)
+        stops.append((order, customer))
 
-    print(f"DEBUG AI: Created {len(stops)} stops from orders")
     if not stops:
-        print("DEBUG AI: No stops created")
         return []
 
-    route_stops = []
-    remaining_stops = stops.copy()
-    current_location = depot_address
-    current_capacity = 0
-    vehicle_capacity = vehicle.get("capacity_pallets", 20)
-    print(f"DEBUG AI: Vehicle capacity: {vehicle_capacity} pallets")
-
-    remaining_stops.sort(key=lambda x: x["quantity"])
-    print(f"DEBUG AI: Sorted stops by pallet quantity: {[s['quantity'] for s in remaining_stops]}")
-
-    while remaining_stops:
-        best_stop = None
-        best_distance = float('inf')
-
-        for stop in remaining_stops:
-            if current_capacity + stop["quantity"] <= vehicle_capacity:
-                distance = calculate_distance(current_location, stop["address"])
-                if distance < best_distance:
-                    best_distance = distance
-                    best_stop = stop
-                    print(f"DEBUG AI: Stop {stop['customer_name']} ({stop['quantity']} pallets) fits in remaining capacity")
-            else:
-                print(f"DEBUG AI: Stop {stop['customer_name']} ({stop['quantity']} pallets) would exceed capacity (current: {current_capacity}, vehicle: {vehicle_capacity})")
-
-        if best_stop is None:
-            print(f"DEBUG AI: No more stops can fit in vehicle (current capacity: {current_capacity}/{vehicle_capacity} pallets)")
-            break
+    loads = [order_load(order, products_db) for order, _ in stops]
+    pallet_capacity, weight_capacity = vehicle_capacity(vehicle)
+    route = solve_heuristic(
+        coordinates, [0] + [pallets for pallets, _ in loads], [pallet_capacity],
+        weights=[0] + [weight for _, weight in loads], vehicle_weight_capacities=[weight_capacity]
+    )[0]
 
-        print(f"DEBUG AI: Adding stop {best_stop['customer_name']} to route")
+    now = datetime.now()
+    arrival = now
+    previous = 0
+    route_stops = []
+    for node in route:
+        order, customer = stops[node - 1]
+        (lat1, lng1), (lat2, lng2) = coordinates[previous], coordinates[node]
+        travel_meters = haversine_distance(lat1, lng1, lat2, lng2) * METERS_PER_MILE
+        arrival += timedelta(seconds=estimate_travel_seconds(travel_meters))
         route_stops.append({
             "id": str(uuid.uuid4()),
-            "order_id": best_stop["order_id"],
-            "customer_id": best_stop["customer_id"],
+            "order_id": order["id"],
+            "customer_id": customer["id"],
             "stop_number": len(route_stops) + 1,
-            "estimated_arrival": (datetime.now() + timedelta(hours=len(route_stops) * 0.5)).isoformat(),
+            "estimated_arrival": arrival.isoformat(),
             "status": "pending",
-            "customer_name": best_stop["customer_name"],
-            "address": best_stop["address"]
+            "customer_name": customer["name"],
+            "address": customer["address"],
+            "coordinates": coordinates[node],
+            "optimization_method": "nearest-neighbor"
         })
+        arrival += timedelta(seconds=customer_service_seconds(customer))
+        previous = node
 
-        current_location = best_stop["address"]
-        current_capacity += best_stop["quantity"]
-        remaining_stops.remove(best_stop)
-        print(f"DEBUG AI: Added stop {best_stop['customer_name']}, new capacity: {current_capacity}/{vehicle_capacity} pallets")
-
-    print(f"DEBUG AI: Final route has {len(route_stops)} stops")
+    logger.debug(f"Fallback heuristic routed {len(route_stops)} of {len(stops)} stops for vehicle {vehicle.get('id')}")
     return route_stops
 
-def optimize_with_ortools(locations, demands, coordinates, vehicle_capacity):
-    """Use Google OR-Tools for Vehicle Routing Problem optimization"""
-    try:
-        from ortools.constraint_solver import routing_enums_pb2
-        from ortools.constraint_solver import pywrapcp
-
-        distance_matrix = create_distance_matrix(coordinates)
-
-        manager = pywrapcp.RoutingIndexManager(len(locations), 1, 0)
-
-        routing = pywrapcp.RoutingModel(manager)
-
-        def distance_callback(from_index, to_index):
-            from_node = manager.IndexToNode(from_index)
-            to_node = manager.IndexToNode(to_index)
-            return distance_matrix[from_node][to_node]
-
-        transit_callback_index = routing.RegisterTransitCallback(distance_callback)
-        routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
-
-        def demand_callback(from_index):
-            from_node = manager.IndexToNode(from_index)
-            return demands[from_node]
-
-        demand_callback_index = routing.RegisterUnaryTransitCallback(demand_callback)
-        routing.AddDimensionWithVehicleCapacity(
-            demand_callback_index,
-            0,  # null capacity slack
-            [vehicle_capacity],  # vehicle maximum capacities
-            True,  # start cumul to zero
-            'Capacity'
-        )
-
-        search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-        search_parameters.first_solution_strategy = (
-            routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
-        )
-        search_parameters.local_search_metaheuristic = (
-            routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
-        )
-        search_parameters.time_limit.seconds = 10
-
-        solution = routing.SolveWithParameters(search_parameters)
-
-        if solution:
-            route = []
-            index = routing.Start(0)
-            while not routing.IsEnd(index):
-                node_index = manager.IndexToNode(index)
-                route.append(node_index)
-                index = solution.Value(routing.NextVar(index))
-
-            return route[1:]  # Remove depot from start
-
-        return None
-
-    except Exception as e:
-        logging.error(f"OR-Tools optimization error: {e}")
-        return None
-
-def create_distance_matrix(coordinates):
-    """Create distance matrix using Google Maps API or haversine fallback"""
-    size = len(coordinates)
-    matrix = [[0 for _ in range(size)] for _ in range(size)]
-
-    try:
-        import googlemaps
-        gmaps = googlemaps.Client(key=os.getenv('GOOGLE_MAPS_API_KEY', ''))
-
-        result = gmaps.distance_matrix(
-            origins=coordinates,
-            destinations=coordinates,
-            mode="driving",
-            units="imperial"
-        )
-
-        if result['status'] == 'OK':
-            for i in range(size):
-                for j in range(size):
-                    if i != j:
-                        element = result['rows'][i]['elements'][j]
-                        if element['status'] == 'OK':
-                            matrix[i][j] = int(element['distance']['value'])
-                        else:
-                            lat1, lng1 = coordinates[i]
-                            lat2, lng2 = coordinates[j]
-                            distance_miles = haversine_distance(lat1, lng1, lat2, lng2)
-                            matrix[i][j] = int(distance_miles * 1609.34)  # Convert to meters
-        else:
-            for i in range(size):
-                for j in range(size):
-                    if i != j:
-                        lat1, lng1 = coordinates[i]
-                        lat2, lng2 = coordinates[j]
-                        distance_miles = haversine_distance(lat1, lng1, lat2, lng2)
-                        matrix[i][j] = int(distance_miles * 1609.34)  # Convert to meters
-
-    except Exception as e:
-        logging.warning(f"Distance matrix API failed: {e}")
-        for i in range(size):
-            for j in range(size):
-                if i != j:
-                    lat1, lng1 = coordinates[i]
-                    lat2, lng2 = coordinates[j]
-                    distance_miles = haversine_distance(lat1, lng1, lat2, lng2)
-                    matrix[i][j] = int(distance_miles * 1609.34)  # Convert to meters
-
-    return matrix
-
     receipt_url: Optional[str] = None
 
 users_db = {}
@@ -627,6 +560,7 @@ work_orders_db = {}
 production_entries_db = {}
 expenses_db = {}
 customer_pricing_db = {}
+forecasts_db = {}  # series id ("loc_1" or "loc_1:8lb") -> batch forecast row
 driver_locations = {}
 quickbooks_connection = None
 training_modules_db = {}
@@ -654,6 +588,7 @@ FINANCIAL_FILE = DATA_DIR / "financial.json"
 WORK_ORDERS_FILE = DATA_DIR / "work_orders.json"
 PRODUCTION_FILE = DATA_DIR / "production.json"
 EXPENSES_FILE = DATA_DIR / "expenses.json"
+FORECASTS_FILE = DATA_DIR / "forecasts.json"
 
 def save_data_to_disk():
     """Save all data to disk for persistence"""
@@ -693,6 +628,8 @@ def save_data_to_disk():
             json.dump(production_entries_db, f, indent=2, default=str)
         with open(EXPENSES_FILE, 'w') as f:
             json.dump(expenses_db, f, indent=2, default=str)
+        with open(FORECASTS_FILE, 'w') as f:
+            json.dump(forecasts_db, f, default=str)
         print(f"Saved data: {len(imported_customers)} customers, {len(imported_orders)} orders")
     except Exception as e:
         print(f"Error saving data: {e}")
@@ -700,7 +637,7 @@ def save_data_to_disk():
 def load_data_from_disk():
     """Load all data from disk on startup"""
     global imported_customers, imported_orders, imported_financial_data
-    global work_orders_db, production_entries_db, expenses_db
+    global work_orders_db, production_entries_db, expenses_db, forecasts_db
 
     try:
         if CUSTOMERS_FILE.exists():
@@ -727,6 +664,9 @@ def load_data_from_disk():
         if EXPENSES_FILE.exists():
             with open(EXPENSES_FILE, 'r') as f:
                 expenses_db = json.load(f)
+        if FORECASTS_FILE.exists():
+            with open(FORECASTS_FILE, 'r') as f:
+                forecasts_db = json.load(f)
         print(f"Loaded data: {len(imported_customers)} customers, {len(imported_orders)} orders")
     except Exception as e:
         print(f"Error loading data: {e}")
@@ -734,10 +674,92 @@ def load_data_from_disk():
         imported_orders = []
         imported_financial_data = {}
 
-load_data_from_disk()
+with startup_profiler.phase("load_data"):
+    load_data_from_disk()
 
-# In-memory storage for current driver locations
-driver_locations = {}
+DEPOT_ASSIGNMENT_MODE = os.getenv("DEPOT_ASSIGNMENT_MODE", "distance")
+
+def assign_customer_depots(customers: List[dict], mode: str = DEPOT_ASSIGNMENT_MODE) -> dict:
+    """
+    Move geocoded customers to their nearest branch depot (addresses already in
+    the geocode cache are resolved first) and keep their orders' location in step.
+    """
+    started = time.perf_counter()
+    for customer in customers:
+        if needs_geocoding(customer):
+            cached = batch_geocoder.lookup(customer_address(customer))
+            if cached:
+                customer["coordinates"] = dict(cached)
+    depots = {
+        loc_id: location_depot_coordinates(loc_id)
+        for loc_id, loc in locations_db.items()
+        if loc.get("is_active", True) and as_coordinate_tuple(loc.get("coordinates"))
+    }
+    previous = {c["id"]: c.get("location_id") for c in customers if c.get("id")}
+    result = assign_nearest_depots(customers, depots, mode)
+    moved = {c["id"]: c["location_id"] for c in customers if c.get("id") and previous.get(c["id"]) != c.get("location_id")}
+    if moved:
+        for order in list(orders_db.values()) + imported_orders:
+            if order.get("customer_id") in moved and "location_id" in order:
+                order["location_id"] = moved[order["customer_id"]]
+    result["mode"] = mode
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+# The event loop serving requests; background threads hand changes to shared state to it
+main_loop: Optional[asyncio.AbstractEventLoop] = None
+
+@app.on_event("startup")
+async def remember_event_loop():
+    global main_loop
+    main_loop = asyncio.get_running_loop()
+
+def on_event_loop(callback):
+    """Run callback on the event loop, where handlers read and save the in-memory data; directly before it starts"""
+    if main_loop is not None and main_loop.is_running():
+        main_loop.call_soon_threadsafe(callback)
+    else:
+        callback()
+
+def start_geocoding(customers: List[dict], source: str, assign_depots: bool = False):
+    """
+    Geocode customers without coordinates in the background, persisting once
+    when done. For imports (assign_depots) each customer's branch is then set
+    from its coordinates: straight away when the address is cached, otherwise
+    when the job finishes.
+    """
+    if assign_depots:
+        assignment = assign_customer_depots(customers)
+        print(f"DEBUG: Assigned {assignment['assigned']} {source} customers to their nearest depot ({assignment['changed']} moved)")
+
+    def persist_customers():
+        if assign_depots:
+            assign_customer_depots(customers)
+        save_data_to_disk()
+
+    # The job finishes on the geocoder thread; depots and the save run on the event loop
+    job = batch_geocoder.submit(customers, source, lambda: on_event_loop(persist_customers), assign_depots=assign_depots)
+    if job.total:
+        print(f"DEBUG: Geocoding job {job.id} started for {job.total} customers from {source}")
+    elif assign_depots and assignment["changed"]:
+        save_data_to_disk()
+    return job
+
+def resume_geocoding():
+    """Pick up geocoding jobs that were interrupted by a restart"""
+    for job in batch_geocoder.unfinished_jobs():
+        start_geocoding(
+            imported_customers + list(customers_db.values()),
+            job.get("source", "resume"),
+            assign_depots=job.get("assign_depots", False)
+        )
+
+with startup_profiler.phase("resume_geocoding"):
+    resume_geocoding()
+
+# Latest position per driver, kept by the GPS ingestion pipeline
+driver_locations = gps_ingestion.latest
+gps_ingestion.persist_state = save_data_to_disk
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -813,6 +835,8 @@ def import_route_json_data():
     import os
 
     customers_imported = []
+    # Weekdays each customer appears on in the route sheets, i.e. their visit frequency
+    route_days = {}
 
     lake_charles_file = "lake_charles_routes.json"
     if os.path.exists(lake_charles_file):
@@ -827,6 +851,7 @@ def import_route_json_data():
                         customer_name = route[0]
                         if customer_name not in ['Customer', 'CUSTOMER', 'LAKE CHARLES ROUTE SHEET-SMITTY-CHURCHPOINT']:
                             customer_names.add(customer_name)
+                            route_days.setdefault(customer_name, set()).add(sheet_weekday(day))
 
         for i, name in enumerate(sorted(customer_names), 1):
             customer_id = f"lc_route_{i:03d}"
@@ -843,7 +868,8 @@ def import_route_json_data():
                 "location_id": "loc_2",
                 "is_active": True,
                 "credit_limit": 10000.0,
-                "payment_terms": "Net 30"
+                "payment_terms": "Net 30",
+                "visits_per_week": len(route_days[name] - {None}) or 1
             }
             customers_imported.append(customer)
 
@@ -860,6 +886,7 @@ def import_route_json_data():
                         customer_name = route[0]
                         if customer_name not in ['Customer', 'CUSTOMER', 'LAKE CHARLES ROUTE SHEET-SMITTY-CHURCHPOINT']:
                             customer_names.add(customer_name)
+                            route_days.setdefault(customer_name, set()).add(sheet_weekday(day))
 
         existing_count = len(customers_imported)
         for i, name in enumerate(sorted(customer_names), existing_count + 1):
@@ -877,7 +904,8 @@ def import_route_json_data():
                 "location_id": "loc_2",
                 "is_active": True,
                 "credit_limit": 10000.0,
-                "payment_terms": "Net 30"
+                "payment_terms": "Net 30",
+                "visits_per_week": len(route_days[name] - {None}) or 1
             }
             customers_imported.append(customer)
 
@@ -926,7 +954,8 @@ def initialize_sample_data():
             city="Leesville",
             state="Louisiana",
             zip_code="71446",
-            location_type=LocationType.HEADQUARTERS
+            location_type=LocationType.HEADQUARTERS,
+            coordinates={"lat": 31.1435, "lng": -93.2610}
         ),
         Location(
             id="loc_2",
@@ -935,7 +964,8 @@ def initialize_sample_data():
             city="Lake Charles",
             state="Louisiana",
             zip_code="70601",
-            location_type=LocationType.DISTRIBUTION
+            location_type=LocationType.DISTRIBUTION,
+            coordinates={"lat": 30.2266, "lng": -93.2174}
         ),
         Location(
             id="loc_3",
@@ -944,7 +974,8 @@ def initialize_sample_data():
             city="Lufkin",
             state="Texas",
             zip_code="75901",
-            location_type=LocationType.DISTRIBUTION
+            location_type=LocationType.DISTRIBUTION,
+            coordinates={"lat": 31.3382, "lng": -94.7291}
         ),
         Location(
             id="loc_4",
@@ -953,7 +984,8 @@ def initialize_sample_data():
             city="Jasper",
             state="Texas",
             zip_code="75951",
-            location_type=LocationType.WAREHOUSE
+            location_type=LocationType.WAREHOUSE,
+            coordinates={"lat": 30.9202, "lng": -93.9966}
         )
     ]
 
@@ -1831,7 +1863,8 @@ def initialize_sample_data():
     print(f"DEBUG: Final counts - customers_db: {len(customers_db)}, orders_db: {len(orders_db)}, routes_db: {len(routes_db)}")
     print(f"DEBUG: Final counts - imported_customers: {len(imported_customers)}, imported_orders: {len(imported_orders)}")
 
-initialize_sample_data()
+with startup_profiler.phase("sample_data"):
+    initialize_sample_data()
 
 training_modules_db = {
     "ice-handling-safety": {
@@ -1909,6 +1942,17 @@ async def get_current_user_info(current_user: UserInDB = Depends(get_current_use
 async def healthz():
     return {"status": "ok"}
 
+@app.on_event("startup")
+def report_startup_profile():
+    startup_profiler.finish()
+
+@app.get("/api/system/startup-profile")
+async def get_startup_profile(top: int = 15, current_user: UserInDB = Depends(get_current_user)):
+    """Boot time, per-package and per-module import times, and which optional dependencies are loaded"""
+    if current_user.role != UserRole.MANAGER:
+        raise HTTPException(status_code=403, detail="Manager access required")
+    return startup_profiler.report(top=max(1, min(top, 200)))
+
 @app.get("/api/users")
 async def get_users(role: Optional[str] = None, current_user: UserInDB = Depends(get_current_user)):
     if current_user.role != UserRole.MANAGER:
@@ -1937,6 +1981,9 @@ async def create_user(user_data: dict, current_user: UserInDB = Depends(get_curr
         "role": user_data["role"],
         "location_id": user_data["location_id"],
         "is_active": user_data.get("is_active", True),
+        "shift_start": user_data.get("shift_start"),
+        "shift_end": user_data.get("shift_end"),
+        "licensed_vehicle_types": user_data.get("licensed_vehicle_types"),
         "hashed_password": get_password_hash(user_data["password"])
     }
 
@@ -2820,9 +2867,14 @@ async def get_location_performance(
 async def import_excel_data(
     files: List[UploadFile] = File(...),
     location_id: str = Form("loc_3"),
+    assign_depots: bool = Form(False),
     current_user: UserInDB = Depends(get_current_user)
 ):
-    """Import historical sales data from Excel files with location mapping"""
+    """
+    Import historical sales data from Excel files with location mapping.
+    Customers stay at location_id unless assign_depots moves each one to its
+    nearest branch once geocoded.
+    """
     global imported_customers, imported_orders, imported_financial_data
 
     if not files:
@@ -2861,10 +2913,12 @@ async def import_excel_data(
         imported_financial_data = processed_data["financial_metrics"]
 
         save_data_to_disk()
+        geocoding_job = start_geocoding(imported_customers, "excel_import", assign_depots=assign_depots)
 
         return {
             "success": True,
             "message": f"Excel data imported successfully for {location_name}",
+            "geocoding_job": geocoding_job.to_dict(),
             "summary": {
                 "customers_imported": len(imported_customers),
                 "orders_imported": len(imported_orders),
@@ -2893,9 +2947,14 @@ async def import_excel_data(
 async def import_order_sheet_data(
     files: List[UploadFile] = File(...),
     location_id: str = Form("loc_3"),
+    assign_depots: bool = Form(False),
     current_user: UserInDB = Depends(get_current_user)
 ):
-    """Import order sheet data from Excel files"""
+    """
+    Import order sheet data from Excel files.
+    Customers stay at location_id unless assign_depots moves each one to its
+    nearest branch once geocoded.
+    """
     global customers_db, orders_db
 
     if not files:
@@ -2924,10 +2983,12 @@ async def import_order_sheet_data(
             orders_db[order["id"]] = order
 
         save_data_to_disk()
+        geocoding_job = start_geocoding(processed_data["customers"], "order_sheet_import", assign_depots=assign_depots)
 
         return {
             "success": True,
             "message": f"Order sheet imported successfully",
+            "geocoding_job": geocoding_job.to_dict(),
             "summary": {
                 "customers_imported": processed_data["customers_imported"],
                 "orders_imported": processed_data["orders_imported"],
@@ -2957,14 +3018,58 @@ async def get_import_status(current_user: UserInDB = Depends(get_current_user)):
         "date_range": imported_financial_data.get("date_range") if imported_financial_data else None
     }
 
+@app.get("/api/geocoding/jobs")
+async def get_geocoding_jobs(current_user: UserInDB = Depends(get_current_user)):
+    """Background geocoding jobs started by imports, newest first"""
+    jobs = sorted(batch_geocoder.jobs.values(), key=lambda job: job.created_at, reverse=True)
+    return {"jobs": [job.to_dict() for job in jobs]}
+
+@app.get("/api/geocoding/jobs/{job_id}")
+async def get_geocoding_job(job_id: str, current_user: UserInDB = Depends(get_current_user)):
+    job = batch_geocoder.jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Geocoding job not found")
+    return job.to_dict()
+
+@app.post("/api/customers/assign-depots")
+async def assign_depots(mode: str = DEPOT_ASSIGNMENT_MODE, location_id: Optional[str] = None,
+                        current_user: UserInDB = Depends(get_current_user)):
+    """Re-assign every geocoded customer (optionally only one branch's) to its nearest depot"""
+    if current_user.role != UserRole.MANAGER:
+        raise HTTPException(status_code=403, detail="Only managers can re-assign customer branches")
+    if mode not in ASSIGNMENT_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {list(ASSIGNMENT_MODES)}")
+    customers = list({id(c): c for c in imported_customers + list(customers_db.values())}.values())
+    if location_id:
+        customers = [c for c in customers if c.get("location_id") == location_id]
+    result = await run_in_threadpool(assign_customer_depots, customers, mode)
+    if result["changed"]:
+        save_data_to_disk()
+    return result
+
+@app.post("/api/geocoding/run")
+async def run_geocoding(location_id: Optional[str] = None, current_user: UserInDB = Depends(get_current_user)):
+    """Geocode every customer (optionally for one location) that still has no coordinates"""
+    if current_user.role not in [UserRole.MANAGER, UserRole.DISPATCHER]:
+        raise HTTPException(status_code=403, detail="Only managers and dispatchers can run geocoding")
+    customers = imported_customers + list(customers_db.values())
+    if location_id:
+        customers = [c for c in customers if c.get("location_id") == location_id]
+    return start_geocoding(customers, "manual").to_dict()
+
 @app.post("/api/import/google-sheets")
 async def import_google_sheets_data(
     sheets_url: str = Form(...),
     location_id: str = Form("loc_3"),
     worksheet_name: str = Form(None),
+    assign_depots: bool = Form(False),
     current_user: UserInDB = Depends(get_current_user)
 ):
-    """Import customer data from Google Sheets with location mapping"""
+    """
+    Import customer data from Google Sheets with location mapping.
+    Customers stay at location_id unless assign_depots moves each one to its
+    nearest branch once geocoded.
+    """
     global imported_customers, imported_orders, imported_financial_data
 
     if not sheets_url:
@@ -2990,10 +3095,12 @@ async def import_google_sheets_data(
         imported_financial_data = processed_data["financial_metrics"]
 
         save_data_to_disk()
+        geocoding_job = start_geocoding(imported_customers, "google_sheets_import", assign_depots=assign_depots)
 
         return {
             "success": True,
             "message": f"Google Sheets data imported successfully for {location_name}",
+            "geocoding_job": geocoding_job.to_dict(),
             "summary": {
                 "customers_imported": len(imported_customers),
                 "orders_imported": len(imported_orders),
@@ -3016,9 +3123,14 @@ async def import_google_sheets_data(
 async def bulk_import_customers_excel(
     files: List[UploadFile] = File(...),
     location_id: str = Form("loc_3"),
+    assign_depots: bool = Form(False),
     current_user: UserInDB = Depends(get_current_user)
 ):
-    """Bulk import customers from Excel files and add to customers database"""
+    """
+    Bulk import customers from Excel files and add to customers database.
+    Customers stay at location_id unless assign_depots moves each one to its
+    nearest branch once geocoded.
+    """
     global customers_db
 
     if not files:
@@ -3057,6 +3169,7 @@ async def bulk_import_customers_excel(
 
         # Add customers to customers_db instead of imported_customers
         customers_imported = 0
+        new_customers = []
         for customer_data in processed_data["customers"]:
             customer_id = str(uuid.uuid4())
             customer_record = {
@@ -3075,13 +3188,16 @@ async def bulk_import_customers_excel(
                 "is_active": True
             }
             customers_db[customer_id] = customer_record
+            new_customers.append(customer_record)
             customers_imported += 1
 
         save_data_to_disk()
+        geocoding_job = start_geocoding(new_customers, "bulk_customer_import", assign_depots=assign_depots)
 
         return {
             "success": True,
             "message": f"Customers imported successfully to {location_name}",
+            "geocoding_job": geocoding_job.to_dict(),
             "summary": {
                 "customers_imported": customers_imported,
                 "total_records": processed_data["total_records"],
@@ -3137,6 +3253,7 @@ async def bulk_import_routes(
 
         for route in result["routes"]:
             routes_db[route["id"]] = route
+        auto_assign_drivers(result["routes"])
 
         save_data_to_disk()
 
@@ -3156,9 +3273,14 @@ async def bulk_import_customers_sheets(
     sheets_url: str = Form(...),
     location_id: str = Form("loc_3"),
     worksheet_name: str = Form(None),
+    assign_depots: bool = Form(False),
     current_user: UserInDB = Depends(get_current_user)
 ):
-    """Bulk import customers from Google Sheets and add to customers database"""
+    """
+    Bulk import customers from Google Sheets and add to customers database.
+    Customers stay at location_id unless assign_depots moves each one to its
+    nearest branch once geocoded.
+    """
     global customers_db
 
     if not sheets_url:
@@ -3185,6 +3307,7 @@ async def bulk_import_customers_sheets(
 
         # Add customers to customers_db instead of imported_customers
         customers_imported = 0
+        new_customers = []
         for customer_data in processed_data["customers"]:
             customer_id = str(uuid.uuid4())
             customer_record = {
@@ -3203,13 +3326,16 @@ async def bulk_import_customers_sheets(
                 "is_active": True
             }
             customers_db[customer_id] = customer_record
+            new_customers.append(customer_record)
             customers_imported += 1
 
         save_data_to_disk()
+        geocoding_job = start_geocoding(new_customers, "bulk_customer_import", assign_depots=assign_depots)
 
         return {
             "success": True,
             "message": f"Customers imported successfully to {location_name}",
+            "geocoding_job": geocoding_job.to_dict(),
             "summary": {
                 "customers_imported": customers_imported,
                 "total_records": processed_data["total_records"],
@@ -3324,26 +3450,63 @@ async def create_production_entry(entry_data: ProductionEntryCreate, current_use
     entry_dict = entry.dict()
     production_entries_db[entry.id] = entry_dict
     save_data_to_disk()
+    forecast_cache.invalidate(entry.location_id)
     return entry
 
+def production_history(location_id: str) -> List[dict]:
+    return [e for e in production_entries_db.values() if e.get("location_id") == location_id]
+
+forecast_cache.history_source = production_history
+
+def store_batch_forecasts(rows: List[dict]):
+    """
+    Replace forecast rows written by the nightly batch and persist only the
+    forecasts table. This runs on the batch thread, so the updated table is
+    built aside and swapped in with one assignment while requests iterate it.
+    """
+    global forecasts_db
+    updated = {**forecasts_db, **{row["id"]: row for row in rows}}
+    forecasts_db = updated
+    try:
+        with open(FORECASTS_FILE, 'w') as f:
+            json.dump(updated, f, default=str)
+    except OSError as e:
+        logger.error(f"Could not save forecasts: {e}")
+
+forecast_batch.entries_source = lambda: list(production_entries_db.values())
+forecast_batch.rows_source = lambda: forecasts_db
+forecast_batch.on_complete = store_batch_forecasts
+
+@app.on_event("startup")
+def schedule_forecast_batch():
+    if FORECAST_BATCH_ENABLED:
+        forecast_batch.start_scheduler()
+
 @app.get("/api/inventory/forecast/{location_id}")
 async def forecast_inventory(
     location_id: str,
     days: int = 7,
+    product: str = "total",
     current_user: UserInDB = Depends(get_current_user)
 ):
     """
-    Returns AI-powered demand predictions for ice production using Prophet.
-    Integrates with existing production data structures.
+    Returns AI-powered demand predictions for ice production using Prophet or
+    Holt-Winters (FORECAST_ENGINE). Integrates with existing production data
+    structures. Forecasts come from the nightly batch when it has covered the
+    current data, otherwise from the on-demand model cache.
     """
+    if product not in PRODUCT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"product must be one of {', '.join(PRODUCT_FIELDS)}")
+    field = PRODUCT_FIELDS[product]
     try:
-        entries = [e for e in production_entries_db.values() if e.get("location_id") == location_id]
+        entries = production_history(location_id)
 
         if len(entries) < 7:
             if entries:
-                avg_total = sum(e.get("total_pallets", 0) for e in entries) / len(entries)
+                avg_total = sum(e.get(field, 0) for e in entries) / len(entries)
                 return {
                     "location_id": location_id,
+                    "product": product,
                     "forecast": [
                         {
                             "ds": (date.today() + timedelta(days=i)).isoformat(),
@@ -3359,6 +3522,7 @@ async def forecast_inventory(
             else:
                 return {
                     "location_id": location_id,
+                    "product": product,
                     "forecast": [
                         {
                             "ds": (date.today() + timedelta(days=i)).isoformat(),
@@ -3372,55 +3536,62 @@ async def forecast_inventory(
                     "method": "default"
                 }
 
-        df_data = []
-        for entry in entries:
-            entry_date = entry.get("date")
-            if isinstance(entry_date, str):
-                entry_date = datetime.fromisoformat(entry_date).date()
-            df_data.append({
-                "ds": entry_date,
-                "y": entry.get("total_pallets", 0)
-            })
-
-        df = pd.DataFrame(df_data)
-        df = df.groupby("ds")["y"].sum().reset_index()  # Aggregate by date
-        df["ds"] = pd.to_datetime(df["ds"])
-
-        model = Prophet(
-            daily_seasonality=True,
-            weekly_seasonality=True,
-            yearly_seasonality=False,
-            interval_width=0.8
-        )
-        model.fit(df)
+        series = series_id(location_id, product)
+        row = forecasts_db.get(series)
+        if row and row["version"] == forecast_cache.current_version(series) and days <= len(row["forecast"]):
+            return {
+                "location_id": location_id,
+                "product": product,
+                "forecast": row["forecast"][:days],
+                "reorder_point": row["reorder_point"],
+                "method": row["method"],
+                "historical_avg": row["historical_avg"],
+                "safety_stock": row["safety_stock"],
+                "model_version": row["version"],
+                "model_fitted_at": row["generated_at"],
+                "stale": False,
+                "source": "batch"
+            }
 
-        future = model.make_future_dataframe(periods=days)
-        forecast = model.predict(future)
+        totals = forecast_cache.totals(series)
+        if forecast_engine(len(totals)) == "holt_winters":
+            result = (await run_in_threadpool(forecast_series, [totals], days))[0]
+            return {
+                "location_id": location_id,
+                "product": product,
+                "forecast": result["forecast"],
+                "reorder_point": round(reorder_point(result["avg_demand"], result["std_demand"], product), 0),
+                "method": "holt_winters",
+                "historical_avg": round(result["avg_demand"], 1),
+                "safety_stock": round(SERVICE_LEVEL_Z * result["std_demand"], 1),
+                "model_version": forecast_cache.current_version(series),
+                "stale": False,
+                "source": "on_demand"
+            }
 
-        future_forecast = forecast.tail(days)
+        fitted = forecast_cache.get(series)
+        if fitted is None:
+            # Not covered by the batch yet; later requests come from the cache
+            fitted = await run_in_threadpool(forecast_cache.refit, series)
+        forecast_rows = await run_in_threadpool(fitted.rows, days)
 
         # Calculate reorder point using safety stock formula
-        historical_demand = df["y"].values.astype(float)
-        avg_demand = float(np.mean(historical_demand))
-        std_demand = float(np.std(historical_demand))
-        safety_stock = 1.65 * std_demand  # 95% service level
-        reorder_point = max(avg_demand + safety_stock, 50)  # Minimum 50 pallets
+        avg_demand = fitted.avg_demand
+        std_demand = fitted.std_demand
+        safety_stock = SERVICE_LEVEL_Z * std_demand
 
         return {
             "location_id": location_id,
-            "forecast": [
-                {
-                    "ds": row["ds"].strftime("%Y-%m-%d"),
-                    "yhat": max(0, row["yhat"]),
-                    "yhat_lower": max(0, row["yhat_lower"]),
-                    "yhat_upper": max(0, row["yhat_upper"])
-                }
-                for _, row in future_forecast.iterrows()
-            ],
-            "reorder_point": round(reorder_point, 0),
+            "product": product,
+            "forecast": forecast_rows,
+            "reorder_point": round(reorder_point(avg_demand, std_demand, product), 0),
             "method": "prophet",
             "historical_avg": round(avg_demand, 1),
-            "safety_stock": round(safety_stock, 1)
+            "safety_stock": round(safety_stock, 1),
+            "model_version": fitted.version,
+            "model_fitted_at": fitted.fitted_at,
+            "stale": not forecast_cache.is_fresh(fitted),
+            "source": "on_demand"
         }
 
     except Exception as e:
@@ -3442,6 +3613,24 @@ async def forecast_inventory(
             "error": str(e)
         }
 
+@app.get("/api/inventory/forecasts")
+async def list_forecasts(location_id: Optional[str] = None, current_user: UserInDB = Depends(get_current_user)):
+    """Forecast rows and reorder points from the nightly batch"""
+    rows = list(forecasts_db.values())
+    if current_user.role != UserRole.MANAGER:
+        rows = [r for r in rows if r["location_id"] == current_user.location_id]
+    if location_id:
+        rows = [r for r in rows if r["location_id"] == location_id]
+    return {"forecasts": rows, "batch": {"running": forecast_batch.running, "last_run": forecast_batch.last_run}}
+
+@app.post("/api/inventory/forecasts/run")
+async def run_forecast_batch(force: bool = False, current_user: UserInDB = Depends(get_current_user)):
+    """Start the forecast batch now instead of waiting for the night"""
+    if current_user.role != UserRole.MANAGER:
+        raise HTTPException(status_code=403, detail="Only managers can run the forecast batch")
+    started = forecast_batch.run_in_background(force)
+    return {"started": started, "running": forecast_batch.running, "last_run": forecast_batch.last_run}
+
 @app.get("/api/expenses")
 async def get_expenses(location_id: Optional[str] = None, current_user: UserInDB = Depends(get_current_user)):
     expenses = list(expenses_db.values())
@@ -3530,11 +3719,82 @@ async def get_routes(location_id: Optional[str] = None, current_user: UserInDB =
         routes = [r for r in routes if r["location_id"] == location_id]
     return filter_by_location(routes, current_user)
 
-@app.post("/api/routes/optimize")
-async def optimize_routes(location_id: str, current_user: UserInDB = Depends(get_current_user)):
-    if current_user.role not in [UserRole.MANAGER, UserRole.DISPATCHER]:
-        raise HTTPException(status_code=403, detail="Only managers and dispatchers can optimize routes")
+def build_route_stop(order: dict, customer: dict, coordinates: tuple) -> dict:
+    """Create a pending route stop for an order"""
+    window_start, window_end = customer_time_window(customer)
+    return {
+        "id": str(uuid.uuid4()),
+        "order_id": order["id"],
+        "customer_id": customer["id"],
+        "stop_number": 0,
+        "estimated_arrival": None,
+        "delivery_window": {
+            "start": seconds_to_datetime(window_start).strftime("%H:%M"),
+            "end": seconds_to_datetime(window_end).strftime("%H:%M")
+        },
+        "service_time_minutes": customer_service_seconds(customer) // 60,
+        "status": "pending",
+        "customer_name": customer["name"],
+        "address": customer["address"],
+        "coordinates": coordinates,
+        "optimization_method": "OR-Tools"
+    }
+
+def create_optimized_route(vehicle: dict, location_id: str, route_stops: List[dict], estimated_duration_hours: float,
+                           route_date: Optional[date] = None) -> dict:
+    """Store an optimized route and mark its orders as assigned"""
+    route_date = route_date or date.today()
+    route_id = str(uuid.uuid4())
+    route = {
+        "id": route_id,
+        "name": f"Route {vehicle['license_plate']}-{route_date.strftime('%m%d')}",
+        "driver_id": None,
+        "vehicle_id": vehicle["id"],
+        "location_id": location_id,
+        "date": str(route_date),
+        "estimated_duration_hours": estimated_duration_hours,
+        "status": "planned",
+        "created_at": datetime.now().isoformat(),
+        "stops": route_stops
+    }
 
+    for stop in route_stops:
+        stop["route_id"] = route_id
+
+    routes_db[route_id] = route
+
+    for stop in route_stops:
+        if stop["order_id"] in orders_db:
+            orders_db[stop["order_id"]]["status"] = "assigned"
+            orders_db[stop["order_id"]]["route_id"] = route_id
+
+    return route
+
+def auto_assign_drivers(routes: List[dict], allow_cross_branch: bool = False) -> dict:
+    """Give driverless routes a driver, balancing weekly hours; routes are updated in place"""
+    routes = [r for r in routes if not r.get("driver_id")]
+    if not routes:
+        return {"assigned": 0, "unassigned": {}}
+    route_ids = {r["id"] for r in routes}
+    drivers = [u for u in users_db.values() if u.get("role") == UserRole.DRIVER and u.get("is_active", True)]
+    booked = [r for r in routes_db.values() if r.get("driver_id") and r["id"] not in route_ids]
+    assignments, unassigned = assign_drivers(routes, drivers, vehicles_db, booked, allow_cross_branch)
+    for route in routes:
+        if route["id"] in assignments:
+            route["driver_id"] = assignments[route["id"]]
+    return {"assigned": len(assignments), "unassigned": unassigned}
+
+def build_optimization_problem(location_id: str) -> Optional[dict]:
+    """Collect the pending orders, vehicles and solver inputs for a location; None if nothing to route"""
+    return build_routing_problem([location_id], location_id)
+
+def build_routing_problem(location_ids: List[str], problem_id: str, all_depots: bool = False) -> Optional[dict]:
+    """
+    Solver inputs for the pending orders of one or more branches. There is one
+    depot node per branch with available vehicles (per branch if all_depots),
+    nodes 0..depots-1, followed by one node per routable order; vehicles start
+    and end at their own depot.
+    """
     orders = list(orders_db.values())
     pending_orders = [o for o in orders if o["status"] == "pending"]
     print(f"DEBUG: Total orders: {len(orders)}, Pending orders: {len(pending_orders)}")
@@ -3543,117 +3803,945 @@ async def optimize_routes(location_id: str, current_user: UserInDB = Depends(get
         customers = imported_customers
     else:
         customers = list(customers_db.values())
-    location_customers = [c for c in customers if c["location_id"] == location_id]
-    location_orders = [o for o in pending_orders if any(c["id"] == o["customer_id"] for c in location_customers)]
+    location_customers = [c for c in customers if c["location_id"] in location_ids]
+    customers_by_id = {c["id"]: c for c in location_customers}
+    location_orders = [o for o in pending_orders if o["customer_id"] in customers_by_id]
     print(f"DEBUG: Location customers: {len(location_customers)}, Location orders: {len(location_orders)}")
     print(f"DEBUG: Location orders: {[o['id'] for o in location_orders]}")
 
     if not location_orders:
-        return {"message": "No pending orders found for optimization", "routes": []}
+        return None
 
     vehicles = list(vehicles_db.values())
-    available_vehicles = [v for v in vehicles if v["location_id"] == location_id and v["is_active"]]
+    available_vehicles = [v for v in vehicles if v["location_id"] in location_ids and v["is_active"]]
     print(f"DEBUG: Available vehicles: {len(available_vehicles)}")
     print(f"DEBUG: Vehicle IDs: {[v['id'] for v in available_vehicles]}")
 
     if not available_vehicles:
         raise HTTPException(status_code=400, detail="No available vehicles for route optimization")
 
-    location = locations_db.get(location_id)
-    depot_address = location["address"] if location else "123 Ice Plant Rd, Leesville, LA"
+    depot_locations = list(dict.fromkeys(
+        list(location_ids if all_depots else []) + [v["location_id"] for v in available_vehicles]
+    ))
+    depot_coordinates = [location_depot_coordinates(loc_id) for loc_id in depot_locations]
+    starts = [depot_locations.index(v["location_id"]) for v in available_vehicles]
+
+    # Coordinates come from the import-time geocoding stage only; customers
+    # still missing them are skipped.
+    stop_orders = []
+    coordinates = list(depot_coordinates)
+    ungeocoded_customers = {}
+    for order in location_orders:
+        customer = customers_by_id[order["customer_id"]]
+        position = as_coordinate_tuple(customer.get("coordinates"))
+        if position is None:
+            ungeocoded_customers[customer["id"]] = customer
+            continue
+        stop_orders.append(order)
+        coordinates.append(position)
+
+    geocoding_job = None
+    if ungeocoded_customers:
+        print(f"DEBUG: {len(ungeocoded_customers)} customers have no coordinates yet; skipping their orders")
+        geocoding_job = start_geocoding(list(ungeocoded_customers.values()), "optimize_routes")
+
+    num_depots = len(depot_locations)
+    loads = [order_load(order, products_db) for order in stop_orders]
+    demands = [0] * num_depots + [pallets for pallets, _ in loads]
+    weights = [0] * num_depots + [weight for _, weight in loads]
+    time_windows = [(parse_time_of_day(ROUTE_DAY_START), 24 * 3600)] * num_depots + [
+        customer_time_window(customers_by_id[o["customer_id"]]) for o in stop_orders
+    ]
+    service_times = [0] * num_depots + [customer_service_seconds(customers_by_id[o["customer_id"]]) for o in stop_orders]
+    now = datetime.now()
+    route_date = now.date()
+    departure_seconds = now.hour * 3600 + now.minute * 60
+    if departure_seconds >= parse_time_of_day(ROUTE_DAY_END):
+        # Too late to deliver today; plan from the start of the next dispatch day
+        route_date += timedelta(days=1)
+        departure_seconds = None
+
+    return {
+        "location_id": problem_id,
+        "location_ids": location_ids,
+        "depot_locations": depot_locations,
+        "location_customers": location_customers,
+        "customers_by_id": customers_by_id,
+        "location_orders": location_orders,
+        "stop_orders": stop_orders,
+        "node_orders": [None] * num_depots + stop_orders,
+        "vehicles": available_vehicles,
+        "starts": starts,
+        "depot_coordinates": depot_coordinates,
+        "coordinates": coordinates,
+        "geocoding_job": geocoding_job,
+        "demands": demands,
+        "weights": weights,
+        "time_windows": time_windows,
+        "service_times": service_times,
+        "departure_seconds": departure_seconds,
+        "route_date": route_date
+    }
+
+def optimization_fingerprint(problem: dict, time_limit_seconds: Optional[float]) -> str:
+    """Hash of everything the solver sees, so a cached plan is only reused for identical inputs"""
+    customers_by_id = problem["customers_by_id"]
+    return fingerprint({
+        "version": SOLVER_MODEL_VERSION,
+        "location_id": problem["location_id"],
+        "depot": problem["depot_coordinates"],
+        "route_date": problem["route_date"],
+        "time_limit_seconds": clamp_time_limit(time_limit_seconds),
+        "orders": [
+            [
+                order["id"], order.get("quantity"), order.get("items"), order["customer_id"],
+                customers_by_id[order["customer_id"]].get("coordinates"),
+                customers_by_id[order["customer_id"]].get("address"),
+                customer_time_window(customers_by_id[order["customer_id"]]),
+                customer_service_seconds(customers_by_id[order["customer_id"]])
+            ]
+            for order in problem["stop_orders"]
+        ],
+        "products": {product_id: p.get("weight_lbs") for product_id, p in products_db.items()},
+        "vehicles": [[v["id"], v["location_id"], *vehicle_capacity(v)] for v in problem["vehicles"]]
+    })
+
+def solve_optimization_problem(problem: dict, time_limit_seconds: Optional[float] = None,
+                               on_solution=None, telemetry: Optional[SolverTelemetry] = None) -> Optional[List[dict]]:
+    """Run OR-Tools on a prepared problem; read-only, so it is safe to call off the event loop"""
+    if len(problem["stop_orders"]) < 2:
+        return None
+    capacities = [vehicle_capacity(v) for v in problem["vehicles"]]
+    return optimize_with_ortools(
+        problem["demands"], problem["coordinates"], [pallets for pallets, _ in capacities],
+        time_windows=problem["time_windows"], service_times=problem["service_times"],
+        departure_seconds=problem["departure_seconds"], time_limit_seconds=time_limit_seconds,
+        starts=problem["starts"], ends=problem["starts"],
+        weights=problem["weights"], vehicle_weight_capacities=[weight for _, weight in capacities],
+        on_solution=on_solution, telemetry=telemetry
+    )
 
+def solution_summary(problem: dict, event: dict) -> dict:
+    """Describe an intermediate solver solution in terms of vehicles and orders"""
+    routes = [
+        {
+            "vehicle_id": problem["vehicles"][route["vehicle_index"]]["id"],
+            "order_ids": [problem["node_orders"][stop["node"]]["id"] for stop in route["stops"]]
+        }
+        for route in event["routes"] if route["stops"]
+    ]
+    return {
+        "solution": event["solution"],
+        "elapsed_seconds": event["elapsed_seconds"],
+        "objective": event["objective"],
+        "vehicles_used": len(routes),
+        "orders_routed": sum(len(route["order_ids"]) for route in routes),
+        "routes": routes
+    }
+
+def apply_optimization_solution(problem: dict, solution: Optional[List[dict]]) -> dict:
+    """Turn a solver solution (or the fallback heuristic) into stored routes"""
+    node_orders = problem["node_orders"]
+    customers_by_id = problem["customers_by_id"]
+    coordinates = problem["coordinates"]
+    route_date = problem["route_date"]
     optimized_routes = []
-    remaining_orders = location_orders.copy()
+    remaining_orders = problem["location_orders"].copy()
 
-    for vehicle in available_vehicles:
-        if not remaining_orders:
-            break
+    if solution:
+        for vehicle_route in solution:
+            if not vehicle_route["stops"]:
+                continue
+            vehicle = problem["vehicles"][vehicle_route["vehicle_index"]]
+            route_stops = []
+            for i, stop in enumerate(vehicle_route["stops"]):
+                order = node_orders[stop["node"]]
+                route_stop = build_route_stop(order, customers_by_id[order["customer_id"]], coordinates[stop["node"]])
+                route_stop["stop_number"] = i + 1
+                route_stop["estimated_arrival"] = seconds_to_datetime(stop["arrival_seconds"], route_date).isoformat()
+                route_stops.append(route_stop)
+            duration_hours = (vehicle_route["return_seconds"] - vehicle_route["departure_seconds"]) / 3600
+            print(f"DEBUG: OR-Tools generated {len(route_stops)} optimized stops for vehicle {vehicle['license_plate']}")
+            route = create_optimized_route(vehicle, vehicle["location_id"], route_stops, round(duration_hours, 2), route_date)
+            optimized_routes.append(route)
+            processed_order_ids = [stop["order_id"] for stop in route_stops]
+            remaining_orders = [o for o in remaining_orders if o["id"] not in processed_order_ids]
+    else:
+        for vehicle_index, vehicle in enumerate(problem["vehicles"]):
+            if not remaining_orders:
+                break
+            depot_node = problem["starts"][vehicle_index]
+
+            print(f"DEBUG: Processing vehicle {vehicle['license_plate']} with capacity {vehicle.get('capacity_pallets', 20)}")
+            route_stops = optimize_route_ai(problem["location_customers"], remaining_orders, vehicle,
+                                            coordinates[depot_node])
+            print(f"DEBUG: Fallback algorithm generated {len(route_stops)} stops for vehicle {vehicle['license_plate']}")
+
+            if route_stops:
+                route = create_optimized_route(vehicle, vehicle["location_id"], route_stops, len(route_stops) * 0.5)
+                optimized_routes.append(route)
+                processed_order_ids = [stop["order_id"] for stop in route_stops]
+                remaining_orders = [o for o in remaining_orders if o["id"] not in processed_order_ids]
+
+    driver_assignment = auto_assign_drivers(optimized_routes)
+    save_data_to_disk()
+    result = {
+        "message": f"Generated {len(optimized_routes)} optimized routes",
+        "routes": optimized_routes,
+        "unassigned_orders": [o["id"] for o in remaining_orders],
+        "driver_assignment": driver_assignment
+    }
+    if problem["geocoding_job"]:
+        result["geocoding_job"] = problem["geocoding_job"].to_dict()
+    return result
 
-        print(f"DEBUG: Processing vehicle {vehicle['license_plate']} with capacity {vehicle.get('capacity_pallets', 20)}")
-        print(f"DEBUG: Remaining orders: {len(remaining_orders)}")
+# One optimization at a time per branch, from building the problem to storing its routes
+optimization_locks: Dict[str, asyncio.Lock] = {}
 
+async def lock_locations(location_ids: List[str]) -> List[asyncio.Lock]:
+    """Wait for the optimization locks of these branches, taken in a fixed order so runs cannot deadlock"""
+    locks = [optimization_locks.setdefault(loc_id, asyncio.Lock()) for loc_id in sorted(set(location_ids))]
+    acquired = []
+    try:
+        for lock in locks:
+            await lock.acquire()
+            acquired.append(lock)
+    except BaseException:
+        release_locations(acquired)
+        raise
+    return acquired
+
+def release_locations(locks: List[asyncio.Lock]):
+    for lock in reversed(locks):
+        lock.release()
+
+def plan_cache_key(problem_id: str, time_limit_seconds: Optional[float]) -> str:
+    return f"{SOLVER_MODEL_VERSION}:{problem_id}:{clamp_time_limit(time_limit_seconds)}"
+
+def plan_state(route_ids: List[str], order_ids: List[str]) -> str:
+    """Fingerprint of a plan's routes and orders as stored; any edit, deletion or reassignment changes it"""
+    routes = [routes_db.get(route_id) for route_id in route_ids]
+    vehicle_ids = {route.get("vehicle_id") for route in routes if route}
+    return fingerprint({
+        "routes": [
+            [route["id"], route.get("vehicle_id"), route.get("driver_id"), route.get("location_id"),
+             route.get("date"), route.get("status"), [stop.get("order_id") for stop in route.get("stops", [])]]
+            if route else None
+            for route in routes
+        ],
+        "orders": [
+            [order["id"], order.get("status"), order.get("route_id"), order.get("quantity"),
+             order.get("items"), order.get("customer_id")]
+            if order else None
+            for order in (orders_db.get(order_id) for order_id in order_ids)
+        ],
+        "vehicles": {vehicle_id: vehicle_capacity(vehicles_db[vehicle_id]) if vehicle_id in vehicles_db else None
+                     for vehicle_id in vehicle_ids},
+    })
+
+def pending_fingerprint(problem: Optional[dict], time_limit_seconds: Optional[float],
+                        order_ids: Optional[set] = None) -> Optional[str]:
+    """Fingerprint of the still-pending orders of a problem (or the given subset of them); None if there are none"""
+    if problem is None:
+        return None
+    orders = problem["location_orders"]
+    stop_orders = problem["stop_orders"]
+    if order_ids is not None:
+        orders = [o for o in orders if o["id"] in order_ids]
+        stop_orders = [o for o in stop_orders if o["id"] in order_ids]
+    if not orders:
+        return None
+    return fingerprint({
+        "order_ids": sorted(o["id"] for o in orders),
+        "inputs": optimization_fingerprint(dict(problem, stop_orders=stop_orders), time_limit_seconds),
+    })
+
+def cache_plan(cache_key: Optional[str], problem: dict, time_limit_seconds: Optional[float], result: dict):
+    """Remember the routes a solve created so an identical request returns them instead of re-creating them"""
+    if not cache_key or not result["routes"]:
+        return
+    route_ids = [route["id"] for route in result["routes"]]
+    order_ids = [order["id"] for order in problem["location_orders"]]
+    solution_cache.put(cache_key, {
+        "route_ids": route_ids,
+        "order_ids": order_ids,
+        "state": plan_state(route_ids, order_ids),
+        "pending": pending_fingerprint(problem, time_limit_seconds, set(result["unassigned_orders"])),
+        "result": {k: v for k, v in result.items() if k not in ("routes", "geocoding_job", "cached")},
+    })
+
+def cached_plan_result(cache_key: Optional[str], problem: Optional[dict], time_limit_seconds: Optional[float]) -> Optional[dict]:
+    """
+    The routes of the last plan for this scope, if none of its routes or
+    orders changed and the pending orders are the ones it left unassigned.
+    """
+    if not cache_key:
+        return None
+    pending = pending_fingerprint(problem, time_limit_seconds)
+    plan = solution_cache.get(cache_key, lambda plan: (
+        plan["pending"] == pending and plan_state(plan["route_ids"], plan["order_ids"]) == plan["state"]
+    ))
+    if plan is None:
+        return None
+    result = dict(plan["result"])
+    result["routes"] = [routes_db[route_id] for route_id in plan["route_ids"]]
+    result["cached"] = True
+    if problem and problem["geocoding_job"]:
+        result["geocoding_job"] = problem["geocoding_job"].to_dict()
+    return result
+
+# Streamed solves run as tasks so they finish (and release their locks) even if the client goes away
+optimization_tasks = set()
+
+def start_streamed_optimization(problem: dict, time_limit_seconds: Optional[float], cache_key: Optional[str],
+                                locks: List[asyncio.Lock]) -> asyncio.Queue:
+    """
+    Solve, store and cache a plan in a background task that owns the branch
+    locks. The queue receives one event per improving solution, then the
+    stored result (or an error), then None.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    telemetry = SolverTelemetry(f"optimize:{problem['location_id']}")
+
+    def on_solution(event: dict):
+        loop.call_soon_threadsafe(queue.put_nowait, {"type": "solution", **solution_summary(problem, event)})
+
+    async def run():
         try:
-            customers = location_customers
-            demands = [0] + [order.get('quantity', 1) for order in remaining_orders]  # Depot + order demands
-            coordinates = [(31.1391, -93.2044)]  # Depot coordinates
-
-            # Add customer coordinates
-            for customer in customers:
-                if customer.get('coordinates'):
-                    coords = customer['coordinates']
-                    coordinates.append((coords['lat'], coords['lng']))
-                else:
-                    geocoded = geocode_address(customer.get('address', ''))
-                    if geocoded:
-                        coordinates.append((geocoded['lat'], geocoded['lng']))
-                        customers_db[customer['id']]['coordinates'] = geocoded
-                        save_data_to_disk()
-                    else:
-                        coordinates.append((31.1391 + len(coordinates) * 0.01, -93.2044 + len(coordinates) * 0.01))
-
-            if len(customers) > 1:
-                optimized_order = optimize_with_ortools(customers, demands, coordinates, vehicle.get('capacity_pallets', 20))
-                if optimized_order:
-                    route_stops = []
-                    for i, customer_idx in enumerate(optimized_order):
-                        customer = customers[customer_idx]
-                        order = next((o for o in remaining_orders if o['customer_id'] == customer['id']), None)
-                        if order:
-                            route_stops.append({
-                                "id": str(uuid.uuid4()),
-                                "order_id": order["id"],
-                                "customer_id": customer["id"],
-                                "stop_number": i + 1,
-                                "estimated_arrival": (datetime.now() + timedelta(hours=i * 0.5)).isoformat(),
-                                "status": "pending",
-                                "customer_name": customer["name"],
-                                "address": customer["address"],
-                                "coordinates": coordinates[customer_idx + 1] if customer_idx + 1 < len(coordinates) else None,
-                                "optimization_method": "OR-Tools"
-                            })
-                    print(f"DEBUG: OR-Tools generated {len(route_stops)} optimized stops for vehicle {vehicle['license_plate']}")
-                else:
-                    route_stops = optimize_route_ai(location_customers, remaining_orders, vehicle, depot_address)
-                    print(f"DEBUG: Fallback algorithm generated {len(route_stops)} stops for vehicle {vehicle['license_plate']}")
-            else:
-                route_stops = optimize_route_ai(location_customers, remaining_orders, vehicle, depot_address)
-                print(f"DEBUG: Single customer - generated {len(route_stops)} stops for vehicle {vehicle['license_plate']}")
+            solution = await run_in_threadpool(solve_optimization_problem, problem, time_limit_seconds, on_solution, telemetry)
+            result = apply_optimization_solution(problem, solution)
+            result["solver"] = telemetry.to_dict()
+            result["cached"] = False
+            if solution:
+                cache_plan(cache_key, problem, time_limit_seconds, result)
+            queue.put_nowait({"type": "result", **result})
         except Exception as e:
-            logging.warning(f"OR-Tools optimization failed: {e}")
-            route_stops = optimize_route_ai(location_customers, remaining_orders, vehicle, depot_address)
-            print(f"DEBUG: Exception fallback - generated {len(route_stops)} stops for vehicle {vehicle['license_plate']}")
+            logger.error(f"Streamed optimization of {problem['location_id']} failed: {e}")
+            queue.put_nowait({"type": "error", "detail": str(e)})
+        finally:
+            release_locations(locks)
+            queue.put_nowait(None)
+
+    task = loop.create_task(run())
+    optimization_tasks.add(task)
+    task.add_done_callback(optimization_tasks.discard)
+    return queue
+
+async def stream_optimization(queue: asyncio.Queue):
+    """Yield NDJSON events: one per improving solution, then the stored result"""
+    while True:
+        event = await queue.get()
+        if event is None:
+            break
+        yield json.dumps(event, default=str) + "\n"
 
-        if route_stops:
-            route_id = str(uuid.uuid4())
-            route = {
-                "id": route_id,
-                "name": f"Route {vehicle['license_plate']}-{date.today().strftime('%m%d')}",
-                "driver_id": None,
-                "vehicle_id": vehicle["id"],
-                "location_id": location_id,
-                "date": str(date.today()),
-                "estimated_duration_hours": len(route_stops) * 0.5,
-                "status": "planned",
-                "created_at": datetime.now().isoformat(),
-                "stops": route_stops
+async def stream_cached_result(result: dict):
+    yield json.dumps({"type": "result", **result}, default=str) + "\n"
+
+@app.post("/api/routes/optimize")
+async def optimize_routes(location_id: str, time_limit_seconds: Optional[float] = Query(None, gt=0),
+                          anytime: bool = False, use_cache: bool = True,
+                          current_user: UserInDB = Depends(get_current_user)):
+    """
+    Optimize pending orders for a location into routes. time_limit_seconds
+    trades plan quality for latency; with anytime=true the response streams
+    every improving solution as NDJSON before the final stored result.
+    Repeating the request while the plan it created is untouched and no new
+    orders are pending returns that plan's routes unless use_cache=false.
+    A request made while the branch is being optimized waits for that run.
+    """
+    if current_user.role not in [UserRole.MANAGER, UserRole.DISPATCHER]:
+        raise HTTPException(status_code=403, detail="Only managers and dispatchers can optimize routes")
+
+    locks = await lock_locations([location_id])
+    try:
+        problem = build_optimization_problem(location_id)
+        cache_key = plan_cache_key(location_id, time_limit_seconds) if use_cache else None
+        result = cached_plan_result(cache_key, problem, time_limit_seconds)
+        if result:
+            print(f"DEBUG: Returning the unchanged cached route plan for {location_id}")
+            if anytime:
+                return StreamingResponse(stream_cached_result(result), media_type="application/x-ndjson")
+            return result
+        if problem is None:
+            return {"message": "No pending orders found for optimization", "routes": []}
+
+        if anytime:
+            queue = start_streamed_optimization(problem, time_limit_seconds, cache_key, locks)
+            locks = []  # released by the streamed run
+            return StreamingResponse(stream_optimization(queue), media_type="application/x-ndjson")
+
+        telemetry = SolverTelemetry(f"optimize:{location_id}")
+        solution = await run_in_threadpool(solve_optimization_problem, problem, time_limit_seconds, None, telemetry)
+        result = apply_optimization_solution(problem, solution)
+        result["solver"] = telemetry.to_dict()
+        result["cached"] = False
+        if solution:
+            cache_plan(cache_key, problem, time_limit_seconds, result)
+        return result
+    finally:
+        release_locations(locks)
+
+@app.post("/api/routes/optimize-multi-depot")
+async def optimize_routes_multi_depot(location_ids: Optional[List[str]] = Query(None),
+                                      time_limit_seconds: Optional[float] = Query(None, gt=0),
+                                      use_cache: bool = True,
+                                      current_user: UserInDB = Depends(get_current_user)):
+    """
+    Optimize pending orders of several branches (all active ones by default) in
+    one multi-depot VRP. Every vehicle starts and ends at its own branch depot
+    and stops are assigned globally, so customers near a branch boundary can be
+    served from whichever depot is cheaper.
+    """
+    if current_user.role != UserRole.MANAGER:
+        raise HTTPException(status_code=403, detail="Only managers can optimize routes across branches")
+
+    location_ids = location_ids or [loc_id for loc_id, loc in locations_db.items() if loc.get("is_active", True)]
+    unknown = [loc_id for loc_id in location_ids if loc_id not in locations_db]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown location_ids: {unknown}")
+
+    locks = await lock_locations(location_ids)
+    try:
+        return await optimize_branches(location_ids, time_limit_seconds, use_cache)
+    finally:
+        release_locations(locks)
+
+async def optimize_branches(location_ids: List[str], time_limit_seconds: Optional[float], use_cache: bool) -> dict:
+    """The multi-depot solve; the caller holds the optimization locks of location_ids"""
+    problem_id = "multi:" + ",".join(sorted(location_ids))
+    problem = build_routing_problem(location_ids, problem_id)
+    cache_key = plan_cache_key(problem_id, time_limit_seconds) if use_cache else None
+    result = cached_plan_result(cache_key, problem, time_limit_seconds)
+    if result:
+        return result
+    if problem is None:
+        return {"message": "No pending orders found for optimization", "routes": []}
+
+    telemetry = SolverTelemetry(f"optimize:{problem_id}")
+    solution = await run_in_threadpool(solve_optimization_problem, problem, time_limit_seconds, None, telemetry)
+    result = apply_optimization_solution(problem, solution)
+    result["solver"] = telemetry.to_dict()
+    result["cached"] = False
+
+    customers_by_id = problem["customers_by_id"]
+    result["depots"] = [
+        {"location_id": loc_id, "coordinates": {"lat": lat, "lng": lng}}
+        for loc_id, (lat, lng) in zip(problem["depot_locations"], problem["depot_coordinates"])
+    ]
+    result["cross_branch_orders"] = [
+        {
+            "order_id": stop["order_id"],
+            "customer_location_id": customers_by_id[stop["customer_id"]]["location_id"],
+            "served_from": route["location_id"]
+        }
+        for route in result["routes"] for stop in route["stops"]
+        if customers_by_id[stop["customer_id"]]["location_id"] != route["location_id"]
+    ]
+    if solution:
+        cache_plan(cache_key, problem, time_limit_seconds, result)
+    return result
+
+@app.get("/api/routes/solver-telemetry")
+async def get_solver_telemetry(limit: int = Query(20, ge=1, le=100), current_user: UserInDB = Depends(get_current_user)):
+    """Telemetry for the most recent route solver runs, newest first"""
+    if current_user.role not in [UserRole.MANAGER, UserRole.DISPATCHER]:
+        raise HTTPException(status_code=403, detail="Only managers and dispatchers can view solver telemetry")
+    return {"solves": recent_telemetry(limit), "solution_cache": solution_cache.stats()}
+
+def scenario_task(problem: dict, scenario: RouteScenario, time_limit_seconds: float) -> dict:
+    """Solver inputs for one what-if variation of a base problem, built from copies only"""
+    num_depots = len(problem["depot_locations"])
+    vehicles = [dict(v) for v in problem["vehicles"] if v["id"] not in scenario.remove_vehicle_ids]
+    for n, added in enumerate(scenario.add_vehicles, 1):
+        if added.location_id not in problem["depot_locations"]:
+            raise HTTPException(status_code=400, detail=f"Scenario '{scenario.name}': location {added.location_id} is not part of the comparison")
+        type_capacity = VEHICLE_TYPE_CAPACITIES[added.vehicle_type.value]
+        vehicles.append({
+            "id": f"scenario_vehicle_{n}",
+            "license_plate": f"WHAT-IF-{n}",
+            "vehicle_type": added.vehicle_type.value,
+            "location_id": added.location_id,
+            "capacity_pallets": added.capacity_pallets or type_capacity["pallets"],
+            "capacity_weight_lbs": added.capacity_weight_lbs or type_capacity["weight_lbs"],
+        })
+    if not vehicles:
+        raise HTTPException(status_code=400, detail=f"Scenario '{scenario.name}' leaves no vehicles")
+
+    # Only the depots this scenario's fleet uses, then every stop (indices into the shared matrix)
+    depots = list(dict.fromkeys(v["location_id"] for v in vehicles))
+    nodes = [problem["depot_locations"].index(loc_id) for loc_id in depots] + list(range(num_depots, len(problem["coordinates"])))
+    offset = len(depots) - num_depots
+
+    allowed_vehicles = {}
+    for move in scenario.move_stops:
+        allowed = [i for i, v in enumerate(vehicles) if v["location_id"] == move.to_location_id]
+        if not allowed:
+            raise HTTPException(status_code=400, detail=f"Scenario '{scenario.name}': no vehicles at {move.to_location_id} to take the stops")
+        city = (move.city or "").strip().lower()
+        for node in range(num_depots, len(problem["coordinates"])):
+            customer = problem["customers_by_id"][problem["node_orders"][node]["customer_id"]]
+            if customer["id"] in move.customer_ids or (city and str(customer.get("city", "")).strip().lower() == city):
+                allowed_vehicles[node + offset] = allowed
+
+    capacities = [vehicle_capacity(v) for v in vehicles]
+    return {
+        "name": scenario.name,
+        "nodes": nodes,
+        "vehicles": vehicles,
+        "coordinates": [problem["coordinates"][i] for i in nodes],
+        "demands": [problem["demands"][i] for i in nodes],
+        "weights": [problem["weights"][i] for i in nodes],
+        "time_windows": [problem["time_windows"][i] for i in nodes],
+        "service_times": [problem["service_times"][i] for i in nodes],
+        "departure_seconds": problem["departure_seconds"],
+        "starts": [depots.index(v["location_id"]) for v in vehicles],
+        "vehicle_capacities": [pallets for pallets, _ in capacities],
+        "vehicle_weight_capacities": [weight for _, weight in capacities],
+        "allowed_vehicles": allowed_vehicles,
+        "time_limit_seconds": time_limit_seconds,
+        "moved_stops": len(allowed_vehicles),
+    }
+
+def scenario_summary(problem: dict, task: dict, outcome: dict) -> dict:
+    """One comparison-table row (plus per-route detail) for a solved scenario"""
+    row = {
+        "scenario": task["name"],
+        "vehicles": len(task["vehicles"]),
+        "moved_stops": task["moved_stops"],
+        "stops": len(problem["stop_orders"]),
+    }
+    routes = outcome.get("routes")
+    if outcome.get("error") or routes is None:
+        row.update({"status": "failed", "error": outcome.get("error") or "No solution found"})
+        return row
+    offset = len(task["nodes"]) - len(problem["coordinates"])
+    used = [r for r in routes if r["stops"]]
+    pallets = sum(task["demands"][stop["node"]] for r in used for stop in r["stops"])
+    capacity = sum(task["vehicle_capacities"][r["vehicle_index"]] for r in used)
+    served = sum(len(r["stops"]) for r in used)
+    row.update({
+        "status": "solved",
+        "vehicles_used": len(used),
+        "stops_served": served,
+        "stops_unserved": len(problem["stop_orders"]) - served,
+        "total_distance_miles": round(outcome["distance_meters"] / METERS_PER_MILE, 1),
+        "total_route_hours": round(sum(r["return_seconds"] - r["departure_seconds"] for r in used) / 3600, 2),
+        "pallet_utilization": round(pallets / capacity, 3) if capacity else 0,
+        "solve_seconds": outcome["solver"]["total_seconds"],
+        "routes": [
+            {
+                "vehicle_id": task["vehicles"][r["vehicle_index"]]["id"],
+                "location_id": task["vehicles"][r["vehicle_index"]]["location_id"],
+                "order_ids": [problem["node_orders"][stop["node"] - offset]["id"] for stop in r["stops"]],
+                "distance_miles": round(r["distance_meters"] / METERS_PER_MILE, 1),
             }
+            for r in used
+        ],
+    })
+    return row
 
-            for stop in route_stops:
-                stop["route_id"] = route_id
+@app.post("/api/routes/scenarios")
+async def compare_route_scenarios(scenario_request: RouteScenarioRequest, current_user: UserInDB = Depends(get_current_user)):
+    """
+    Solve a batch of what-if variations of today's pending orders in parallel
+    and return a comparison table. Vehicles, orders and routes are read
+    only; no scenario changes live dispatch data.
+    """
+    if current_user.role not in [UserRole.MANAGER, UserRole.DISPATCHER]:
+        raise HTTPException(status_code=403, detail="Only managers and dispatchers can compare route scenarios")
+    location_ids = list(dict.fromkeys(scenario_request.location_ids))
+    unknown = [loc_id for loc_id in location_ids if loc_id not in locations_db]
+    if not location_ids or unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown location_ids: {unknown}")
+    scenarios = list(scenario_request.scenarios)
+    if scenario_request.include_baseline:
+        scenarios.insert(0, RouteScenario(name="baseline"))
+    if not scenarios or len(scenarios) > MAX_SCENARIOS:
+        raise HTTPException(status_code=400, detail=f"Provide between 1 and {MAX_SCENARIOS} scenarios")
+
+    problem = build_routing_problem(location_ids, "scenarios:" + ",".join(sorted(location_ids)), all_depots=True)
+    if problem is None or not problem["stop_orders"]:
+        return {"message": "No pending orders found for scenario comparison", "scenarios": []}
+
+    time_limit = clamp_time_limit(scenario_request.time_limit_seconds)
+    tasks = [scenario_task(problem, scenario, time_limit) for scenario in scenarios]
+    started = time.perf_counter()
+    matrices = await run_in_threadpool(build_matrices, problem["coordinates"])
+    outcomes = await run_in_threadpool(scenario_runner.run, matrices, tasks)
+    rows = [scenario_summary(problem, task, outcome) for task, outcome in zip(tasks, outcomes)]
+
+    baseline = rows[0] if scenario_request.include_baseline and rows[0]["status"] == "solved" else None
+    for row in rows:
+        if baseline and row["status"] == "solved":
+            row["distance_delta_miles"] = round(row["total_distance_miles"] - baseline["total_distance_miles"], 1)
+            row["vehicles_used_delta"] = row["vehicles_used"] - baseline["vehicles_used"]
+    return {
+        "location_ids": location_ids,
+        "time_limit_seconds": time_limit,
+        "elapsed_seconds": round(time.perf_counter() - started, 2),
+        "scenarios": rows,
+    }
 
-            routes_db[route_id] = route
-            optimized_routes.append(route)
+@app.on_event("shutdown")
+def shutdown_scenario_workers():
+    scenario_runner.shutdown()
+
+def customer_visit_loads(customers: List[dict]) -> dict:
+    """Typical (pallets, lbs) per visit for each customer, from their order history"""
+    history = {}
+    for order in orders_db.values():
+        history.setdefault(order.get("customer_id"), []).append(order_load(order, products_db))
+    loads = {}
+    for customer in customers:
+        orders = history.get(customer["id"])
+        if orders:
+            loads[customer["id"]] = (
+                max(1, round(sum(p for p, _ in orders) / len(orders))),
+                round(sum(w for _, w in orders) / len(orders))
+            )
+        else:
+            loads[customer["id"]] = order_load({}, products_db)
+    return loads
 
-            processed_order_ids = [stop["order_id"] for stop in route_stops]
-            remaining_orders = [o for o in remaining_orders if o["id"] not in processed_order_ids]
+@app.post("/api/routes/weekly-plans")
+async def create_weekly_plan(plan_request: WeeklyPlanRequest, current_user: UserInDB = Depends(get_current_user)):
+    """
+    Plan a location's recurring weekly route sheets in the background: every
+    active customer is given delivery days matching visits_per_week, days
+    and trucks are balanced by workload, and each route is sequenced.
+    Poll GET /api/routes/weekly-plans/{job_id} for the plan.
+    """
+    if current_user.role not in [UserRole.MANAGER, UserRole.DISPATCHER]:
+        raise HTTPException(status_code=403, detail="Only managers and dispatchers can plan weekly routes")
+    location_id = plan_request.location_id
+    if location_id not in locations_db:
+        raise HTTPException(status_code=404, detail="Location not found")
+    days = [day.lower() for day in plan_request.days]
+    invalid_days = [day for day in days if day not in WEEKDAYS]
+    if invalid_days or not days:
+        raise HTTPException(status_code=400, detail=f"Invalid planning days: {invalid_days or days}")
+
+    customers = [
+        c for c in customers_db.values()
+        if c.get("location_id") == location_id and c.get("is_active", True) and (c.get("visits_per_week") or 1) > 0
+    ]
+    planned = [c for c in customers if as_coordinate_tuple(c.get("coordinates")) is not None]
+    ungeocoded = [c for c in customers if as_coordinate_tuple(c.get("coordinates")) is None]
+    vehicles = [v for v in vehicles_db.values() if v.get("location_id") == location_id and v.get("is_active", True)]
+    if not planned:
+        raise HTTPException(status_code=400, detail="No geocoded customers to plan for this location")
+    if not vehicles:
+        raise HTTPException(status_code=400, detail="No active vehicles at this location")
+    drivers = [
+        u for u in users_db.values()
+        if u.get("role") == UserRole.DRIVER and u.get("location_id") == location_id and u.get("is_active", True)
+    ]
 
-            for order_id in processed_order_ids:
-                if order_id in orders_db:
-                    orders_db[order_id]["status"] = "assigned"
-                    orders_db[order_id]["route_id"] = route_id
+    plan_args = {
+        "customers": planned,
+        "depot": location_depot_coordinates(location_id),
+        "vehicles": vehicles,
+        "visit_loads": customer_visit_loads(planned),
+        "vehicle_capacities": [vehicle_capacity(v) for v in vehicles],
+        "days": days,
+        "drivers": drivers,
+    }
+    if plan_request.route_time_limit_seconds:
+        plan_args["route_time_limit_seconds"] = clamp_time_limit(plan_request.route_time_limit_seconds)
+    job = territory_planner.submit(location_id, **plan_args)
+    geocoding_job = start_geocoding(ungeocoded, "weekly_plan") if ungeocoded else None
+    return {
+        "job": job.to_dict(),
+        "customers_skipped": [c["id"] for c in ungeocoded],
+        "geocoding_job": geocoding_job.to_dict() if geocoding_job else None
+    }
 
+@app.get("/api/routes/weekly-plans/{job_id}")
+async def get_weekly_plan(job_id: str, current_user: UserInDB = Depends(get_current_user)):
+    if current_user.role not in [UserRole.MANAGER, UserRole.DISPATCHER]:
+        raise HTTPException(status_code=403, detail="Only managers and dispatchers can view weekly plans")
+    job = territory_planner.jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Weekly plan not found")
+    return job.to_dict()
+
+FROZEN_STOP_STATUSES = ("completed", "arrived")
+
+@app.post("/api/routes/replan")
+async def replan_routes(replan_request: RouteReplanRequest, current_user: UserInDB = Depends(get_current_user)):
+    """
+    Incrementally re-plan today's routes for a location after urgent orders,
+    cancellations or a vehicle breakdown. Completed stops stay frozen and the
+    solver is warm-started from the current plan.
+    """
+    if current_user.role not in [UserRole.MANAGER, UserRole.DISPATCHER]:
+        raise HTTPException(status_code=403, detail="Only managers and dispatchers can re-plan routes")
+
+    location_id = replan_request.location_id
+    route_date = date.today()
+    remove_ids = set(replan_request.remove_order_ids)
+    unavailable_ids = set(replan_request.unavailable_vehicle_ids)
+
+    active_routes = [
+        r for r in routes_db.values()
+        if r["location_id"] == location_id and r.get("date") == str(route_date)
+        and r.get("status") in ("planned", "active") and r.get("vehicle_id")
+    ]
+
+    if imported_customers and len(imported_customers) > 0:
+        customers = imported_customers
+    else:
+        customers = list(customers_db.values())
+    customers_by_id = {c["id"]: c for c in customers}
+    customers_by_id.update({c["id"]: c for c in customers_db.values() if c["id"] not in customers_by_id})
+
+    routed_order_ids = {s.get("order_id") for r in active_routes for s in r.get("stops", [])}
+    if replan_request.add_order_ids is None:
+        added_orders = [
+            o for o in orders_db.values()
+            if o["status"] == "pending" and not o.get("route_id") and o["id"] not in remove_ids
+            and customers_by_id.get(o["customer_id"], {}).get("location_id") == location_id
+        ]
+    else:
+        added_orders = [
+            orders_db[order_id] for order_id in replan_request.add_order_ids
+            if order_id in orders_db and order_id not in routed_order_ids and order_id not in remove_ids
+        ]
+    added_orders = [o for o in added_orders if o["customer_id"] in customers_by_id]
+
+    busy_vehicle_ids = {r["vehicle_id"] for r in active_routes}
+    idle_vehicles = [
+        v for v in vehicles_db.values()
+        if v["location_id"] == location_id and v["is_active"]
+        and v["id"] not in busy_vehicle_ids and v["id"] not in unavailable_ids
+    ]
+    planned_routes = [r for r in active_routes if r["vehicle_id"] not in unavailable_ids and r["vehicle_id"] in vehicles_db]
+    broken_routes = [r for r in active_routes if r not in planned_routes]
+
+    depot = location_depot_coordinates(location_id)
+    day_start = parse_time_of_day(ROUTE_DAY_START)
+    coordinates = [depot]
+    time_windows = [(day_start, 24 * 3600)]
+    service_times = [0]
+    demands = [0]
+    weights = [0]
+    node_stops = [None]
+
+    def add_node(position, window, service_seconds, load, stop) -> int:
+        coordinates.append(position)
+        time_windows.append(window)
+        service_times.append(service_seconds)
+        demands.append(load[0])
+        weights.append(load[1])
+        node_stops.append(stop)
+        return len(coordinates) - 1
+
+    # Stops whose customer has no coordinates yet are left out and queued for geocoding
+    ungeocoded_stops = []
+    ungeocoded_customers = {}
+
+    def add_stop_node(stop: dict) -> Optional[int]:
+        customer = customers_by_id.get(stop["customer_id"], {"id": stop["customer_id"]})
+        order = orders_db.get(stop.get("order_id"), {})
+        position = as_coordinate_tuple(stop.get("coordinates")) or as_coordinate_tuple(customer.get("coordinates"))
+        if position is None:
+            ungeocoded_stops.append(stop)
+            if customer["id"] in customers_by_id:
+                ungeocoded_customers[customer["id"]] = customer
+            return None
+        return add_node(position, customer_time_window(customer), customer_service_seconds(customer),
+                        order_load(order, products_db), stop)
+
+    # Vehicles keep their routes; each starts from where its driver is now
+    vehicle_routes = planned_routes + [None] * len(idle_vehicles)
+    vehicles = [vehicles_db[r["vehicle_id"]] for r in planned_routes] + idle_vehicles
+    starts = []
+    initial_routes = []
+    # Frozen stops as they were before the solve; geofencing may complete more while it runs
+    frozen_before = {}
+    for route in planned_routes:
+        frozen = [s for s in route.get("stops", []) if s.get("status") in FROZEN_STOP_STATUSES]
+        frozen_before[route["id"]] = frozen
+        driver_position = driver_locations.get(route.get("driver_id")) or {}
+        start_position = None
+        if driver_position.get("lat") is not None and driver_position.get("lng") is not None:
+            start_position = (driver_position["lat"], driver_position["lng"])
+        elif frozen:
+            start_position = as_coordinate_tuple(frozen[-1].get("coordinates"))
+        starts.append(add_node(start_position, (day_start, 24 * 3600), 0, (0, 0), None) if start_position else 0)
+
+        pending = [
+            s for s in route.get("stops", [])
+            if s.get("status") not in FROZEN_STOP_STATUSES and s.get("order_id") not in remove_ids
+        ]
+        nodes = [add_stop_node(s) for s in sorted(pending, key=lambda s: s.get("stop_number", 0))]
+        initial_routes.append([node for node in nodes if node is not None])
+
+    for vehicle in idle_vehicles:
+        starts.append(0)
+        initial_routes.append([])
+
+    # Stops stranded on unavailable vehicles and new orders start unassigned
+    for route in broken_routes:
+        for stop in route.get("stops", []):
+            if stop.get("status") not in FROZEN_STOP_STATUSES and stop.get("order_id") not in remove_ids:
+                add_stop_node(stop)
+    for order in added_orders:
+        customer = customers_by_id[order["customer_id"]]
+        add_stop_node(build_route_stop(order, customer, as_coordinate_tuple(customer.get("coordinates"))))
+
+    if not vehicles:
+        raise HTTPException(status_code=400, detail="No available vehicles for route re-planning")
+
+    geocoding_job = None
+    if ungeocoded_customers:
+        print(f"DEBUG: {len(ungeocoded_stops)} stops have no coordinates yet; leaving them out of the re-plan")
+        geocoding_job = start_geocoding(list(ungeocoded_customers.values()), "replan_routes")
+
+    now = datetime.now()
+    started = time.perf_counter()
+    telemetry = SolverTelemetry(f"replan:{location_id}")
+    solution = None
+    if len(coordinates) > 1:
+        capacities = [vehicle_capacity(v) for v in vehicles]
+        solution = await run_in_threadpool(
+            optimize_with_ortools,
+            demands, coordinates, [pallets for pallets, _ in capacities],
+            time_windows=time_windows, service_times=service_times,
+            departure_seconds=now.hour * 3600 + now.minute * 60,
+            time_limit_seconds=replan_request.time_limit_seconds,
+            starts=starts, ends=[0] * len(vehicles), initial_routes=initial_routes,
+            weights=weights, vehicle_weight_capacities=[weight for _, weight in capacities],
+            telemetry=telemetry
+        )
+        if solution is None:
+            raise HTTPException(status_code=500, detail="Route re-planning failed; existing routes were left unchanged")
+    solve_seconds = time.perf_counter() - started
+
+    assigned_order_ids = set()
+    updated_routes = []
+    new_routes = []
+    for vehicle_index, vehicle in enumerate(vehicles):
+        vehicle_route = solution[vehicle_index] if solution else {"stops": []}
+        route = vehicle_routes[vehicle_index]
+        route_stops = []
+        for stop in vehicle_route["stops"]:
+            route_stop = node_stops[stop["node"]]
+            if route_stop.get("status") in FROZEN_STOP_STATUSES:
+                # Reached while the solver ran; it stays on the route that served it
+                continue
+            route_stop["estimated_arrival"] = seconds_to_datetime(stop["arrival_seconds"], route_date).isoformat()
+            route_stop["status"] = "pending"
+            route_stops.append(route_stop)
+            assigned_order_ids.add(route_stop.get("order_id"))
+
+        if route is None:
+            if route_stops:
+                for i, route_stop in enumerate(route_stops):
+                    route_stop["stop_number"] = i + 1
+                duration_hours = (vehicle_route["return_seconds"] - vehicle_route["departure_seconds"]) / 3600
+                new_routes.append(create_optimized_route(vehicle, location_id, route_stops, round(duration_hours, 2), route_date))
+                updated_routes.append(new_routes[-1])
+            continue
+
+        frozen = frozen_before[route["id"]]
+        frozen_ids = {id(s) for s in frozen}
+        frozen = frozen + [
+            s for s in route.get("stops", [])
+            if s.get("status") in FROZEN_STOP_STATUSES and id(s) not in frozen_ids
+        ]
+        route["stops"] = frozen + route_stops
+        for i, route_stop in enumerate(route["stops"]):
+            route_stop["stop_number"] = i + 1
+            route_stop["route_id"] = route["id"]
+            if route_stop.get("order_id") in orders_db and route_stop.get("status") == "pending":
+                orders_db[route_stop["order_id"]]["status"] = "assigned"
+                orders_db[route_stop["order_id"]]["route_id"] = route["id"]
+        if route_stops:
+            route["estimated_duration_hours"] = round(
+                (vehicle_route["return_seconds"] - vehicle_route["departure_seconds"]) / 3600, 2
+            )
+        updated_routes.append(route)
+
+    for route in broken_routes:
+        route["stops"] = [s for s in route.get("stops", []) if s.get("status") in FROZEN_STOP_STATUSES]
+        route["status"] = "interrupted"
+        updated_routes.append(route)
+
+    unassigned_order_ids = []
+    for route_stop in node_stops[1:]:
+        if route_stop is None or route_stop.get("order_id") in assigned_order_ids:
+            continue
+        if route_stop.get("status") in FROZEN_STOP_STATUSES:
+            continue
+        order_id = route_stop.get("order_id")
+        unassigned_order_ids.append(order_id)
+        if order_id in orders_db:
+            orders_db[order_id]["route_id"] = None
+            orders_db[order_id]["status"] = "pending"
+    ungeocoded_order_ids = []
+    for route_stop in ungeocoded_stops:
+        if route_stop.get("status") in FROZEN_STOP_STATUSES:
+            continue
+        order_id = route_stop.get("order_id")
+        ungeocoded_order_ids.append(order_id)
+        unassigned_order_ids.append(order_id)
+        if order_id in orders_db:
+            orders_db[order_id]["route_id"] = None
+            orders_db[order_id]["status"] = "pending"
+    for order_id in remove_ids:
+        if order_id in orders_db and orders_db[order_id].get("route_id"):
+            orders_db[order_id]["route_id"] = None
+            if orders_db[order_id]["status"] == "assigned":
+                orders_db[order_id]["status"] = "pending"
+
+    for route in updated_routes:
+        eta_service.invalidate(route["id"])
+        index_route_fences(route)
+    driver_assignment = auto_assign_drivers(new_routes)
     save_data_to_disk()
-    return {"message": f"Generated {len(optimized_routes)} optimized routes", "routes": optimized_routes}
+    result = {
+        "message": f"Re-planned {len(updated_routes)} routes",
+        "routes": updated_routes,
+        "unassigned_orders": unassigned_order_ids,
+        "ungeocoded_orders": ungeocoded_order_ids,
+        "driver_assignment": driver_assignment,
+        "solve_seconds": round(solve_seconds, 3),
+        "solver": telemetry.to_dict()
+    }
+    if geocoding_job:
+        result["geocoding_job"] = geocoding_job.to_dict()
+    return result
+
+@app.post("/api/routes/assign-drivers")
+async def assign_route_drivers(location_id: Optional[str] = None, route_date: Optional[date] = None,
+                               reassign: bool = False, allow_cross_branch: bool = False,
+                               current_user: UserInDB = Depends(get_current_user)):
+    """
+    Assign drivers to planned routes without one, balancing weekly hours. With
+    reassign, drivers of planned routes in scope are cleared and matched again.
+    """
+    if current_user.role not in [UserRole.MANAGER, UserRole.DISPATCHER]:
+        raise HTTPException(status_code=403, detail="Only managers and dispatchers can assign drivers")
+    routes = [
+        r for r in routes_db.values()
+        if r.get("status") == "planned"
+        and (not location_id or r.get("location_id") == location_id)
+        and (not route_date or r.get("date") == str(route_date))
+        and (reassign or not r.get("driver_id"))
+    ]
+    previous = {r["id"]: r.get("driver_id") for r in routes}
+    for route in routes:
+        route["driver_id"] = None
+    result = auto_assign_drivers(routes, allow_cross_branch)
+    changed = [r["id"] for r in routes if r.get("driver_id") != previous[r["id"]]]
+    if changed:
+        save_data_to_disk()
+    result["routes"] = [{"route_id": r["id"], "driver_id": r.get("driver_id")} for r in routes]
+    result["changed"] = len(changed)
+    return result
 
 @app.get("/api/routes/{route_id}")
 async def get_route(route_id: str, current_user: UserInDB = Depends(get_current_user)):
@@ -3829,30 +4917,304 @@ async def quickbooks_disconnect(current_user: UserInDB = Depends(get_current_use
 
 @app.post("/api/drivers/{driver_id}/location")
 async def update_driver_location(driver_id: str, location_data: dict, current_user: UserInDB = Depends(get_current_user)):
-    driver_locations[driver_id] = {
-        "lat": location_data.get("lat"),
-        "lng": location_data.get("lng"),
-        "timestamp": location_data.get("timestamp"),
-        "route_id": location_data.get("route_id"),
-        "speed": location_data.get("speed", 0),
-        "heading": location_data.get("heading", 0),
-        "accuracy": location_data.get("accuracy", 0)
-    }
-
-    route_id = location_data.get("route_id")
-    if route_id and route_id in routes_db:
-        route = routes_db[route_id]
-        current_location = {"lat": location_data.get("lat"), "lng": location_data.get("lng")}
-        update_route_etas(route, current_location)
-
+    if not valid_driver_id(driver_id):
+        raise HTTPException(status_code=400, detail="Invalid driver id")
+    gps_ingestion.ingest(driver_id, location_data)
     return {"status": "success", "message": "Location updated"}
 
+@app.post("/api/drivers/{driver_id}/locations")
+async def update_driver_locations(driver_id: str, pings: List[dict], current_user: UserInDB = Depends(get_current_user)):
+    """Batch upload of pings buffered by the mobile app while offline"""
+    if not valid_driver_id(driver_id):
+        raise HTTPException(status_code=400, detail="Invalid driver id")
+    for ping in sorted(pings, key=lambda p: str(p.get("timestamp") or "")):
+        gps_ingestion.ingest(driver_id, ping)
+    return {"status": "success", "message": f"{len(pings)} locations recorded"}
+
 @app.get("/api/drivers/{driver_id}/location")
 async def get_driver_location(driver_id: str, current_user: UserInDB = Depends(get_current_user)):
     if driver_id in driver_locations:
         return driver_locations[driver_id]
     return {"error": "Driver location not found"}
 
+@app.get("/api/drivers/{driver_id}/track")
+async def get_driver_track(driver_id: str, limit: Optional[int] = None, current_user: UserInDB = Depends(get_current_user)):
+    """Recent breadcrumbs from the in-memory ring buffer, oldest first"""
+    return {"driver_id": driver_id, "points": gps_ingestion.recent(driver_id, limit)}
+
+MAX_BREADCRUMB_QUERY_DAYS = 31
+
+@app.get("/api/drivers/{driver_id}/breadcrumbs")
+async def get_driver_breadcrumbs(
+    driver_id: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    tolerance_meters: float = Query(0, ge=0),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Stored GPS history of a driver between start and end (ISO datetimes,
+    default today), optionally simplified with Douglas-Peucker for display.
+    Mileage is measured on the full track.
+    """
+    if current_user.role not in [UserRole.MANAGER, UserRole.DISPATCHER] and current_user.id != driver_id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    if not valid_driver_id(driver_id):
+        raise HTTPException(status_code=400, detail="Invalid driver id")
+    try:
+        start_time = datetime.fromisoformat(start) if start else datetime.combine(date.today(), datetime.min.time())
+        end_time = datetime.fromisoformat(end) if end else start_time + timedelta(days=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be ISO datetimes")
+    if end_time <= start_time or end_time - start_time > timedelta(days=MAX_BREADCRUMB_QUERY_DAYS):
+        raise HTTPException(status_code=400, detail=f"Time range must be positive and at most {MAX_BREADCRUMB_QUERY_DAYS} days")
+
+    await run_in_threadpool(gps_ingestion.flush_breadcrumbs)
+    points = await run_in_threadpool(breadcrumb_store.query, driver_id, start_time, end_time)
+    shown = douglas_peucker(points, tolerance_meters) if tolerance_meters else points
+    return {
+        "driver_id": driver_id,
+        "start": start_time.isoformat(),
+        "end": end_time.isoformat(),
+        "point_count": len(points),
+        "distance_miles": round(track_miles(points), 2),
+        "points": [
+            {"lat": lat, "lng": lng, "timestamp": datetime.fromtimestamp(ts).isoformat()}
+            for lat, lng, ts in shown
+        ],
+    }
+
+@app.get("/api/gps/stats")
+async def get_gps_stats(current_user: UserInDB = Depends(get_current_user)):
+    if current_user.role not in [UserRole.MANAGER, UserRole.DISPATCHER]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return {
+        **gps_ingestion.stats(),
+        "eta": eta_service.stats(),
+        "tracking": live_tracker.stats(),
+        "geofences": geofence_engine.stats(),
+    }
+
+@app.get("/api/eta-model")
+async def get_eta_model(current_user: UserInDB = Depends(get_current_user)):
+    if current_user.role not in [UserRole.MANAGER, UserRole.DISPATCHER]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return {"source": ETA_SOURCE if google_maps.is_configured() else "local", **eta_model.model().summary()}
+
+@app.post("/api/eta-model/train")
+async def train_eta_model(days: int = Query(90, ge=1, le=730), current_user: UserInDB = Depends(get_current_user)):
+    """Retrain speed profiles and service times from breadcrumb history and completed stops"""
+    if current_user.role != UserRole.MANAGER:
+        raise HTTPException(status_code=403, detail="Only managers can retrain the ETA model")
+    await run_in_threadpool(gps_ingestion.flush_breadcrumbs)
+    model = await run_in_threadpool(train_model, days, dwell_history(list(routes_db.values())))
+    await run_in_threadpool(eta_model.replace, model)
+    return model.summary()
+
+@app.get("/api/geofence/dwell-stats")
+async def get_dwell_stats(customer_id: Optional[str] = None, current_user: UserInDB = Depends(get_current_user)):
+    """Observed minutes spent at customers, from geofence departures"""
+    if current_user.role not in [UserRole.MANAGER, UserRole.DISPATCHER]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return geofence_engine.dwell_stats(customer_id)
+
+async def refresh_etas_from_ping(driver_id: str, ping: dict):
+    if ping.get("route_id") in routes_db and ping.get("lat") is not None and ping.get("lng") is not None:
+        eta_service.submit(ping["route_id"], {"lat": ping["lat"], "lng": ping["lng"]})
+
+def compute_route_etas(route_id: str, position: dict) -> Optional[tuple]:
+    """ETA worker callback: refresh a route's ETAs and return its next pending stop"""
+    route = routes_db.get(route_id)
+    if not route:
+        return None
+    update_route_etas(route, position)
+    next_stop = next((s for s in route.get("stops", []) if s.get("status") == "pending"), None)
+    return as_coordinate_tuple(next_stop.get("coordinates")) if next_stop else None
+
+def position_message(driver_id: str, ping: dict) -> dict:
+    return {
+        "type": "position",
+        "driver_id": driver_id,
+        "route_id": ping.get("route_id"),
+        "lat": ping.get("lat"),
+        "lng": ping.get("lng"),
+        "speed": ping.get("speed"),
+        "heading": ping.get("heading"),
+        "timestamp": ping.get("timestamp"),
+    }
+
+def route_eta_message(route: dict) -> dict:
+    return {
+        "type": "eta",
+        "route_id": route["id"],
+        "stops": [
+            {
+                "stop_number": stop.get("stop_number"),
+                "customer_id": stop.get("customer_id"),
+                "status": stop.get("status"),
+                "estimated_arrival": stop.get("estimated_arrival"),
+            }
+            for stop in route.get("stops", [])
+        ],
+    }
+
+async def publish_position(driver_id: str, ping: dict):
+    topics = [f"driver:{driver_id}"]
+    if ping.get("route_id"):
+        topics.append(f"route:{ping['route_id']}")
+    driver = users_db.get(driver_id)
+    if driver and driver.get("location_id"):
+        topics.append(f"location:{driver['location_id']}")
+    live_tracker.publish(topics, position_message(driver_id, ping))
+
+def publish_route_etas(route_id: str):
+    route = routes_db.get(route_id)
+    if route:
+        live_tracker.publish([f"route:{route_id}", f"location:{route.get('location_id')}"], route_eta_message(route))
+
+def stop_fence_coordinates(stop: dict) -> Optional[tuple]:
+    coordinates = as_coordinate_tuple(stop.get("coordinates"))
+    if coordinates is None:
+        customer = customers_db.get(stop.get("customer_id")) or {}
+        coordinates = as_coordinate_tuple(customer.get("coordinates"))
+    return coordinates
+
+def stop_fence_id(stop: dict) -> Optional[str]:
+    """A stop's geofence key, stable when a replan renumbers the route"""
+    return stop.get("order_id") or stop.get("customer_id")
+
+def index_route_fences(route: dict):
+    """(Re)build the geofences of a route's pending stops"""
+    fences = []
+    for stop in route.get("stops", []):
+        if stop.get("status", "pending") != "pending" or not stop_fence_id(stop):
+            continue
+        coordinates = stop_fence_coordinates(stop)
+        if coordinates:
+            fences.append((stop_fence_id(stop), stop.get("stop_number"), stop.get("customer_id"),
+                           coordinates[0], coordinates[1]))
+    geofence_engine.index_route(route["id"], fences)
+
+def apply_stop_event(event: dict):
+    """Move a stop through arrived/completed from a geofence event"""
+    route = routes_db.get(event["route_id"])
+    if not route:
+        return
+    stop = next((s for s in route.get("stops", []) if stop_fence_id(s) == event["stop_id"]), None)
+    if stop is None:
+        return
+    when = datetime.fromtimestamp(event["ts"]).isoformat()
+    if event["type"] == "arrival" and stop.get("status", "pending") == "pending":
+        stop["status"] = "arrived"
+        stop["arrived_at"] = when
+        if route.get("status") == "planned":
+            route["status"] = "active"
+    elif event["type"] == "drive_by" and stop.get("status") == "arrived":
+        stop["status"] = "pending"
+        stop.pop("arrived_at", None)
+    elif event["type"] == "departure" and stop.get("status") == "arrived":
+        stop["status"] = "completed"
+        stop["completed_at"] = when
+        stop["dwell_minutes"] = round(event["dwell_seconds"] / 60, 1)
+        order = orders_db.get(stop.get("order_id"))
+        if order:
+            order["status"] = "delivered"
+        if all(s.get("status") == "completed" for s in route.get("stops", [])):
+            route["status"] = "completed"
+    else:
+        return
+    eta_service.invalidate(route["id"])
+    gps_ingestion.mark_state_dirty()
+    live_tracker.publish([f"route:{route['id']}", f"location:{route.get('location_id')}"],
+                         {**event, "type": f"stop_{event['type']}", "stop_number": stop.get("stop_number"),
+                          "status": stop.get("status")})
+
+async def detect_stop_events(driver_id: str, ping: dict):
+    route = routes_db.get(ping.get("route_id"))
+    if not isinstance(ping.get("lat"), (int, float)) or not isinstance(ping.get("lng"), (int, float)):
+        return
+    if route and not geofence_engine.is_indexed(route["id"]):
+        index_route_fences(route)
+    events = geofence_engine.check(driver_id, route["id"] if route else None, ping["lat"], ping["lng"],
+                                   ping["ts"], ping.get("accuracy"))
+    for event in events:
+        apply_stop_event(event)
+
+def seed_dwell_history():
+    """Rebuild dwell statistics from stops completed before a restart"""
+    for route in routes_db.values():
+        for stop in route.get("stops", []):
+            if stop.get("dwell_minutes") is not None and stop.get("customer_id"):
+                geofence_engine.record_history(stop["customer_id"], stop["dwell_minutes"])
+
+with startup_profiler.phase("dwell_history"):
+    seed_dwell_history()
+
+gps_ingestion.subscribe(detect_stop_events)
+gps_ingestion.subscribe(refresh_etas_from_ping)
+gps_ingestion.subscribe(publish_position)
+eta_service.compute = compute_route_etas
+eta_service.add_listener(publish_route_etas)
+
+def can_track(user: UserInDB, topic: str) -> bool:
+    """Whether a user may watch a tracking topic"""
+    if user.role == UserRole.MANAGER:
+        return True
+    kind, _, key = topic.partition(":")
+    if user.role == UserRole.CUSTOMER:
+        # Customers follow only routes that deliver to them
+        route = routes_db.get(key) if kind == "route" else None
+        return bool(route) and any(stop.get("customer_id") == user.id for stop in route.get("stops", []))
+    if kind == "location":
+        return key == user.location_id
+    if kind == "driver":
+        driver = users_db.get(key)
+        if user.role == UserRole.DRIVER:
+            return key == user.id
+        return bool(driver) and driver.get("location_id") == user.location_id
+    route = routes_db.get(key)
+    if not route:
+        return False
+    if user.role == UserRole.DRIVER:
+        return route.get("driver_id") == user.id
+    return route.get("location_id") == user.location_id
+
+def tracking_snapshot(topic: str) -> Optional[dict]:
+    """Current state sent when a topic is subscribed, so clients need not wait for the next ping"""
+    kind, _, key = topic.partition(":")
+    if kind == "driver" and key in driver_locations:
+        return position_message(key, driver_locations[key])
+    if kind == "route" and key in routes_db:
+        return route_eta_message(routes_db[key])
+    return None
+
+@app.websocket("/ws/tracking")
+async def live_tracking_socket(websocket: WebSocket, token: str = "", topics: str = ""):
+    """
+    Live positions and ETAs. Connect with ?token=<JWT>&topics=route:<id>,driver:<id>
+    and send {"action": "subscribe" | "unsubscribe", "topics": [...]} to change topics.
+    """
+    try:
+        username = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        username = None
+    user = get_user(username=username) if username else None
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    await live_tracker.serve(
+        websocket,
+        authorize=lambda topic: can_track(user, topic),
+        initial_topics=[t.strip() for t in topics.split(",") if t.strip()],
+        snapshot=tracking_snapshot,
+    )
+
+@app.on_event("shutdown")
+def flush_gps_pings():
+    eta_service.stop()
+    gps_ingestion.stop()
+
 @app.get("/api/routes/{route_id}/progress")
 async def get_route_progress(route_id: str, current_user: UserInDB = Depends(get_current_user)):
     if route_id not in routes_db:
@@ -3869,16 +5231,48 @@ async def get_route_progress(route_id: str, current_user: UserInDB = Depends(get
         "completed_stops": completed_stops,
         "total_stops": total_stops,
         "progress_percentage": (completed_stops / total_stops * 100) if total_stops > 0 else 0,
-        "current_stop": next((s for s in stops if s.get("status") == "pending"), None),
+        "current_stop": next((s for s in stops if s.get("status") in ("arrived", "pending")), None),
         "estimated_completion": calculate_estimated_completion(route)
     }
 
     return progress
 
+def predict_stop_arrivals(route: dict, origin: tuple, start: datetime) -> List[tuple]:
+    """(stop, predicted arrival) for the route's remaining stops from the local ETA model"""
+    model = eta_model.model()
+    stops = [s for s in route.get("stops", []) if s.get("status", "pending") in ("arrived", "pending")]
+    located = [(s, stop_fence_coordinates(s)) for s in stops]
+    located = [(s, c) for s, c in located if c]
+    if not located:
+        return []
+    customers = [customers_db.get(s.get("customer_id")) or {} for s, _ in located]
+    service = model.service_seconds([s.get("customer_id") for s, _ in located],
+                                    [c.get("service_time_minutes") for c in customers])
+    initial_wait = 0.0
+    if located[0][0].get("status") == "arrived":
+        # Still unloading at the current stop; it is the origin, not a leg
+        arrived_at = located[0][0].get("arrived_at")
+        elapsed = (start - datetime.fromisoformat(arrived_at)).total_seconds() if arrived_at else 0.0
+        initial_wait = max(0.0, service[0] - elapsed)
+        located, service = located[1:], service[1:]
+        if not located:
+            return []
+    offsets = model.predict(origin, np.array([c for _, c in located], dtype=float), service, start, initial_wait)
+    return [(stop, start + timedelta(seconds=float(offset))) for (stop, _), offset in zip(located, offsets)]
+
 def update_route_etas(route, current_location):
     """
-    Update ETAs for remaining stops based on current driver location
+    Update ETAs for remaining stops based on current driver location.
+    estimated_arrival is an ISO datetime whichever source computed it.
     """
+    if ETA_SOURCE != "google" or not google_maps.is_configured():
+        now = datetime.now()
+        for stop, arrival in predict_stop_arrivals(route, (current_location["lat"], current_location["lng"]), now):
+            stop["estimated_arrival"] = arrival.isoformat()
+            stop["eta_updated"] = now.isoformat()
+        gps_ingestion.mark_state_dirty()
+        return
+
     try:
         stops = route.get("stops", [])
         pending_stops = [s for s in stops if s.get("status") == "pending"]
@@ -3886,37 +5280,33 @@ def update_route_etas(route, current_location):
         if not pending_stops:
             return
 
-        import googlemaps
-        gmaps = googlemaps.Client(key=os.getenv('GOOGLE_MAPS_API_KEY', ''))
-
         origins = [(current_location["lat"], current_location["lng"])]
         destinations = []
 
         for stop in pending_stops:
             if stop.get("coordinates"):
-                destinations.append((stop["coordinates"]["lat"], stop["coordinates"]["lng"]))
+                destinations.append(as_coordinate_tuple(stop["coordinates"]))
             else:
                 destinations.append(stop["address"])
 
         if destinations:
-            result = gmaps.distance_matrix(
-                origins=origins,
-                destinations=destinations,
-                mode="driving",
+            result = google_maps.distance_matrix(
+                origins,
+                destinations,
                 departure_time="now",
                 traffic_model="best_guess"
             )
 
-            if result['status'] == 'OK':
-                for i, stop in enumerate(pending_stops):
-                    element = result['rows'][0]['elements'][i]
-                    if element['status'] == 'OK':
-                        duration_seconds = element['duration_in_traffic']['value']
-                        eta = datetime.now() + timedelta(seconds=duration_seconds)
-                        stop["estimated_arrival"] = eta.strftime("%H:%M")
-                        stop["eta_updated"] = datetime.now().isoformat()
+            for i, stop in enumerate(pending_stops):
+                element = result.get((0, i))
+                if element and 'duration_in_traffic' in element:
+                    duration_seconds = element['duration_in_traffic']['value']
+                    now = datetime.now()
+                    stop["estimated_arrival"] = (now + timedelta(seconds=duration_seconds)).isoformat()
+                    stop["eta_updated"] = now.isoformat()
 
-        save_data_to_disk()
+        # Persisted by the next GPS flush rather than rewriting every file per ping
+        gps_ingestion.mark_state_dirty()
 
     except Exception as e:
         logging.warning(f"ETA update failed: {e}")
@@ -3932,6 +5322,17 @@ def calculate_estimated_completion(route):
         if not pending_stops:
             return datetime.now().isoformat()
 
+        now = datetime.now()
+        position = driver_locations.get(route.get("driver_id"))
+        origin = (position["lat"], position["lng"]) if position and position.get("lat") is not None else None
+        origin = origin or stop_fence_coordinates(pending_stops[0])
+        arrivals = predict_stop_arrivals(route, origin, now) if origin else []
+        if arrivals:
+            last_stop, last_arrival = arrivals[-1]
+            customer = customers_db.get(last_stop.get("customer_id")) or {}
+            service = eta_model.model().service_seconds([last_stop.get("customer_id")], [customer.get("service_time_minutes")])[0]
+            return (last_arrival + timedelta(seconds=float(service))).isoformat()
+
         avg_time_per_stop = 30  # minutes
         remaining_time = len(pending_stops) * avg_time_per_stop
 
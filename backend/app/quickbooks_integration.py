@@ -1,9 +1,7 @@
 import os
 import json
-import requests
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
-from requests_oauthlib import OAuth2Session
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,6 +16,8 @@ class QuickBooksClient:
         self.scope = ["com.intuit.quickbooks.accounting"]
         
     def get_authorization_url(self, state: str = None) -> tuple[str, str]:
+        from requests_oauthlib import OAuth2Session
+
         oauth = OAuth2Session(
             self.client_id,
             scope=self.scope,
@@ -31,6 +31,8 @@ class QuickBooksClient:
         return authorization_url, state
     
     def exchange_code_for_tokens(self, authorization_response: str, state: str = None) -> Dict[str, Any]:
+        from requests_oauthlib import OAuth2Session
+
         oauth = OAuth2Session(
             self.client_id,
             redirect_uri=self.redirect_uri,
@@ -46,6 +48,8 @@ class QuickBooksClient:
         return token
     
     def refresh_access_token(self, refresh_token: str) -> Dict[str, Any]:
+        from requests_oauthlib import OAuth2Session
+
         oauth = OAuth2Session(self.client_id)
         token = oauth.refresh_token(
             "https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer",
@@ -56,6 +60,8 @@ class QuickBooksClient:
         return token
     
     def make_api_request(self, endpoint: str, access_token: str, realm_id: str, method: str = "GET", data: Dict = None) -> Dict[str, Any]:
+        import requests
+
         headers = {
             "Authorization": f"Bearer {access_token}",
             "Accept": "application/json",
@@ -0,0 +1,398 @@
+"""
+Offline road-network routing engine.
+
+A road graph for the service area is preprocessed once from an OSM XML
+extract into a contraction hierarchy (CH) and saved as a compressed .npz
+file. At runtime the engine loads that file (ROAD_NETWORK_FILE) and answers
+many-to-many distance/duration matrices with bucket-based CH queries, with
+no network access:
+
+    python -m app.road_network build --osm la_tx.osm --output data/la_tx_roads.npz
+    python -m app.road_network query --graph data/la_tx_roads.npz 31.14,-93.26 30.23,-93.22
+
+Durations are the optimized metric; distances are those of the fastest path.
+"""
+import os
+import math
+import time
+import heapq
+import logging
+import argparse
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .distance_matrix import haversine_distance, METERS_PER_MILE
+
+logger = logging.getLogger(__name__)
+
+ROAD_NETWORK_FILE = os.getenv("ROAD_NETWORK_FILE", "")
+# Straight-line legs between a stop and its nearest road node are driven at this speed
+ACCESS_SPEED_MPH = float(os.getenv("ROAD_NETWORK_ACCESS_SPEED_MPH", "20"))
+MAX_SNAP_METERS = float(os.getenv("ROAD_NETWORK_MAX_SNAP_METERS", "5000"))
+WITNESS_SETTLE_LIMIT = 60
+
+# Default free-flow speeds (mph) by OSM highway class, used when maxspeed is missing
+HIGHWAY_SPEEDS_MPH = {
+    "motorway": 65, "motorway_link": 45, "trunk": 55, "trunk_link": 40,
+    "primary": 45, "primary_link": 35, "secondary": 40, "secondary_link": 30,
+    "tertiary": 35, "tertiary_link": 25, "unclassified": 30, "residential": 25,
+    "living_street": 10, "service": 15, "road": 25,
+}
+
+Coordinate = Tuple[float, float]
+
+def _parse_maxspeed(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        number = float(value.split()[0])
+    except ValueError:
+        return None
+    return number if "mph" in value else number * 0.621371
+
+def read_osm_xml(path: str) -> Tuple[np.ndarray, List[Tuple[int, int, float, float]]]:
+    """
+    Read drivable roads from an OSM XML extract.
+
+    Returns node coordinates (N x 2 lat/lng) and directed edges
+    (from, to, meters, seconds) between compact node indices.
+    """
+    import xml.etree.ElementTree as ET
+
+    coordinates: Dict[int, Coordinate] = {}
+    ways = []
+    for _, element in ET.iterparse(path, events=("end",)):
+        if element.tag == "node":
+            coordinates[int(element.get("id"))] = (float(element.get("lat")), float(element.get("lon")))
+            element.clear()
+        elif element.tag == "way":
+            tags = {tag.get("k"): tag.get("v") for tag in element.findall("tag")}
+            highway = tags.get("highway")
+            if highway in HIGHWAY_SPEEDS_MPH and tags.get("access") not in ("no", "private"):
+                refs = [int(nd.get("ref")) for nd in element.findall("nd")]
+                oneway = tags.get("oneway", "yes" if highway in ("motorway", "motorway_link") else "no")
+                speed = _parse_maxspeed(tags.get("maxspeed")) or HIGHWAY_SPEEDS_MPH[highway]
+                ways.append((refs, oneway, speed))
+            element.clear()
+
+    index: Dict[int, int] = {}
+    node_coordinates = []
+    edges = []
+    for refs, oneway, speed in ways:
+        refs = [ref for ref in refs if ref in coordinates]
+        if oneway == "-1":
+            refs.reverse()
+        for a, b in zip(refs, refs[1:]):
+            for ref in (a, b):
+                if ref not in index:
+                    index[ref] = len(node_coordinates)
+                    node_coordinates.append(coordinates[ref])
+            (lat1, lng1), (lat2, lng2) = coordinates[a], coordinates[b]
+            meters = haversine_distance(lat1, lng1, lat2, lng2) * METERS_PER_MILE
+            seconds = meters / METERS_PER_MILE / speed * 3600
+            edges.append((index[a], index[b], meters, seconds))
+            if oneway not in ("yes", "true", "1", "-1"):
+                edges.append((index[b], index[a], meters, seconds))
+    return np.asarray(node_coordinates, dtype=float).reshape(-1, 2), edges
+
+def build_contraction_hierarchy(num_nodes: int, edges: Iterable[Tuple[int, int, float, float]]) -> Dict[str, np.ndarray]:
+    """
+    Contract every node in edge-difference order, adding shortcuts where no
+    witness path exists. Returns the upward forward graph and the upward
+    backward graph as CSR arrays, ready to be saved next to the coordinates.
+    """
+    out_edges: List[Dict[int, Tuple[float, float]]] = [dict() for _ in range(num_nodes)]
+    in_edges: List[Dict[int, Tuple[float, float]]] = [dict() for _ in range(num_nodes)]
+    for u, v, meters, seconds in edges:
+        if u == v:
+            continue
+        if v not in out_edges[u] or seconds < out_edges[u][v][0]:
+            out_edges[u][v] = (seconds, meters)
+            in_edges[v][u] = (seconds, meters)
+
+    contracted = [False] * num_nodes
+    deleted_neighbors = [0] * num_nodes
+
+    def witness_distances(source: int, targets: set, excluded: int, limit: float) -> Dict[int, float]:
+        """Bounded Dijkstra from source that avoids the node being contracted"""
+        distances = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = 0
+        remaining = set(targets)
+        while heap and remaining and settled < WITNESS_SETTLE_LIMIT:
+            d, node = heapq.heappop(heap)
+            if d > limit:
+                break
+            if d > distances.get(node, math.inf):
+                continue
+            remaining.discard(node)
+            settled += 1
+            for neighbor, (seconds, _) in out_edges[node].items():
+                if neighbor == excluded:
+                    continue
+                nd = d + seconds
+                if nd < distances.get(neighbor, math.inf):
+                    distances[neighbor] = nd
+                    heapq.heappush(heap, (nd, neighbor))
+        return distances
+
+    def shortcuts_for(node: int) -> List[Tuple[int, int, float, float]]:
+        shortcuts = []
+        incoming = list(in_edges[node].items())
+        outgoing = list(out_edges[node].items())
+        if not incoming or not outgoing:
+            return shortcuts
+        max_out = max(w[0] for _, w in outgoing)
+        targets = {x for x, _ in outgoing}
+        for u, (in_seconds, in_meters) in incoming:
+            witnesses = witness_distances(u, targets - {u}, node, in_seconds + max_out)
+            for x, (out_seconds, out_meters) in outgoing:
+                if u == x:
+                    continue
+                via = in_seconds + out_seconds
+                if witnesses.get(x, math.inf) > via:
+                    shortcuts.append((u, x, via, in_meters + out_meters))
+        return shortcuts
+
+    def priority(node: int) -> int:
+        degree = len(in_edges[node]) + len(out_edges[node])
+        return len(shortcuts_for(node)) - degree + 2 * deleted_neighbors[node]
+
+    heap = [(priority(node), node) for node in range(num_nodes)]
+    heapq.heapify(heap)
+    rank = np.zeros(num_nodes, dtype=np.int64)
+    up_forward: List[List[Tuple[int, float, float]]] = [[] for _ in range(num_nodes)]
+    up_backward: List[List[Tuple[int, float, float]]] = [[] for _ in range(num_nodes)]
+    level = 0
+    started = time.perf_counter()
+
+    while heap:
+        _, node = heapq.heappop(heap)
+        if contracted[node]:
+            continue
+        current = priority(node)
+        if heap and current > heap[0][0]:
+            heapq.heappush(heap, (current, node))
+            continue
+
+        for u, x, seconds, meters in shortcuts_for(node):
+            if x not in out_edges[u] or seconds < out_edges[u][x][0]:
+                out_edges[u][x] = (seconds, meters)
+                in_edges[x][u] = (seconds, meters)
+
+        # Remaining neighbours are contracted later, so they rank higher;
+        # unlinking the node keeps the remaining graph small
+        for x, (seconds, meters) in out_edges[node].items():
+            up_forward[node].append((x, seconds, meters))
+            deleted_neighbors[x] += 1
+            del in_edges[x][node]
+        for u, (seconds, meters) in in_edges[node].items():
+            up_backward[node].append((u, seconds, meters))
+            deleted_neighbors[u] += 1
+            del out_edges[u][node]
+        out_edges[node] = {}
+        in_edges[node] = {}
+
+        contracted[node] = True
+        rank[node] = level
+        level += 1
+        if level % 50000 == 0:
+            logger.info(f"Contracted {level}/{num_nodes} nodes in {time.perf_counter() - started:.0f}s")
+
+    graph = {"rank": rank}
+    for name, adjacency in (("forward", up_forward), ("backward", up_backward)):
+        indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(a) for a in adjacency])
+        flat = [edge for a in adjacency for edge in a]
+        graph[f"{name}_indptr"] = indptr
+        graph[f"{name}_targets"] = np.asarray([e[0] for e in flat], dtype=np.int64)
+        graph[f"{name}_seconds"] = np.asarray([e[1] for e in flat], dtype=np.float64)
+        graph[f"{name}_meters"] = np.asarray([e[2] for e in flat], dtype=np.float64)
+    return graph
+
+def build_graph_file(osm_path: str, output_path: str):
+    """Preprocess an OSM XML extract into a contraction-hierarchy graph file"""
+    started = time.perf_counter()
+    coordinates, edges = read_osm_xml(osm_path)
+    logger.info(f"Read {len(coordinates)} nodes and {len(edges)} edges in {time.perf_counter() - started:.1f}s")
+    graph = build_contraction_hierarchy(len(coordinates), edges)
+    np.savez_compressed(output_path, coordinates=coordinates, **graph)
+    logger.info(f"Wrote {output_path} in {time.perf_counter() - started:.1f}s")
+
+class RoadNetwork:
+    """A loaded contraction hierarchy plus a KD-tree for snapping stops to road nodes"""
+
+    def __init__(self, coordinates: np.ndarray, graph: Dict[str, np.ndarray]):
+        from scipy.spatial import cKDTree
+
+        self.coordinates = coordinates
+        self._ref_lat = math.radians(float(coordinates[:, 0].mean())) if len(coordinates) else 0.0
+        self._tree = cKDTree(self._project(coordinates))
+        self._adjacency = {}
+        for name in ("forward", "backward"):
+            indptr = graph[f"{name}_indptr"].tolist()
+            targets = graph[f"{name}_targets"].tolist()
+            seconds = graph[f"{name}_seconds"].tolist()
+            meters = graph[f"{name}_meters"].tolist()
+            self._adjacency[name] = [
+                list(zip(targets[indptr[i]:indptr[i + 1]], seconds[indptr[i]:indptr[i + 1]], meters[indptr[i]:indptr[i + 1]]))
+                for i in range(len(indptr) - 1)
+            ]
+
+    @classmethod
+    def load(cls, path: str) -> "RoadNetwork":
+        with np.load(path) as data:
+            graph = {key: data[key] for key in data.files}
+        return cls(graph.pop("coordinates"), graph)
+
+    def __len__(self) -> int:
+        return len(self.coordinates)
+
+    def _project(self, coordinates) -> np.ndarray:
+        points = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+        # Meters on a local equirectangular plane
+        return np.column_stack([
+            np.radians(points[:, 1]) * math.cos(self._ref_lat),
+            np.radians(points[:, 0])
+        ]) * 6371000.0
+
+    def snap(self, coordinates: List[Coordinate]) -> Tuple[List[int], List[float]]:
+        """Nearest road node and straight-line access distance (meters) for each coordinate"""
+        distances, nodes = self._tree.query(self._project(coordinates))
+        return [int(n) for n in np.atleast_1d(nodes)], [float(d) for d in np.atleast_1d(distances)]
+
+    def _upward_search(self, source: int, direction: str) -> Dict[int, Tuple[float, float]]:
+        """Dijkstra over upward edges with stall-on-demand; returns settled (seconds, meters)"""
+        adjacency = self._adjacency[direction]
+        # Edges from higher nodes into a node, to detect nodes reached suboptimally
+        incoming = self._adjacency["backward" if direction == "forward" else "forward"]
+        best = {source: (0.0, 0.0)}
+        heap = [(0.0, 0.0, source)]
+        settled = {}
+        stalled = set()
+        while heap:
+            seconds, meters, node = heapq.heappop(heap)
+            if node in settled or node in stalled:
+                continue
+            if any(best.get(higher, (math.inf,))[0] + edge_seconds < seconds
+                   for higher, edge_seconds, _ in incoming[node]):
+                stalled.add(node)
+                continue
+            settled[node] = (seconds, meters)
+            for neighbor, edge_seconds, edge_meters in adjacency[node]:
+                candidate = seconds + edge_seconds
+                if neighbor not in settled and candidate < best.get(neighbor, (math.inf,))[0]:
+                    best[neighbor] = (candidate, meters + edge_meters)
+                    heapq.heappush(heap, (candidate, meters + edge_meters, neighbor))
+        return settled
+
+    def node_matrix(self, sources: List[int], targets: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Many-to-many (seconds, meters) between road nodes; unreachable pairs are inf"""
+        unique_targets = list(dict.fromkeys(targets))
+        target_column = {node: j for j, node in enumerate(unique_targets)}
+        buckets: Dict[int, List[Tuple[int, float, float]]] = defaultdict(list)
+        for j, target in enumerate(unique_targets):
+            for node, (seconds, meters) in self._upward_search(target, "backward").items():
+                buckets[node].append((j, seconds, meters))
+
+        unique_sources = list(dict.fromkeys(sources))
+        source_row = {node: i for i, node in enumerate(unique_sources)}
+        seconds_matrix = np.full((len(unique_sources), len(unique_targets)), np.inf)
+        meters_matrix = np.full((len(unique_sources), len(unique_targets)), np.inf)
+        for i, source in enumerate(unique_sources):
+            seconds_row = seconds_matrix[i]
+            meters_row = meters_matrix[i]
+            best = [math.inf] * len(unique_targets)
+            for node, (up_seconds, up_meters) in self._upward_search(source, "forward").items():
+                for j, down_seconds, down_meters in buckets.get(node, ()):
+                    total = up_seconds + down_seconds
+                    if total < best[j]:
+                        best[j] = total
+                        seconds_row[j] = total
+                        meters_row[j] = up_meters + down_meters
+
+        rows = [source_row[s] for s in sources]
+        columns = [target_column[t] for t in targets]
+        return seconds_matrix[np.ix_(rows, columns)], meters_matrix[np.ix_(rows, columns)]
+
+    def distance_matrix(self, origins: List[Coordinate], destinations: List[Coordinate]) -> Dict[Tuple[int, int], Tuple[int, int]]:
+        """
+        Driving (meters, seconds) for every origin x destination pair that
+        snaps onto the network and is connected; other pairs are left out.
+        """
+        origin_nodes, origin_access = self.snap(origins)
+        destination_nodes, destination_access = self.snap(destinations)
+        seconds, meters = self.node_matrix(origin_nodes, destination_nodes)
+        access_speed = ACCESS_SPEED_MPH * METERS_PER_MILE / 3600
+        result = {}
+        for i in range(len(origins)):
+            if origin_access[i] > MAX_SNAP_METERS:
+                continue
+            for j in range(len(destinations)):
+                if destination_access[j] > MAX_SNAP_METERS or not math.isfinite(seconds[i, j]):
+                    continue
+                access = origin_access[i] + destination_access[j]
+                result[(i, j)] = (int(meters[i, j] + access), int(seconds[i, j] + access / access_speed))
+        return result
+
+class RoadNetworkEngine:
+    """Process-wide road network, loaded lazily from ROAD_NETWORK_FILE when configured"""
+
+    def __init__(self, path: str = ROAD_NETWORK_FILE):
+        self.path = path
+        self._network: Optional[RoadNetwork] = None
+        self._failed = False
+        self._lock = threading.Lock()
+
+    def network(self) -> Optional[RoadNetwork]:
+        if self._network is None and self.path and not self._failed:
+            with self._lock:
+                if self._network is None and not self._failed:
+                    try:
+                        started = time.perf_counter()
+                        self._network = RoadNetwork.load(self.path)
+                        logger.info(f"Loaded road network ({len(self._network)} nodes) in {time.perf_counter() - started:.1f}s")
+                    except Exception as e:
+                        logger.error(f"Could not load road network from {self.path}: {e}")
+                        self._failed = True
+        return self._network
+
+    def is_available(self) -> bool:
+        return self.network() is not None
+
+    def distance_matrix(self, origins: List[Coordinate], destinations: List[Coordinate]) -> Dict[Tuple[int, int], Tuple[int, int]]:
+        network = self.network()
+        return network.distance_matrix(origins, destinations) if network else {}
+
+road_network = RoadNetworkEngine()
+
+def _parse_coordinate(value: str) -> Coordinate:
+    lat, lng = value.split(",")
+    return float(lat), float(lng)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Offline road-network routing engine")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Preprocess an OSM XML extract into a graph file")
+    build_parser.add_argument("--osm", required=True)
+    build_parser.add_argument("--output", required=True)
+    query_parser = subparsers.add_parser("query", help="Print the driving matrix between coordinates")
+    query_parser.add_argument("--graph", required=True)
+    query_parser.add_argument("points", nargs="+", help="lat,lng")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_graph_file(args.osm, args.output)
+    else:
+        network = RoadNetwork.load(args.graph)
+        points = [_parse_coordinate(p) for p in args.points]
+        started = time.perf_counter()
+        matrix = network.distance_matrix(points, points)
+        print(f"Matrix for {len(points)} points in {(time.perf_counter() - started) * 1000:.1f} ms")
+        for (i, j), (meters, seconds) in sorted(matrix.items()):
+            if i != j:
+                print(f"{i} -> {j}: {meters / METERS_PER_MILE:.1f} mi, {seconds / 60:.0f} min")
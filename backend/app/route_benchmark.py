@@ -0,0 +1,253 @@
+"""
+Route-optimization benchmark on synthetic Louisiana/Texas delivery instances.
+
+Instances are generated reproducibly from a seed: stops are scattered around
+each branch depot in town-sized clusters, orders mix bagged and block ice,
+and the fleet mixes 53/42/20/16ft reefers. Every optimizer runs offline on
+the same haversine matrix and is scored on that matrix, so results are
+comparable between runs and between optimizers.
+
+    python -m app.route_benchmark --sizes 50 200 1000 2000 --output results.json
+    python -m app.route_benchmark --optimizers heuristic --csv results.csv
+"""
+import csv
+import sys
+import json
+import time
+import argparse
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .distance_matrix import haversine_matrices, AVERAGE_SPEED_MPH, METERS_PER_MILE
+from .route_heuristics import solve_heuristic
+from .route_optimizer import optimize_with_ortools, order_load, SolverTelemetry, VEHICLE_TYPE_CAPACITIES
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_DEPOTS = {
+    "leesville": (31.1435, -93.2610),
+    "lake_charles": (30.2266, -93.2174),
+    "lufkin": (31.3382, -94.7291),
+    "jasper": (30.9202, -93.9966),
+}
+DEFAULT_SIZES = [50, 200, 500, 1000, 2000]
+DEFAULT_OPTIMIZERS = ["ortools", "heuristic"]
+
+# Unit weights of the catalogue products, as in the sample product data
+PRODUCT_WEIGHTS = {
+    "prod_1": {"weight_lbs": 8.0},
+    "prod_2": {"weight_lbs": 20.0},
+    "prod_3": {"weight_lbs": 25.0},
+}
+# (product_id, share of orders, (min units, max units))
+PRODUCT_MIX = [
+    ("prod_1", 0.55, (20, 200)),
+    ("prod_2", 0.30, (20, 150)),
+    ("prod_3", 0.15, (50, 400)),
+]
+# (vehicle type, share of fleet)
+FLEET_MIX = [
+    ("53ft_reefer", 0.2),
+    ("42ft_reefer", 0.2),
+    ("20ft_reefer", 0.4),
+    ("16ft_reefer", 0.2),
+]
+SERVICE_AREA_MILES = 60
+FLEET_CAPACITY_HEADROOM = 1.25
+
+RESULT_FIELDS = [
+    "instance", "depot", "stops", "seed", "optimizer", "solve_seconds", "first_solution_seconds", "solutions", "total_distance_miles",
+    "vehicles_used", "fleet_size", "stops_served", "stops_unserved", "capacity_violations", "error"
+]
+
+def generate_instance(depot: str, num_stops: int, seed: int = 0) -> Dict:
+    """Build a reproducible delivery instance around one of the benchmark depots"""
+    rng = np.random.default_rng([seed, num_stops, sorted(BENCHMARK_DEPOTS).index(depot)])
+    depot_lat, depot_lng = BENCHMARK_DEPOTS[depot]
+    miles_per_degree_lng = 69.0 * np.cos(np.radians(depot_lat))
+
+    # Customers cluster around a handful of towns inside the service area
+    num_towns = max(3, num_stops // 40)
+    town_radius = SERVICE_AREA_MILES * np.sqrt(rng.uniform(0, 1, num_towns))
+    town_angle = rng.uniform(0, 2 * np.pi, num_towns)
+    towns = np.column_stack([town_radius * np.sin(town_angle), town_radius * np.cos(town_angle)])
+    town_of_stop = rng.integers(0, num_towns, num_stops)
+    offsets = towns[town_of_stop] + rng.normal(0, 3.0, (num_stops, 2))
+    latitudes = depot_lat + offsets[:, 0] / 69.0
+    longitudes = depot_lng + offsets[:, 1] / miles_per_degree_lng
+
+    product_ids = [product_id for product_id, _, _ in PRODUCT_MIX]
+    shares = np.array([share for _, share, _ in PRODUCT_MIX])
+    product_choice = rng.choice(len(PRODUCT_MIX), size=num_stops, p=shares / shares.sum())
+    orders = []
+    for i in range(num_stops):
+        low, high = PRODUCT_MIX[product_choice[i]][2]
+        quantity = int(rng.integers(low, high + 1))
+        orders.append({
+            "id": f"bench_{i + 1}",
+            "quantity": quantity,
+            "items": [{"product_id": product_ids[product_choice[i]], "quantity": quantity}],
+        })
+
+    coordinates = [(depot_lat, depot_lng)] + list(zip(latitudes.tolist(), longitudes.tolist()))
+    loads = [order_load(order, PRODUCT_WEIGHTS) for order in orders]
+    demands = [0] + [pallets for pallets, _ in loads]
+    weights = [0] + [weight for _, weight in loads]
+
+    # Size the fleet so both its pallet and weight capacity cover the demand with some headroom
+    vehicles = []
+    total_pallets = total_weight = 0
+    needed_pallets = sum(demands) * FLEET_CAPACITY_HEADROOM
+    needed_weight = sum(weights) * FLEET_CAPACITY_HEADROOM
+    fleet_shares = np.array([share for _, share in FLEET_MIX])
+    while total_pallets < needed_pallets or total_weight < needed_weight:
+        vehicle_type, _ = FLEET_MIX[rng.choice(len(FLEET_MIX), p=fleet_shares / fleet_shares.sum())]
+        capacity = VEHICLE_TYPE_CAPACITIES[vehicle_type]
+        vehicles.append({
+            "id": f"veh_{len(vehicles) + 1}",
+            "vehicle_type": vehicle_type,
+            "capacity_pallets": capacity["pallets"],
+            "capacity_weight_lbs": capacity["weight_lbs"],
+        })
+        total_pallets += capacity["pallets"]
+        total_weight += capacity["weight_lbs"]
+
+    return {
+        "name": f"{depot}-{num_stops}-s{seed}",
+        "depot": depot,
+        "seed": seed,
+        "coordinates": coordinates,
+        "demands": demands,
+        "weights": weights,
+        "orders": orders,
+        "vehicles": vehicles,
+    }
+
+def run_ortools(instance: Dict, matrices: Tuple[List[List[int]], List[List[int]]],
+                time_limit_seconds: float, row: Dict) -> List[List[int]]:
+    telemetry = SolverTelemetry(f"benchmark:{instance['name']}")
+    routes = optimize_with_ortools(
+        instance["demands"], instance["coordinates"],
+        [v["capacity_pallets"] for v in instance["vehicles"]],
+        time_limit_seconds=time_limit_seconds,
+        matrices=matrices,
+        weights=instance["weights"],
+        vehicle_weight_capacities=[v["capacity_weight_lbs"] for v in instance["vehicles"]],
+        telemetry=telemetry
+    )
+    row["first_solution_seconds"] = telemetry.to_dict()["first_solution_seconds"]
+    row["solutions"] = telemetry.solutions
+    if routes is None:
+        raise RuntimeError("OR-Tools found no solution")
+    return [[stop["node"] for stop in route["stops"]] for route in routes]
+
+def run_heuristic(instance: Dict, matrices: Tuple[List[List[int]], List[List[int]]],
+                  time_limit_seconds: float, row: Dict) -> List[List[int]]:
+    return solve_heuristic(
+        instance["coordinates"], instance["demands"],
+        [v["capacity_pallets"] for v in instance["vehicles"]],
+        weights=instance["weights"],
+        vehicle_weight_capacities=[v["capacity_weight_lbs"] for v in instance["vehicles"]]
+    )
+
+OPTIMIZERS = {
+    "ortools": run_ortools,
+    "heuristic": run_heuristic,
+}
+
+def score_routes(instance: Dict, routes: List[List[int]], distance_matrix: np.ndarray) -> Dict:
+    """Score a plan (stop nodes per vehicle) on the shared distance matrix"""
+    demands = instance["demands"]
+    total_meters = 0
+    capacity_violations = 0
+    served = set()
+    for route, vehicle in zip(routes, instance["vehicles"]):
+        if not route:
+            continue
+        path = [0] + list(route) + [0]
+        total_meters += int(distance_matrix[path[:-1], path[1:]].sum())
+        if (sum(demands[node] for node in route) > vehicle["capacity_pallets"]
+                or sum(instance["weights"][node] for node in route) > vehicle["capacity_weight_lbs"]):
+            capacity_violations += 1
+        served.update(route)
+    num_stops = len(demands) - 1
+    return {
+        "total_distance_miles": round(total_meters / METERS_PER_MILE, 1),
+        "vehicles_used": sum(1 for route in routes if route),
+        "stops_served": len(served),
+        "stops_unserved": num_stops - len(served),
+        "capacity_violations": capacity_violations,
+    }
+
+def run_benchmark(sizes: List[int], depots: List[str], optimizers: List[str], seed: int = 0,
+                  time_limit_seconds: float = 10) -> List[Dict]:
+    """Run every optimizer on every (depot, size) instance and collect one result row per run"""
+    results = []
+    for depot in depots:
+        for num_stops in sizes:
+            instance = generate_instance(depot, num_stops, seed)
+            matrices = haversine_matrices(instance["coordinates"])
+            distance_matrix = np.asarray(matrices[0])
+            for name in optimizers:
+                row = {
+                    "instance": instance["name"],
+                    "depot": depot,
+                    "stops": num_stops,
+                    "seed": seed,
+                    "optimizer": name,
+                    "fleet_size": len(instance["vehicles"]),
+                    "error": "",
+                }
+                started = time.perf_counter()
+                try:
+                    routes = OPTIMIZERS[name](instance, matrices, time_limit_seconds, row)
+                    row["solve_seconds"] = round(time.perf_counter() - started, 3)
+                    row.update(score_routes(instance, routes, distance_matrix))
+                except Exception as e:
+                    row["solve_seconds"] = round(time.perf_counter() - started, 3)
+                    row["error"] = str(e)
+                    logger.error(f"{name} failed on {instance['name']}: {e}")
+                results.append(row)
+                print(f"{row['instance']:<24} {name:<10} {row['solve_seconds']:>8.2f}s "
+                      f"{row.get('total_distance_miles', '-'):>10} mi  vehicles={row.get('vehicles_used', '-')} "
+                      f"unserved={row.get('stops_unserved', '-')} violations={row.get('capacity_violations', '-')}",
+                      file=sys.stderr)
+    return results
+
+def write_csv(results: List[Dict], path: str):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(results)
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark route optimizers on synthetic LA/TX instances")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--depots", nargs="+", choices=sorted(BENCHMARK_DEPOTS), default=sorted(BENCHMARK_DEPOTS))
+    parser.add_argument("--optimizers", nargs="+", choices=sorted(OPTIMIZERS), default=DEFAULT_OPTIMIZERS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--time-limit", type=float, default=10, help="OR-Tools time limit per instance (seconds)")
+    parser.add_argument("--output", help="Write the results as JSON to this file (default: stdout)")
+    parser.add_argument("--csv", help="Also write the results as CSV to this file")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.sizes, args.depots, args.optimizers, args.seed, args.time_limit)
+    report = {
+        "generated_at": datetime.now().isoformat(),
+        "average_speed_mph": AVERAGE_SPEED_MPH,
+        "time_limit_seconds": args.time_limit,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.csv:
+        write_csv(results, args.csv)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import math
+import time
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MILES_PER_DEGREE_LAT = 69.0
+NEIGHBOR_COUNT = 10
+DEFAULT_IMPROVEMENT_SECONDS = 0.5
+
+def project_coordinates(coordinates: Sequence[Tuple[float, float]]) -> np.ndarray:
+    """Project (lat, lng) pairs onto a local plane in miles (equirectangular around the centroid)"""
+    points = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    ref_lat = math.radians(float(points[:, 0].mean())) if len(points) else 0.0
+    projected = np.empty_like(points)
+    projected[:, 0] = points[:, 1] * MILES_PER_DEGREE_LAT * math.cos(ref_lat)
+    projected[:, 1] = points[:, 0] * MILES_PER_DEGREE_LAT
+    return projected
+
+def nearest_neighbor_routes(points: np.ndarray, demands: Sequence[int], vehicle_capacities: Sequence[int],
+                            depot_index: int = 0, weights: Optional[Sequence[int]] = None,
+                            vehicle_weight_capacities: Optional[Sequence[int]] = None) -> List[List[int]]:
+    """
+    Capacity-aware nearest-neighbour construction, one route per vehicle.
+
+    Each vehicle repeatedly drives to the closest unvisited stop that still
+    fits its remaining pallet (and, if given, weight) capacity. Stops are looked up in a KD-tree, so a step
+    costs O(log n) instead of a scan over every remaining stop.
+    """
+    from scipy.spatial import cKDTree
+
+    size = len(points)
+    demands = np.asarray(demands, dtype=int)
+    if weights is None or vehicle_weight_capacities is None:
+        weights = np.zeros(size, dtype=int)
+        vehicle_weight_capacities = [0] * len(vehicle_capacities)
+    weights = np.asarray(weights, dtype=int)
+    visited = np.zeros(size, dtype=bool)
+    visited[depot_index] = True
+    tree = cKDTree(points)
+    routes = []
+
+    for capacity, weight_capacity in zip(vehicle_capacities, vehicle_weight_capacities):
+        route = []
+        load = 0
+        weight = 0
+        current = points[depot_index]
+        while True:
+            unvisited = ~visited
+            if (not unvisited.any() or demands[unvisited].min() > capacity - load
+                    or weights[unvisited].min() > weight_capacity - weight):
+                break
+            found = None
+            k = min(8, size)
+            while found is None:
+                _, candidates = tree.query(current, k=k)
+                for candidate in np.atleast_1d(candidates):
+                    if (not visited[candidate] and load + demands[candidate] <= capacity
+                            and weight + weights[candidate] <= weight_capacity):
+                        found = int(candidate)
+                        break
+                if k >= size:
+                    break
+                k = min(k * 4, size)
+            if found is None:
+                break
+            visited[found] = True
+            load += int(demands[found])
+            weight += int(weights[found])
+            route.append(found)
+            current = points[found]
+        routes.append(route)
+
+    return routes
+
+def _tour_length(tour: List[int], points: np.ndarray) -> float:
+    path = points[tour]
+    return float(np.sqrt(((path[1:] - path[:-1]) ** 2).sum(axis=1)).sum())
+
+def improve_route(route: List[int], points: np.ndarray, depot_index: int = 0,
+                  neighbors: Optional[np.ndarray] = None, deadline: Optional[float] = None) -> List[int]:
+    """
+    Improve a single route with neighbour-list 2-opt and Or-opt moves.
+
+    Only the NEIGHBOR_COUNT closest stops of each stop are tried as move
+    partners, which keeps each pass O(n) for large routes. Deliveries are
+    reordered within the route, so vehicle load is unaffected. The deadline
+    is checked before every stop a pass tries, so a long pass stops on time.
+    """
+    if len(route) < 3:
+        return list(route)
+
+    tour = [depot_index] + list(route) + [depot_index]
+    if neighbors is None:
+        from scipy.spatial import cKDTree
+        k = min(NEIGHBOR_COUNT + 1, len(points))
+        neighbors = cKDTree(points).query(points, k=k)[1]
+
+    xs = points[:, 0].tolist()
+    ys = points[:, 1].tolist()
+
+    def dist(a: int, b: int) -> float:
+        return math.hypot(xs[a] - xs[b], ys[a] - ys[b])
+
+    def expired() -> bool:
+        return deadline is not None and time.perf_counter() > deadline
+
+    in_route = set(route)
+    improved = True
+    while improved and not expired():
+        improved = False
+        position = {node: i for i, node in enumerate(tour[:-1]) if node != depot_index}
+        position[depot_index] = 0
+
+        # 2-opt: replace edges (a, b) and (c, d) with (a, c) and (b, d)
+        for i in range(len(tour) - 2):
+            if expired():
+                return tour[1:-1]
+            a, b = tour[i], tour[i + 1]
+            for c in neighbors[a]:
+                c = int(c)
+                if c == a or c == depot_index or c not in in_route:
+                    continue
+                j = position[c]
+                if j <= i + 1:
+                    continue
+                d = tour[j + 1]
+                delta = dist(a, c) + dist(b, d) - dist(a, b) - dist(c, d)
+                if delta < -1e-9:
+                    tour[i + 1:j + 1] = reversed(tour[i + 1:j + 1])
+                    for offset in range(i + 1, j + 1):
+                        position[tour[offset]] = offset
+                    improved = True
+                    break
+
+        # Or-opt: move a segment of 1-3 stops next to one of its neighbours
+        for segment_length in (1, 2, 3):
+            i = 1
+            while i + segment_length < len(tour):
+                if expired():
+                    return tour[1:-1]
+                first, last = tour[i], tour[i + segment_length - 1]
+                prev_node, next_node = tour[i - 1], tour[i + segment_length]
+                removal_gain = dist(prev_node, first) + dist(last, next_node) - dist(prev_node, next_node)
+                moved = False
+                for c in neighbors[first]:
+                    c = int(c)
+                    if c == first or (c != depot_index and c not in in_route):
+                        continue
+                    j = tour.index(c) if c == depot_index else position.get(c)
+                    if j is None or i - 1 <= j <= i + segment_length - 1:
+                        continue
+                    after = tour[j + 1]
+                    insertion_cost = dist(c, last) + dist(first, after) - dist(c, after)
+                    if insertion_cost - removal_gain < -1e-9:
+                        segment = tour[i:i + segment_length]
+                        del tour[i:i + segment_length]
+                        insert_at = j if j < i else j - segment_length
+                        tour[insert_at + 1:insert_at + 1] = reversed(segment)
+                        position = {node: k for k, node in enumerate(tour[:-1]) if node != depot_index}
+                        improved = moved = True
+                        break
+                if not moved:
+                    i += 1
+
+    return tour[1:-1]
+
+def solve_heuristic(coordinates: Sequence[Tuple[float, float]], demands: Sequence[int], vehicle_capacities: Sequence[int],
+                    depot_index: int = 0, improve: bool = True,
+                    time_budget_seconds: float = DEFAULT_IMPROVEMENT_SECONDS,
+                    weights: Optional[Sequence[int]] = None,
+                    vehicle_weight_capacities: Optional[Sequence[int]] = None) -> List[List[int]]:
+    """
+    Fast fallback route constructor: KD-tree nearest neighbour plus 2-opt/Or-opt.
+
+    Returns one list of node indices (excluding the depot) per vehicle. Stops
+    that do not fit any vehicle are left out. Time windows are not modelled.
+    """
+    points = project_coordinates(coordinates)
+    routes = nearest_neighbor_routes(points, demands, vehicle_capacities, depot_index,
+                                     weights, vehicle_weight_capacities)
+    if improve and len(points) > 3:
+        from scipy.spatial import cKDTree
+        deadline = time.perf_counter() + time_budget_seconds
+        neighbors = cKDTree(points).query(points, k=min(NEIGHBOR_COUNT + 1, len(points)))[1]
+        routes = [improve_route(route, points, depot_index, neighbors, deadline) for route in routes]
+    return routes
+
+def route_length_miles(route: List[int], coordinates: Sequence[Tuple[float, float]], depot_index: int = 0) -> float:
+    """Planar length of a depot-to-depot route in miles"""
+    if not route:
+        return 0.0
+    return _tour_length([depot_index] + list(route) + [depot_index], project_coordinates(coordinates))
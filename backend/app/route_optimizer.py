@@ -0,0 +1,411 @@
+import os
+import math
+import time as timer
+import logging
+import threading
+from collections import deque
+from datetime import datetime, date, time, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .distance_matrix import build_matrices
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SERVICE_MINUTES = 15
+DEFAULT_TIME_LIMIT_SECONDS = float(os.getenv("ROUTE_SOLVER_TIME_LIMIT_SECONDS", "10"))
+MIN_TIME_LIMIT_SECONDS = 0.5
+MAX_TIME_LIMIT_SECONDS = float(os.getenv("ROUTE_SOLVER_MAX_TIME_LIMIT_SECONDS", "120"))
+ROUTE_DAY_START = os.getenv("ROUTE_DAY_START", "06:00")
+ROUTE_DAY_END = os.getenv("ROUTE_DAY_END", "20:00")
+# Penalty (in meters of arc cost) for leaving a stop unserved; large enough that
+# the solver only drops stops whose delivery window cannot be met.
+DROP_PENALTY = 10_000_000
+
+# A pallet of ice is built up to this weight, so a product's units per pallet
+# follow from its bag/block weight (125 x 8lb, 50 x 20lb, 40 x 25lb block)
+PALLET_LOAD_LBS = float(os.getenv("PALLET_LOAD_LBS", "1000"))
+DEFAULT_UNITS_PER_PALLET = 50
+DEFAULT_UNIT_WEIGHT_LBS = 20.0
+
+# Pallet positions and legal payload per reefer type
+VEHICLE_TYPE_CAPACITIES = {
+    "53ft_reefer": {"pallets": 26, "weight_lbs": 43000},
+    "42ft_reefer": {"pallets": 20, "weight_lbs": 34000},
+    "20ft_reefer": {"pallets": 10, "weight_lbs": 12000},
+    "16ft_reefer": {"pallets": 8, "weight_lbs": 7500},
+}
+
+def parse_time_of_day(value) -> Optional[int]:
+    """Convert an 'HH:MM' string (or time) into seconds since midnight"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, time):
+        return value.hour * 3600 + value.minute * 60 + value.second
+    try:
+        parts = str(value).strip().split(":")
+        hours = int(parts[0])
+        minutes = int(parts[1]) if len(parts) > 1 else 0
+        return hours * 3600 + minutes * 60
+    except (ValueError, IndexError):
+        logger.warning(f"Invalid time of day: {value}")
+        return None
+
+def seconds_to_datetime(seconds: int, day: Optional[date] = None) -> datetime:
+    """Convert seconds since midnight into a datetime on the given day"""
+    return datetime.combine(day or date.today(), time()) + timedelta(seconds=int(seconds))
+
+def customer_time_window(customer: dict) -> Tuple[int, int]:
+    """Delivery window for a customer in seconds since midnight, defaulting to the route day"""
+    day_start = parse_time_of_day(ROUTE_DAY_START)
+    day_end = parse_time_of_day(ROUTE_DAY_END)
+    start = parse_time_of_day(customer.get("delivery_window_start"))
+    end = parse_time_of_day(customer.get("delivery_window_end"))
+    start = day_start if start is None else start
+    end = day_end if end is None else end
+    if end <= start:
+        logger.warning(f"Ignoring empty delivery window for customer {customer.get('id')}")
+        return day_start, day_end
+    return start, end
+
+def customer_service_seconds(customer: dict) -> int:
+    """Time spent unloading at a customer stop"""
+    minutes = customer.get("service_time_minutes")
+    if minutes is None:
+        minutes = DEFAULT_SERVICE_MINUTES
+    return int(float(minutes) * 60)
+
+def order_items(order: dict) -> List[Tuple[Optional[str], int]]:
+    """(product_id, quantity) lines of an order, single-product or multi-item"""
+    if order.get("items"):
+        return [(item.get("product_id"), int(item.get("quantity", 1))) for item in order["items"]]
+    if "quantity" in order:
+        return [(order.get("product_id"), int(order["quantity"]))]
+    return []
+
+def order_load(order: dict, products: Optional[Dict[str, dict]] = None) -> Tuple[int, int]:
+    """Pallets (rounded up, at least one) and weight in pounds for an order"""
+    products = products or {}
+    pallets = 0.0
+    weight = 0.0
+    for product_id, quantity in order_items(order):
+        product = products.get(product_id) or {}
+        unit_weight = float(product.get("weight_lbs") or 0)
+        if unit_weight > 0:
+            pallets += quantity / max(1, int(PALLET_LOAD_LBS // unit_weight))
+            weight += quantity * unit_weight
+        else:
+            pallets += quantity / DEFAULT_UNITS_PER_PALLET
+            weight += quantity * DEFAULT_UNIT_WEIGHT_LBS
+    return max(1, math.ceil(pallets - 1e-9)), int(math.ceil(weight))
+
+def order_pallets(order: dict, products: Optional[Dict[str, dict]] = None) -> int:
+    """Convert an order's unit quantities into pallets using each product's weight"""
+    return order_load(order, products)[0]
+
+def vehicle_capacity(vehicle: dict) -> Tuple[int, int]:
+    """Pallet and weight capacity of a vehicle, defaulting from its reefer type"""
+    vehicle_type = vehicle.get("vehicle_type")
+    type_capacity = VEHICLE_TYPE_CAPACITIES.get(getattr(vehicle_type, "value", vehicle_type), {})
+    pallets = vehicle.get("capacity_pallets") or type_capacity.get("pallets", 20)
+    weight = vehicle.get("capacity_weight_lbs") or type_capacity.get("weight_lbs")
+    if not weight:
+        weight = int(pallets * PALLET_LOAD_LBS)
+    return int(pallets), int(weight)
+
+def clamp_time_limit(seconds: Optional[float]) -> float:
+    """Bound a requested solver time budget, falling back to the configured default"""
+    if seconds is None:
+        return DEFAULT_TIME_LIMIT_SECONDS
+    return min(max(float(seconds), MIN_TIME_LIMIT_SECONDS), MAX_TIME_LIMIT_SECONDS)
+
+class SolverTelemetry:
+    """What the solver did during one solve: first-solution time, improvement curve and effort"""
+
+    def __init__(self, label: str = "optimize"):
+        self.label = label
+        self.started_at = datetime.now()
+        self._started = timer.perf_counter()
+        self.time_limit_seconds: Optional[float] = None
+        self.nodes = 0
+        self.vehicles = 0
+        self.first_solution_seconds: Optional[float] = None
+        self.improvements: List[Tuple[float, int]] = []
+        self.solutions = 0
+        self.branches = 0
+        self.failures = 0
+        self.status = "not_started"
+        self.final_objective: Optional[int] = None
+        self.total_seconds: Optional[float] = None
+
+    def elapsed(self) -> float:
+        return timer.perf_counter() - self._started
+
+    @property
+    def best_objective(self) -> Optional[int]:
+        return self.improvements[-1][1] if self.improvements else None
+
+    def record_solution(self, objective: int) -> bool:
+        """Count a solution; returns True if it improves on the best so far"""
+        self.solutions += 1
+        elapsed = self.elapsed()
+        if self.first_solution_seconds is None:
+            self.first_solution_seconds = elapsed
+        if self.best_objective is None or objective < self.best_objective:
+            self.improvements.append((elapsed, objective))
+            return True
+        return False
+
+    def finish(self, status: str, objective: Optional[int] = None, branches: int = 0, failures: int = 0):
+        self.status = status
+        self.final_objective = objective
+        self.branches = branches
+        self.failures = failures
+        self.total_seconds = self.elapsed()
+
+    def to_dict(self) -> Dict:
+        return {
+            "label": self.label,
+            "started_at": self.started_at.isoformat(),
+            "time_limit_seconds": self.time_limit_seconds,
+            "nodes": self.nodes,
+            "vehicles": self.vehicles,
+            "status": self.status,
+            "first_solution_seconds": round(self.first_solution_seconds, 3) if self.first_solution_seconds is not None else None,
+            "total_seconds": round(self.total_seconds, 3) if self.total_seconds is not None else None,
+            "solutions": self.solutions,
+            "branches": self.branches,
+            "failures": self.failures,
+            "final_objective": self.final_objective,
+            "improvements": [{"seconds": round(seconds, 3), "objective": objective} for seconds, objective in self.improvements],
+        }
+
+# Most recent solves, newest last, for the telemetry endpoint
+solver_telemetry_log: deque = deque(maxlen=int(os.getenv("ROUTE_SOLVER_TELEMETRY_HISTORY", "50")))
+_telemetry_lock = threading.Lock()
+
+def record_telemetry(telemetry: SolverTelemetry):
+    with _telemetry_lock:
+        solver_telemetry_log.append(telemetry)
+
+def recent_telemetry(limit: int = 20) -> List[Dict]:
+    with _telemetry_lock:
+        entries = list(solver_telemetry_log)[-limit:]
+    return [t.to_dict() for t in reversed(entries)]
+
+def optimize_with_ortools(demands: List[int], coordinates: List[Tuple[float, float]], vehicle_capacities: List[int],
+                          time_windows: Optional[List[Tuple[int, int]]] = None,
+                          service_times: Optional[List[int]] = None,
+                          departure_seconds: Optional[int] = None,
+                          time_limit_seconds: Optional[float] = None,
+                          starts: Optional[List[int]] = None,
+                          ends: Optional[List[int]] = None,
+                          initial_routes: Optional[List[List[int]]] = None,
+                          matrices: Optional[Tuple[List[List[int]], List[List[int]]]] = None,
+                          weights: Optional[List[int]] = None,
+                          vehicle_weight_capacities: Optional[List[int]] = None,
+                          allowed_vehicles: Optional[Dict[int, List[int]]] = None,
+                          on_solution: Optional[Callable[[Dict], None]] = None,
+                          telemetry: Optional[SolverTelemetry] = None) -> Optional[List[Dict]]:
+    """
+    Solve a capacitated VRP with delivery time windows using Google OR-Tools.
+    Demands/capacities are in pallets; when weights are given a second
+    capacity dimension limits the payload in pounds.
+
+    Node 0 is the depot unless per-vehicle start/end nodes are given. Returns
+    one entry per vehicle with its ordered stops ({"node": index,
+    "arrival_seconds": seconds since midnight}) and the time it gets back to
+    its end node. Stops whose window cannot be met are left out; returns None
+    if the solver finds no solution.
+
+    When initial_routes (stop nodes per vehicle) are given the search is
+    warm-started from them and only repairs/improves that plan. Precomputed
+    (distance, travel time) matrices may be passed instead of using the cache.
+    allowed_vehicles restricts a stop node to the listed vehicle indices.
+
+    The search runs for time_limit_seconds (default from the environment).
+    In anytime mode on_solution is called from the solver thread with every
+    improving plan ({"solution", "elapsed_seconds", "objective", "routes"}).
+    Each solve is recorded in the telemetry log.
+    """
+    telemetry = telemetry or SolverTelemetry()
+    time_limit_seconds = clamp_time_limit(time_limit_seconds)
+    telemetry.time_limit_seconds = time_limit_seconds
+    telemetry.nodes = len(coordinates)
+    telemetry.vehicles = len(vehicle_capacities)
+    try:
+        from ortools.constraint_solver import routing_enums_pb2
+        from ortools.constraint_solver import pywrapcp
+
+        size = len(coordinates)
+        num_vehicles = len(vehicle_capacities)
+        if size < 2 or num_vehicles == 0:
+            return None
+
+        starts = starts or [0] * num_vehicles
+        ends = ends or [0] * num_vehicles
+        terminal_nodes = set(starts) | set(ends)
+
+        day_start = parse_time_of_day(ROUTE_DAY_START)
+        day_end = parse_time_of_day(ROUTE_DAY_END)
+        if time_windows is None:
+            time_windows = [(day_start, day_end)] * size
+        if service_times is None:
+            service_times = [0 if node in terminal_nodes else DEFAULT_SERVICE_MINUTES * 60 for node in range(size)]
+        if departure_seconds is None:
+            departure_seconds = day_start
+
+        distance_matrix, travel_matrix = matrices or build_matrices(coordinates)
+        # Arc time includes the service time spent at the origin stop
+        time_matrix = [
+            [travel_matrix[i][j] + service_times[i] if i != j else 0 for j in range(size)]
+            for i in range(size)
+        ]
+
+        manager = pywrapcp.RoutingIndexManager(size, num_vehicles, starts, ends)
+        routing = pywrapcp.RoutingModel(manager)
+
+        distance_callback_index = routing.RegisterTransitMatrix(distance_matrix)
+        routing.SetArcCostEvaluatorOfAllVehicles(distance_callback_index)
+
+        demand_callback_index = routing.RegisterUnaryTransitVector([int(d) for d in demands])
+        routing.AddDimensionWithVehicleCapacity(
+            demand_callback_index,
+            0,  # null capacity slack
+            [int(c) for c in vehicle_capacities],  # vehicle maximum capacities
+            True,  # start cumul to zero
+            'Capacity'
+        )
+
+        if weights is not None and vehicle_weight_capacities is not None:
+            weight_callback_index = routing.RegisterUnaryTransitVector([int(w) for w in weights])
+            routing.AddDimensionWithVehicleCapacity(
+                weight_callback_index,
+                0,
+                [int(c) for c in vehicle_weight_capacities],
+                True,
+                'Weight'
+            )
+
+        time_callback_index = routing.RegisterTransitMatrix(time_matrix)
+        routing.AddDimension(
+            time_callback_index,
+            day_end,  # allow waiting for a window to open
+            24 * 3600,  # horizon
+            False,  # vehicles start at their departure time, not midnight
+            'Time'
+        )
+        time_dimension = routing.GetDimensionOrDie('Time')
+
+        for node in range(size):
+            if node in terminal_nodes:
+                continue
+            index = manager.NodeToIndex(node)
+            window_start, window_end = time_windows[node]
+            time_dimension.CumulVar(index).SetRange(window_start, window_end)
+            routing.AddDisjunction([index], DROP_PENALTY)
+            if allowed_vehicles and node in allowed_vehicles:
+                # -1 keeps the stop droppable through its disjunction
+                routing.VehicleVar(index).SetValues([-1] + [int(v) for v in allowed_vehicles[node]])
+
+        for vehicle_id in range(num_vehicles):
+            start_index = routing.Start(vehicle_id)
+            end_index = routing.End(vehicle_id)
+            vehicle_departure = max(departure_seconds, time_windows[starts[vehicle_id]][0])
+            time_dimension.CumulVar(start_index).SetRange(
+                vehicle_departure, max(vehicle_departure, time_windows[starts[vehicle_id]][1])
+            )
+            time_dimension.CumulVar(end_index).SetRange(vehicle_departure, 24 * 3600)
+            routing.AddVariableMinimizedByFinalizer(time_dimension.CumulVar(start_index))
+            routing.AddVariableMinimizedByFinalizer(time_dimension.CumulVar(end_index))
+
+        search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+        search_parameters.first_solution_strategy = (
+            routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+        )
+        search_parameters.local_search_metaheuristic = (
+            routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+        )
+        search_parameters.time_limit.FromMilliseconds(int(time_limit_seconds * 1000))
+
+        def current_routes() -> List[Dict]:
+            routes = []
+            for vehicle_id in range(num_vehicles):
+                stops = []
+                index = routing.NextVar(routing.Start(vehicle_id)).Value()
+                while not routing.IsEnd(index):
+                    stops.append({"node": manager.IndexToNode(index), "arrival_seconds": time_dimension.CumulVar(index).Min()})
+                    index = routing.NextVar(index).Value()
+                routes.append({"vehicle_index": vehicle_id, "stops": stops})
+            return routes
+
+        def at_solution():
+            objective = routing.CostVar().Value()
+            if telemetry.record_solution(objective) and on_solution:
+                try:
+                    on_solution({
+                        "solution": len(telemetry.improvements),
+                        "elapsed_seconds": round(telemetry.elapsed(), 3),
+                        "objective": objective,
+                        "routes": current_routes()
+                    })
+                except Exception as e:
+                    logger.warning(f"Solution callback failed: {e}")
+
+        routing.AddAtSolutionCallback(at_solution)
+
+        solution = None
+        if initial_routes is not None:
+            # Repairing an existing plan only needs to reach a local optimum
+            search_parameters.local_search_metaheuristic = (
+                routing_enums_pb2.LocalSearchMetaheuristic.GREEDY_DESCENT
+            )
+            routing.CloseModelWithParameters(search_parameters)
+            initial_assignment = routing.ReadAssignmentFromRoutes(
+                [[manager.NodeToIndex(node) for node in route] for route in initial_routes], True
+            )
+            if initial_assignment:
+                solution = routing.SolveFromAssignmentWithParameters(initial_assignment, search_parameters)
+            else:
+                logger.warning("Initial routes are infeasible; re-planning from scratch")
+
+        if not solution:
+            solution = routing.SolveWithParameters(search_parameters)
+
+        solver = routing.solver()
+        if not solution:
+            telemetry.finish("no_solution", branches=solver.Branches(), failures=solver.Failures())
+            return None
+        telemetry.finish("solved", solution.ObjectiveValue(), solver.Branches(), solver.Failures())
+
+        routes = []
+        for vehicle_id in range(num_vehicles):
+            stops = []
+            start_index = routing.Start(vehicle_id)
+            index = solution.Value(routing.NextVar(start_index))
+            while not routing.IsEnd(index):
+                stops.append({
+                    "node": manager.IndexToNode(index),
+                    "arrival_seconds": solution.Min(time_dimension.CumulVar(index))
+                })
+                index = solution.Value(routing.NextVar(index))
+            routes.append({
+                "vehicle_index": vehicle_id,
+                "stops": stops,
+                "departure_seconds": solution.Min(time_dimension.CumulVar(start_index)),
+                "return_seconds": solution.Min(time_dimension.CumulVar(index))
+            })
+
+        return routes
+
+    except Exception as e:
+        logger.error(f"OR-Tools optimization error: {e}")
+        telemetry.finish("error")
+        return None
+    finally:
+        if telemetry.total_seconds is None:
+            telemetry.finish("skipped")
+        record_telemetry(telemetry)
+        logger.info(
+            f"Solver {telemetry.label}: {telemetry.status} in {telemetry.total_seconds:.2f}s, "
+            f"first solution {telemetry.first_solution_seconds}, objective {telemetry.final_objective}"
+        )
@@ -0,0 +1,121 @@
+"""
+Parallel what-if evaluation of dispatch scenarios.
+
+Every scenario of a batch (a truck in the shop, an extra reefer, stops moved
+to another branch) is a variation of the same orders and depots, so the
+distance/time matrix is built once and placed in shared memory. Scenarios
+are then solved side by side in a process pool: each worker attaches to the
+shared matrix, takes the rows/columns of its scenario's nodes and runs
+OR-Tools on them. Nothing here reads or writes the live dispatch data.
+"""
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .route_optimizer import optimize_with_ortools, SolverTelemetry
+
+logger = logging.getLogger(__name__)
+
+SCENARIO_WORKERS = int(os.getenv("ROUTE_SCENARIO_WORKERS", str(min(4, os.cpu_count() or 1))))
+MAX_SCENARIOS = int(os.getenv("ROUTE_MAX_SCENARIOS", "12"))
+
+class SharedMatrix:
+    """Distance and travel-time matrices in one shared-memory block, shape (2, n, n)"""
+
+    def __init__(self, matrices: Tuple[List[List[int]], List[List[int]]]):
+        data = np.asarray(matrices, dtype=np.int64)
+        self.shape = data.shape
+        self.block = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+        np.ndarray(self.shape, dtype=np.int64, buffer=self.block.buf)[:] = data
+
+    @property
+    def name(self) -> str:
+        return self.block.name
+
+    def release(self):
+        self.block.close()
+        self.block.unlink()
+
+def _solve_scenario(matrix_name: str, shape: Tuple[int, int, int], task: Dict) -> Dict:
+    """Worker: solve one scenario on its slice of the shared matrix"""
+    block = shared_memory.SharedMemory(name=matrix_name)
+    try:
+        full = np.ndarray(shape, dtype=np.int64, buffer=block.buf)
+        nodes = np.asarray(task["nodes"])
+        meters = full[0][np.ix_(nodes, nodes)].tolist()
+        seconds = full[1][np.ix_(nodes, nodes)].tolist()
+    finally:
+        block.close()
+
+    telemetry = SolverTelemetry(f"scenario:{task['name']}")
+    routes = optimize_with_ortools(
+        task["demands"], task["coordinates"], task["vehicle_capacities"],
+        time_windows=task["time_windows"], service_times=task["service_times"],
+        departure_seconds=task["departure_seconds"], time_limit_seconds=task["time_limit_seconds"],
+        starts=task["starts"], ends=task["starts"], matrices=(meters, seconds),
+        weights=task["weights"], vehicle_weight_capacities=task["vehicle_weight_capacities"],
+        allowed_vehicles=task["allowed_vehicles"], telemetry=telemetry
+    )
+    distance_meters = 0
+    for route in routes or []:
+        path = [task["starts"][route["vehicle_index"]]] + [stop["node"] for stop in route["stops"]] + [task["starts"][route["vehicle_index"]]]
+        route["distance_meters"] = sum(meters[a][b] for a, b in zip(path, path[1:])) if route["stops"] else 0
+        distance_meters += route["distance_meters"]
+    return {"routes": routes, "distance_meters": distance_meters, "solver": telemetry.to_dict()}
+
+class ScenarioRunner:
+    """Process pool that solves scenario batches against a shared matrix"""
+
+    def __init__(self, workers: int = SCENARIO_WORKERS):
+        self.workers = max(1, workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Spawned workers do not inherit the API's threads or in-memory data
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def run(self, matrices: Tuple[List[List[int]], List[List[int]]], tasks: List[Dict]) -> List[Dict]:
+        """Solve every task; a failed scenario gets an "error" instead of failing the batch"""
+        shared = SharedMatrix(matrices)
+        try:
+            try:
+                pool = self._pool()
+                futures = [pool.submit(_solve_scenario, shared.name, shared.shape, task) for task in tasks]
+            except BrokenProcessPool:
+                self.shutdown()
+                pool = self._pool()
+                futures = [pool.submit(_solve_scenario, shared.name, shared.shape, task) for task in tasks]
+            results = []
+            for task, future in zip(tasks, futures):
+                try:
+                    results.append(future.result())
+                except BrokenProcessPool as e:
+                    logger.error(f"Scenario worker died on {task['name']}: {e}")
+                    self.shutdown()
+                    results.append({"error": "Scenario worker crashed"})
+                except Exception as e:
+                    logger.error(f"Scenario {task['name']} failed: {e}")
+                    results.append({"error": str(e)})
+            return results
+        finally:
+            shared.release()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+scenario_runner = ScenarioRunner()
@@ -0,0 +1,78 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+SOLUTION_CACHE_TTL_SECONDS = float(os.getenv("ROUTE_SOLUTION_CACHE_TTL_SECONDS", "900"))
+SOLUTION_CACHE_MAX_ENTRIES = int(os.getenv("ROUTE_SOLUTION_CACHE_MAX_ENTRIES", "64"))
+# Bump when the solver model changes so plans from an older model are not reused
+SOLVER_MODEL_VERSION = 2
+
+def fingerprint(payload: Any) -> str:
+    """Stable hash of a JSON-serializable description of the solver inputs"""
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+class SolutionCache:
+    """
+    LRU cache of applied route plans, one per optimization scope (branch or
+    branch set, and solver time budget).
+
+    An entry records the routes a solve created, with fingerprints of the
+    routes and orders as stored and of the orders still pending. Repeating the
+    request while those still match returns the same routes instead of
+    solving and creating them again. The caller passes an is_current check
+    to get(); an entry that fails it is dropped. Entries also expire after a
+    TTL so arrival times do not drift too far from the clock.
+    """
+
+    def __init__(self, ttl_seconds: float = SOLUTION_CACHE_TTL_SECONDS, max_entries: int = SOLUTION_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, is_current: Optional[Callable[[Dict], bool]] = None) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is None or time.monotonic() - entry["stored_at"] > self.ttl_seconds
+                    or (is_current is not None and not is_current(entry["value"]))):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["value"]
+
+    def put(self, key: str, value: Dict):
+        with self._lock:
+            self._entries[key] = {"value": value, "stored_at": time.monotonic()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "ttl_seconds": self.ttl_seconds,
+                "max_entries": self.max_entries
+            }
+
+solution_cache = SolutionCache()
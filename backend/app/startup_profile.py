@@ -0,0 +1,148 @@
+"""
+Startup profile: where the API's boot time goes.
+
+The server cannot answer until app.main has been imported, so import time is
+startup time. While the API module loads, StartupProfiler wraps
+builtins.__import__ and records every module imported for the first time
+with its inclusive time (including the modules it imports) and its self time
+(its own body). Boot steps that are not imports (loading data, sample data)
+are timed with phase(). finish() runs at server startup; it removes the hook
+and logs the slowest packages, and report() is served at
+/api/system/startup-profile.
+
+Heavy optional dependencies (Prophet, scikit-learn, OR-Tools, pandas,
+reportlab, ...) are imported by the functions that use them. The report
+lists which of them were loaded at boot, so an eager import shows up.
+"""
+import os
+import sys
+import time
+import logging
+import builtins
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from importlib.util import resolve_name
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STARTUP_PROFILE_ENABLED = os.getenv("STARTUP_PROFILE", "true").lower() == "true"
+STARTUP_PROFILE_TOP = int(os.getenv("STARTUP_PROFILE_TOP", "15"))
+# Dependencies that only some endpoints need; none should be loaded at boot
+LAZY_DEPENDENCIES = (
+    "prophet", "sklearn", "ortools", "pandas", "reportlab", "scipy",
+    "gspread", "requests", "requests_oauthlib", "googlemaps",
+)
+
+class StartupProfiler:
+    """Per-module import times and named phases of one boot"""
+
+    def __init__(self):
+        self.modules: Dict[str, Tuple[float, float]] = {}  # module -> (inclusive, self) seconds
+        self.phases: Dict[str, float] = {}
+        self.import_seconds = 0.0
+        self.started = time.perf_counter()
+        self.boot_seconds: Optional[float] = None
+        self.finished_at: Optional[str] = None
+        self.loaded_at_boot: List[str] = []
+        self._original_import = None
+        self._local = threading.local()
+
+    def start(self):
+        """Install the import hook; call before the API's own imports"""
+        if not STARTUP_PROFILE_ENABLED or self._original_import is not None:
+            return
+        self.started = time.perf_counter()
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._import
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original = self._original_import or builtins.__import__
+        module = name
+        if level:
+            try:
+                module = resolve_name("." * level + name, (globals or {}).get("__package__"))
+            except (ImportError, ValueError):
+                pass
+        if module in sys.modules:
+            return original(name, globals, locals, fromlist, level)
+
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(0.0)  # time spent in nested first imports
+        started = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            else:
+                self.import_seconds += elapsed
+            self.modules[module] = (elapsed, elapsed - nested)
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a boot step that is not an import"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def finish(self) -> Dict:
+        """Remove the hook, freeze the boot time and log the summary"""
+        if self.boot_seconds is None:
+            if self._original_import is not None and builtins.__import__ == self._import:
+                builtins.__import__ = self._original_import
+            self._original_import = None
+            self.boot_seconds = time.perf_counter() - self.started
+            self.finished_at = datetime.now().isoformat()
+            self.loaded_at_boot = [name for name in LAZY_DEPENDENCIES if name in sys.modules]
+            report = self.report()
+            slowest = ", ".join(f"{p['name']} {p['seconds']}s" for p in report["packages"][:5])
+            phases = ", ".join(f"{name} {seconds}s" for name, seconds in report["phases"].items())
+            logger.info(
+                f"Started in {report['boot_seconds']}s: imports {report['import_seconds']}s "
+                f"({report['modules_imported']} modules; slowest {slowest})" + (f", {phases}" if phases else "")
+            )
+            if self.loaded_at_boot:
+                logger.warning(f"Optional dependencies imported at boot: {', '.join(self.loaded_at_boot)}")
+        return self.report()
+
+    def packages(self) -> List[Dict]:
+        """Self time summed per top-level package; the API's own modules are listed one by one"""
+        own = __name__.rpartition(".")[0]
+        totals: Dict[str, List] = {}
+        for module, (_, own_seconds) in self.modules.items():
+            root = module.partition(".")[0]
+            key = module if own and root == own else root
+            total = totals.setdefault(key, [0.0, 0])
+            total[0] += own_seconds
+            total[1] += 1
+        ranked = sorted(totals.items(), key=lambda item: -item[1][0])
+        return [{"name": name, "seconds": round(seconds, 3), "modules": count} for name, (seconds, count) in ranked]
+
+    def report(self, top: int = STARTUP_PROFILE_TOP) -> Dict:
+        boot = self.boot_seconds if self.boot_seconds is not None else time.perf_counter() - self.started
+        slowest = sorted(self.modules.items(), key=lambda item: -item[1][1])[:top]
+        return {
+            "enabled": STARTUP_PROFILE_ENABLED,
+            "finished_at": self.finished_at,
+            "boot_seconds": round(boot, 3),
+            "import_seconds": round(self.import_seconds, 3),
+            "phases": {name: round(seconds, 3) for name, seconds in self.phases.items()},
+            "modules_imported": len(self.modules),
+            "packages": self.packages()[:top],
+            "modules": [
+                {"name": name, "self_seconds": round(own, 3), "inclusive_seconds": round(inclusive, 3)}
+                for name, (inclusive, own) in slowest
+            ],
+            "optional_dependencies": {
+                "loaded_at_boot": self.loaded_at_boot,
+                "loaded_now": [name for name in LAZY_DEPENDENCIES if name in sys.modules],
+            },
+        }
+
+startup_profiler = StartupProfiler()
@@ -0,0 +1,465 @@
+"""
+Weekly delivery-day territory planner for recurring route sheets.
+
+Recurring customers are visited on fixed weekdays (the Lake Charles and
+Smitty route sheets). The planner works cluster-first, route-second so a
+week of 2,000+ customers plans in minutes:
+
+1. Each customer's visits per week become a set of evenly spaced weekdays
+   (twice a week is Mon/Thu, Tue/Fri or Mon/Fri; three times is Mon/Wed/Fri).
+2. Visits are assigned to weekdays by a workload-balanced clustering, so
+   each day covers a compact territory and no day is overloaded.
+3. Each day's visits are split into one balanced territory per truck.
+4. Every territory is sequenced with OR-Tools (nearest neighbour plus 2-opt
+   if the solver has nothing), and routes are dealt to trucks so their
+   weekly workload evens out.
+5. Drivers are matched to each day's routes by assign_drivers (branch,
+   licence, shift, balanced weekly hours), with the plan days placed in the
+   coming week.
+
+When the work of a day does not fit the fleet's workdays, the day reports
+its capacity_shortfall_hours and the plan carries a warning, so an
+infeasible week is visible rather than only showing up as overtime routes
+without drivers.
+"""
+import os
+import math
+import uuid
+import logging
+import threading
+import time as timer
+from datetime import date, datetime, timedelta
+from itertools import combinations
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .distance_matrix import haversine_matrices, METERS_PER_MILE, AVERAGE_SPEED_MPH
+from .driver_assignment import assign_drivers
+from .route_heuristics import project_coordinates, solve_heuristic
+from .route_optimizer import (
+    optimize_with_ortools, parse_time_of_day, ROUTE_DAY_START, DEFAULT_SERVICE_MINUTES, SolverTelemetry
+)
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+DEFAULT_PLANNING_DAYS = WEEKDAYS[:5]
+WORKDAY_HOURS = float(os.getenv("ROUTE_WORKDAY_HOURS", "10"))
+# Allowed overshoot of the even share of workload per day and per truck
+BALANCE_SLACK = float(os.getenv("TERRITORY_BALANCE_SLACK", "0.1"))
+BALANCE_ITERATIONS = 10
+PLANNER_ROUTE_TIME_LIMIT_SECONDS = float(os.getenv("TERRITORY_ROUTE_TIME_LIMIT_SECONDS", "1"))
+
+Load = Tuple[int, int]
+
+def sheet_weekday(sheet_name: str) -> Optional[str]:
+    """Weekday named in a route sheet title such as "MONDAY" or "Churchpoint-Tuesday" """
+    name = sheet_name.lower()
+    for day in WEEKDAYS:
+        if day in name:
+            return day
+    return None
+
+def visit_patterns(frequency: int, days: Sequence[str], allowed_days: Optional[Sequence[str]] = None) -> List[Tuple[int, ...]]:
+    """
+    Evenly spaced visit patterns (indices into days) for a weekly frequency.
+
+    Patterns are ranked by the shortest gap between consecutive visits,
+    counted around the week, and only the best-spread ones are kept.
+    """
+    allowed = [i for i, day in enumerate(days) if not allowed_days or day in allowed_days]
+    if not allowed:
+        allowed = list(range(len(days)))
+    frequency = max(1, min(int(frequency), len(allowed)))
+    positions = [WEEKDAYS.index(day) for day in days]
+
+    def min_gap(pattern: Tuple[int, ...]) -> int:
+        if len(pattern) == 1:
+            return 7
+        week = sorted(positions[i] for i in pattern)
+        return min((week[(k + 1) % len(week)] - week[k]) % 7 or 7 for k in range(len(week)))
+
+    patterns = list(combinations(allowed, frequency))
+    best = max(min_gap(p) for p in patterns)
+    return [p for p in patterns if min_gap(p) == best]
+
+def balanced_assignment(points: np.ndarray, loads: np.ndarray, capacities: np.ndarray,
+                        options: List[List[Tuple[int, ...]]], seeds: np.ndarray,
+                        iterations: int = BALANCE_ITERATIONS) -> Tuple[List[Tuple[int, ...]], np.ndarray]:
+    """
+    Capacitated clustering where each item picks one option (a tuple of clusters).
+
+    Items are assigned greedily, hardest first (fewest options, then largest
+    regret between their best and second-best option), to the cheapest
+    option whose clusters all still have room; centroids are then moved to
+    the load-weighted mean of their members, Lloyd-style, until stable.
+    Returns the chosen option per item and the final centroids.
+    """
+    centroids = seeds.astype(float).copy()
+    num_clusters = len(centroids)
+    choice: List[Tuple[int, ...]] = [options[i][0] for i in range(len(points))]
+    weight = np.maximum(loads[:, 0], 1e-9)
+
+    for _ in range(iterations):
+        distances = np.linalg.norm(points[:, None, :] - centroids[None, :, :], axis=2)
+        costs = [np.array([distances[i, list(option)].sum() for option in options[i]]) for i in range(len(points))]
+
+        def priority(i: int) -> Tuple[int, float]:
+            ranked = np.sort(costs[i])
+            regret = ranked[1] - ranked[0] if len(ranked) > 1 else math.inf
+            return (len(options[i]), -regret)
+
+        used = np.zeros_like(capacities, dtype=float)
+        new_choice = list(choice)
+        for i in sorted(range(len(points)), key=priority):
+            best, best_overload = None, None
+            for k in np.argsort(costs[i]):
+                option = list(options[i][k])
+                overload = np.maximum(used[option] + loads[i] - capacities[option], 0).sum()
+                if overload == 0:
+                    best = options[i][k]
+                    break
+                if best_overload is None or overload < best_overload:
+                    best, best_overload = options[i][k], overload
+            new_choice[i] = best
+            used[list(best)] += loads[i]
+
+        for cluster in range(num_clusters):
+            members = [i for i, option in enumerate(new_choice) if cluster in option]
+            if members:
+                centroids[cluster] = np.average(points[members], axis=0, weights=weight[members])
+        if new_choice == choice:
+            break
+        choice = new_choice
+
+    return choice, centroids
+
+def initial_centroids(points: np.ndarray, count: int, seed: int = 0) -> np.ndarray:
+    """k-means++ seeded centroids; falls back to evenly spread points for tiny inputs"""
+    from scipy.cluster.vq import kmeans2
+
+    count = max(1, count)
+    if len(points) <= count:
+        extra = np.repeat(points[:1], count - len(points), axis=0) if len(points) else np.zeros((count, 2))
+        return np.vstack([points, extra])[:count]
+    centroids, _ = kmeans2(points, count, minit="++", seed=seed)
+    return centroids
+
+def planning_matrices(coordinates: List[Tuple[float, float]]) -> Tuple[List[List[int]], List[List[int]]]:
+    """Road-network matrices when a graph is loaded, straight-line estimates otherwise (no API calls)"""
+    from .road_network import road_network
+
+    meters, seconds = haversine_matrices(coordinates)
+    if road_network.is_available():
+        try:
+            for (i, j), (distance, duration) in road_network.distance_matrix(coordinates, coordinates).items():
+                meters[i][j], seconds[i][j] = int(distance), int(duration)
+        except Exception as e:
+            logger.warning(f"Road network matrix failed, using straight-line distances: {e}")
+    return meters, seconds
+
+def sequence_territory(coordinates: List[Tuple[float, float]], service_times: List[int],
+                       time_limit_seconds: float) -> Tuple[List[int], int, int]:
+    """Order one truck's stops (depot is node 0); returns the stop nodes, meters and drive seconds"""
+    meters, seconds = planning_matrices(coordinates)
+    route = None
+    if len(coordinates) > 2:
+        day_start = parse_time_of_day(ROUTE_DAY_START)
+        solution = optimize_with_ortools(
+            [0] + [1] * (len(coordinates) - 1), coordinates, [len(coordinates)],
+            time_windows=[(day_start, 24 * 3600)] * len(coordinates), service_times=service_times,
+            time_limit_seconds=time_limit_seconds, matrices=(meters, seconds),
+            telemetry=SolverTelemetry("weekly-plan")
+        )
+        if solution and len(solution[0]["stops"]) == len(coordinates) - 1:
+            route = [stop["node"] for stop in solution[0]["stops"]]
+    if route is None:
+        route = solve_heuristic(coordinates, [0] + [1] * (len(coordinates) - 1), [len(coordinates)])[0]
+    path = [0] + route + [0]
+    return (route, sum(meters[a][b] for a, b in zip(path, path[1:])),
+            sum(seconds[a][b] for a, b in zip(path, path[1:])))
+
+def plan_week(customers: List[dict], depot: Tuple[float, float], vehicles: List[dict],
+              visit_loads: Dict[str, Load], vehicle_capacities: List[Load],
+              days: Sequence[str] = DEFAULT_PLANNING_DAYS, drivers: Optional[List[dict]] = None,
+              route_time_limit_seconds: float = PLANNER_ROUTE_TIME_LIMIT_SECONDS,
+              seed: int = 0, progress: Optional[Callable[[str], None]] = None) -> Dict:
+    """
+    Assign recurring customers to weekdays and trucks and sequence every route.
+
+    customers need "coordinates"; visits_per_week (default 1) and an optional
+    delivery_days list restrict their patterns. visit_loads maps a customer
+    id to its typical (pallets, lbs) per visit. A day whose routes need more
+    hours than the fleet's workdays reports the shortfall, with a warning.
+    """
+    started = timer.perf_counter()
+    days = [d.lower() for d in days]
+    if not vehicles:
+        raise ValueError("No vehicles available for weekly planning")
+
+    points = project_coordinates([(c["coordinates"]["lat"], c["coordinates"]["lng"]) for c in customers])
+    service_seconds = np.array([int(c.get("service_time_minutes") or DEFAULT_SERVICE_MINUTES) * 60 for c in customers])
+
+    # Per-visit workload: service time plus the drive from the nearest neighbouring customer
+    if len(points) > 1:
+        from scipy.spatial import cKDTree
+        nearest_miles = cKDTree(points).query(points, k=2)[0][:, 1]
+    else:
+        nearest_miles = np.zeros(len(points))
+    workload = service_seconds + nearest_miles * 1.3 / AVERAGE_SPEED_MPH * 3600
+    loads = np.array([visit_loads.get(c["id"], (1, 0)) for c in customers], dtype=float).reshape(-1, 2)
+
+    options = [
+        visit_patterns(int(c.get("visits_per_week") or 1), days, [d.lower() for d in (c.get("delivery_days") or [])])
+        for c in customers
+    ]
+    frequencies = np.array([len(o[0]) for o in options])
+
+    # 1. Weekdays: balance workload (and keep each day within the fleet's pallets)
+    fleet_pallets = sum(capacity[0] for capacity in vehicle_capacities)
+    day_loads = np.column_stack([workload, loads[:, 0]])
+    total_workload = float((workload * frequencies).sum())
+    day_capacity = np.tile([total_workload / len(days) * (1 + BALANCE_SLACK), fleet_pallets], (len(days), 1))
+    day_seeds = initial_centroids(points, len(days), seed)
+    day_choice, _ = balanced_assignment(points, day_loads, day_capacity, options, day_seeds)
+    if progress:
+        progress("days assigned")
+
+    workday_seconds = WORKDAY_HOURS * 3600
+    fleet_order = sorted(range(len(vehicles)), key=lambda v: vehicle_capacities[v], reverse=True)
+    vehicle_workload = {vehicle["id"]: 0.0 for vehicle in vehicles}
+    vehicle_miles = {vehicle["id"]: 0.0 for vehicle in vehicles}
+    vehicle_days = {vehicle["id"]: [] for vehicle in vehicles}
+    plan_days = []
+    weekly_meters = 0
+
+    for day_index, day in enumerate(days):
+        members = [i for i, option in enumerate(day_choice) if day_index in option]
+        day_routes = []
+        needed = 0
+        if members:
+            # 2. Trucks: as few as the workday and pallet limits allow, largest trucks first
+            day_work = float(workload[members].sum())
+            day_pallets = float(loads[members, 0].sum())
+            needed = max(math.ceil(day_work / (workday_seconds * (1 - BALANCE_SLACK))), 1)
+            while needed < len(vehicles) and sum(vehicle_capacities[v][0] for v in fleet_order[:needed]) < day_pallets:
+                needed += 1
+            count = min(needed, len(vehicles), len(members))
+            truck_caps = np.array([
+                [day_work / count * (1 + BALANCE_SLACK), vehicle_capacities[v][0], vehicle_capacities[v][1]]
+                for v in fleet_order[:count]
+            ])
+            truck_loads = np.column_stack([workload[members], loads[members]])
+            truck_choice, _ = balanced_assignment(
+                points[members], truck_loads, truck_caps,
+                [[(k,) for k in range(count)] for _ in members], initial_centroids(points[members], count, seed)
+            )
+
+            # 3. Sequence each territory
+            territories = []
+            for k in range(count):
+                stop_members = [members[m] for m, option in enumerate(truck_choice) if option[0] == k]
+                if not stop_members:
+                    continue
+                coordinates = [depot] + [(customers[i]["coordinates"]["lat"], customers[i]["coordinates"]["lng"]) for i in stop_members]
+                pallets = int(loads[stop_members, 0].sum())
+                weight = int(loads[stop_members, 1].sum())
+                route, meters, drive_seconds = sequence_territory(
+                    coordinates, [0] + [int(service_seconds[i]) for i in stop_members], route_time_limit_seconds
+                )
+                territories.append({
+                    "stops": [stop_members[node - 1] for node in route],
+                    "pallets": pallets,
+                    "weight_lbs": weight,
+                    "meters": meters,
+                    "workload_seconds": drive_seconds + int(service_seconds[stop_members].sum()),
+                })
+
+            # 4. Deal routes to the trucks whose week is lightest so far, if the load fits
+            available = list(range(len(vehicles)))
+            for territory in sorted(territories, key=lambda t: t["workload_seconds"], reverse=True):
+                fitting = [v for v in available if vehicle_capacities[v][0] >= territory["pallets"]
+                           and vehicle_capacities[v][1] >= territory["weight_lbs"]] or available
+                v = min(fitting, key=lambda v: (vehicle_workload[vehicles[v]["id"]], -vehicle_capacities[v][0]))
+                available.remove(v)
+                vehicle = vehicles[v]
+                vehicle_workload[vehicle["id"]] += territory["workload_seconds"]
+                vehicle_miles[vehicle["id"]] += territory["meters"] / METERS_PER_MILE
+                vehicle_days[vehicle["id"]].append(day)
+                weekly_meters += territory["meters"]
+                day_routes.append({
+                    "vehicle_id": vehicle["id"],
+                    "driver_id": None,
+                    "stops": [
+                        {
+                            "stop_number": n,
+                            "customer_id": customers[i]["id"],
+                            "customer_name": customers[i].get("name"),
+                            "address": customers[i].get("address"),
+                            "coordinates": customers[i]["coordinates"],
+                        }
+                        for n, i in enumerate(territory["stops"], 1)
+                    ],
+                    "pallets": territory["pallets"],
+                    "weight_lbs": territory["weight_lbs"],
+                    "over_capacity": (territory["pallets"] > vehicle_capacities[v][0]
+                                      or territory["weight_lbs"] > vehicle_capacities[v][1]),
+                    "distance_miles": round(territory["meters"] / METERS_PER_MILE, 1),
+                    "workload_hours": round(territory["workload_seconds"] / 3600, 2),
+                    "overtime": territory["workload_seconds"] > workday_seconds,
+                })
+        day_hours = sum(route["workload_hours"] for route in day_routes)
+        plan_days.append({
+            "day": day,
+            "routes": day_routes,
+            "visits": len(members),
+            "trucks_needed": needed,
+            "capacity_shortfall_hours": round(max(0.0, day_hours - len(vehicles) * WORKDAY_HOURS), 2),
+        })
+        if progress:
+            progress(f"{day} planned")
+
+    unassigned_routes = assign_plan_drivers(plan_days, vehicles, drivers or [])
+    driver_summary: Dict[str, Dict] = {}
+    for plan_day in plan_days:
+        for route in plan_day["routes"]:
+            if route["driver_id"]:
+                summary = driver_summary.setdefault(
+                    route["driver_id"], {"driver_id": route["driver_id"], "days": [], "workload_hours": 0.0, "distance_miles": 0.0}
+                )
+                summary["days"].append(plan_day["day"])
+                summary["workload_hours"] = round(summary["workload_hours"] + route["workload_hours"], 2)
+                summary["distance_miles"] = round(summary["distance_miles"] + route["distance_miles"], 1)
+
+    warnings = [
+        f"{plan_day['day']}: the routes need {plan_day['capacity_shortfall_hours']} h more than "
+        f"{len(vehicles)} trucks x {WORKDAY_HOURS:g} h workdays; about {plan_day['trucks_needed']} trucks are needed"
+        for plan_day in plan_days if plan_day["capacity_shortfall_hours"] > 0
+    ]
+    overtime = sum(route["overtime"] for plan_day in plan_days for route in plan_day["routes"])
+    if overtime:
+        warnings.append(f"{overtime} routes run past the {WORKDAY_HOURS:g} h workday")
+    if unassigned_routes:
+        warnings.append(f"{len(unassigned_routes)} routes have no driver")
+    for warning in warnings:
+        logger.warning(f"Weekly plan: {warning}")
+
+    return {
+        "days": plan_days,
+        "vehicles": [
+            {
+                "vehicle_id": vehicle["id"],
+                "days": vehicle_days[vehicle["id"]],
+                "workload_hours": round(vehicle_workload[vehicle["id"]] / 3600, 2),
+                "distance_miles": round(vehicle_miles[vehicle["id"]], 1),
+            }
+            for vehicle in vehicles
+        ],
+        "drivers": list(driver_summary.values()),
+        "unassigned_routes": unassigned_routes,
+        "capacity_shortfall_hours": round(sum(plan_day["capacity_shortfall_hours"] for plan_day in plan_days), 2),
+        "warnings": warnings,
+        "customers_planned": len(customers),
+        "weekly_visits": int(frequencies.sum()),
+        "weekly_distance_miles": round(weekly_meters / METERS_PER_MILE, 1),
+        "planning_seconds": round(timer.perf_counter() - started, 2),
+    }
+
+def plan_week_dates(days: Sequence[str], today: Optional[date] = None) -> Dict[str, date]:
+    """The dates of the plan days in the coming week (starting next Monday)"""
+    today = today or date.today()
+    monday = today + timedelta(days=7 - today.weekday())
+    return {day: monday + timedelta(days=WEEKDAYS.index(day)) for day in days}
+
+def assign_plan_drivers(plan_days: List[Dict], vehicles: List[dict], drivers: List[dict]) -> List[Dict]:
+    """
+    Set driver_id on the plan's routes with assign_drivers, day by day in the
+    coming week; returns the routes left without a driver and why.
+    """
+    vehicles_by_id = {vehicle["id"]: vehicle for vehicle in vehicles}
+    dates = plan_week_dates([plan_day["day"] for plan_day in plan_days])
+    routes = {}
+    for plan_day in plan_days:
+        for route in plan_day["routes"]:
+            route_id = f"{plan_day['day']}:{route['vehicle_id']}"
+            routes[route_id] = (plan_day["day"], route)
+    candidates = [
+        {
+            "id": route_id,
+            "date": str(dates[day]),
+            "vehicle_id": route["vehicle_id"],
+            "location_id": vehicles_by_id[route["vehicle_id"]].get("location_id"),
+            "estimated_duration_hours": route["workload_hours"],
+        }
+        for route_id, (day, route) in routes.items()
+    ]
+    assignments, unassigned = assign_drivers(candidates, drivers, vehicles_by_id, []) if candidates else ({}, {})
+    for route_id, driver_id in assignments.items():
+        routes[route_id][1]["driver_id"] = driver_id
+    return [
+        {"day": routes[route_id][0], "vehicle_id": routes[route_id][1]["vehicle_id"], "reason": reason}
+        for route_id, reason in unassigned.items()
+    ]
+
+class WeeklyPlanJob:
+    """A weekly plan computed in the background"""
+
+    def __init__(self, location_id: str):
+        self.id = str(uuid.uuid4())
+        self.location_id = location_id
+        self.status = "queued"
+        self.progress = ""
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "location_id": self.location_id,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "plan": self.result
+        }
+
+class TerritoryPlanner:
+    """Runs weekly plans off the request path; plans take minutes for large territories"""
+
+    def __init__(self, max_jobs: int = 20):
+        self.jobs: Dict[str, WeeklyPlanJob] = {}
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+
+    def submit(self, location_id: str, **plan_args) -> WeeklyPlanJob:
+        job = WeeklyPlanJob(location_id)
+        with self._lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.pop(next(iter(self.jobs)))
+        threading.Thread(target=self._run, args=(job, plan_args), daemon=True).start()
+        return job
+
+    def _run(self, job: WeeklyPlanJob, plan_args: Dict):
+        job.status = "running"
+
+        def progress(message: str):
+            job.progress = message
+
+        try:
+            job.result = plan_week(progress=progress, **plan_args)
+            job.status = "completed"
+            logger.info(f"Weekly plan {job.id} for {job.location_id}: {job.result['weekly_distance_miles']} mi "
+                        f"in {job.result['planning_seconds']}s")
+        except Exception as e:
+            logger.error(f"Weekly plan {job.id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.now()
+
+territory_planner = TerritoryPlanner()
@@ -1,5 +1,4 @@
 import os
-import requests
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 import logging
@@ -14,6 +13,8 @@ class WeatherService:
         
     async def get_current_weather(self, lat: float, lng: float) -> Dict:
         """Get current weather for coordinates"""
+        import requests
+
         if not self.api_key:
             return {"error": "Weather API key not configured"}
             
@@ -0,0 +1,93 @@
+"""
+Test stand-in for the Google Maps Distance Matrix and Geocoding APIs.
+
+Answers with haversine distances at the routing average speed and enforces
+the same per-request limits as Google, so the tiled matrix client can be
+exercised offline. Point the app at it with GOOGLE_MAPS_BASE_URL, e.g.
+
+    python -m tests.maps_standin --port 8765
+    GOOGLE_MAPS_BASE_URL=http://127.0.0.1:8765 GOOGLE_MAPS_API_KEY=AIza-standin ...
+"""
+import json
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from app.distance_matrix import haversine_distance, estimate_travel_seconds, METERS_PER_MILE
+from app.google_maps import MAX_ELEMENTS_PER_REQUEST, MAX_LOCATIONS_PER_SIDE
+
+def _parse_location(value: str) -> Optional[Tuple[float, float]]:
+    try:
+        lat, lng = value.split(",")
+        return float(lat), float(lng)
+    except ValueError:
+        return None
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self.server.request_count += 1
+
+        if url.path == "/maps/api/distancematrix/json":
+            origins = params.get("origins", "").split("|")
+            destinations = params.get("destinations", "").split("|")
+            if (len(origins) > MAX_LOCATIONS_PER_SIDE or len(destinations) > MAX_LOCATIONS_PER_SIDE
+                    or len(origins) * len(destinations) > MAX_ELEMENTS_PER_REQUEST):
+                self.server.rejected_count += 1
+                self._send({"status": "MAX_ELEMENTS_EXCEEDED", "rows": []})
+                return
+            rows = []
+            for origin in origins:
+                elements = []
+                for destination in destinations:
+                    a, b = _parse_location(origin), _parse_location(destination)
+                    if a is None or b is None:
+                        elements.append({"status": "NOT_FOUND"})
+                        continue
+                    meters = int(haversine_distance(a[0], a[1], b[0], b[1]) * METERS_PER_MILE)
+                    seconds = estimate_travel_seconds(meters)
+                    elements.append({
+                        "status": "OK",
+                        "distance": {"value": meters, "text": f"{meters / METERS_PER_MILE:.1f} mi"},
+                        "duration": {"value": seconds, "text": f"{seconds // 60} mins"},
+                        "duration_in_traffic": {"value": seconds, "text": f"{seconds // 60} mins"}
+                    })
+                rows.append({"elements": elements})
+            self._send({"status": "OK", "origin_addresses": origins, "destination_addresses": destinations, "rows": rows})
+        elif url.path == "/maps/api/geocode/json":
+            self._send({"status": "ZERO_RESULTS", "results": []})
+        else:
+            self.send_error(404)
+
+def start_standin_server(port: int = 0) -> ThreadingHTTPServer:
+    """Start the stand-in server on a background thread; port 0 picks a free port"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StandInHandler)
+    server.request_count = 0
+    server.rejected_count = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Google Maps API stand-in server")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    server = start_standin_server(args.port)
+    print(f"Maps stand-in listening on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
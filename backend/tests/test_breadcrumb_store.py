@@ -0,0 +1,127 @@
+import random
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from app.breadcrumb_store import (
+    BreadcrumbStore, decode_chunks, douglas_peucker, encode_chunk, local_meters,
+    read_varint, unzigzag, write_varint, zigzag, COORDINATE_SCALE
+)
+
+def drive(count, seed, start=1760000000):
+    """Pings every 10 s from a truck at road speeds, turning now and then"""
+    rng = random.Random(seed)
+    lat, lng, heading = 31.14, -93.26, rng.uniform(0, 2 * np.pi)
+    points = []
+    for i in range(count):
+        if rng.random() < 0.05:
+            heading += rng.uniform(-1.5, 1.5)
+        meters = rng.uniform(80, 300)
+        lat += meters * np.cos(heading) / 111000
+        lng += meters * np.sin(heading) / 95000
+        points.append((lat, lng, start + 10 * i))
+    return points
+
+def assert_same_track(decoded, points):
+    assert len(decoded) == len(points)
+    for (lat, lng, ts), (expected_lat, expected_lng, expected_ts) in zip(decoded, points):
+        assert abs(lat - expected_lat) <= 0.5 / COORDINATE_SCALE + 1e-12
+        assert abs(lng - expected_lng) <= 0.5 / COORDINATE_SCALE + 1e-12
+        assert ts == expected_ts
+
+@pytest.mark.parametrize("value", [0, 1, -1, 63, -64, 64, 127, 128, -300, 2 ** 31, -(2 ** 40)])
+def test_zigzag_varint_round_trip(value):
+    out = bytearray()
+    write_varint(zigzag(value), out)
+    decoded, pos = read_varint(bytes(out), 0)
+    assert unzigzag(decoded) == value
+    assert pos == len(out)
+
+def test_chunks_round_trip():
+    first, second = drive(300, 1), drive(200, 2, start=1760010000)
+    data = encode_chunk(first) + encode_chunk(second)
+    assert_same_track(list(decode_chunks(data)), first + second)
+
+def test_road_pings_take_about_four_bytes():
+    points = drive(1000, 3)
+    assert len(encode_chunk(points)) / len(points) <= 5
+
+def test_truncated_chunk_is_dropped(tmp_path):
+    first, second = drive(50, 4), drive(400, 5)
+    data = encode_chunk(first) + encode_chunk(second)
+    for cut in (len(data) - 1, len(encode_chunk(first)) + 5):
+        assert_same_track(list(decode_chunks(data[:cut])), first)
+
+    # A torn chunk followed by a new append, as left by a crash and a restart
+    start = int(datetime(2025, 10, 9, 9, 0).timestamp())
+    earlier, torn, later = drive(50, 6, start), encode_chunk(drive(50, 4, start + 600)), drive(400, 5, start + 1200)
+    assert list(decode_chunks(torn[:148] + encode_chunk(later))) == []
+    for cut in (1, 2, 148, len(torn) - 1):
+        BreadcrumbStore(tmp_path / str(cut)).append("driver_1", earlier)
+        path = next((tmp_path / str(cut)).rglob("*.bin"))
+        with open(path, "ab") as f:
+            f.write(torn[:cut])
+        store = BreadcrumbStore(tmp_path / str(cut))  # after the restart
+        store.append("driver_1", later)
+        assert_same_track(store.day("driver_1", path.stem), earlier + later)
+
+def test_truncated_length_prefix_is_dropped():
+    first, second = drive(50, 6), drive(400, 7)
+    chunk = encode_chunk(second)
+    assert chunk[0] & 0x80  # the length takes more than one byte
+    assert_same_track(list(decode_chunks(encode_chunk(first) + chunk[:1])), first)
+
+def test_store_appends_and_queries_by_day(tmp_path):
+    store = BreadcrumbStore(tmp_path)
+    points = drive(20000, 8)  # a little over two days
+    store.append("driver_1", points[:7000])
+    store.append("driver_1", points[7000:])
+
+    assert_same_track(store.query("driver_1", datetime.fromtimestamp(points[0][2]), datetime.fromtimestamp(points[-1][2] + 1)), points)
+    assert store.size_bytes("driver_1") == sum(p.stat().st_size for p in tmp_path.rglob("*.bin"))
+
+@pytest.mark.parametrize("driver_id", ["..", ".", "../other", "a/b", "a\\b", ""])
+def test_store_rejects_ids_outside_its_directory(tmp_path, driver_id):
+    store = BreadcrumbStore(tmp_path / "breadcrumbs")
+    with pytest.raises(ValueError):
+        store.append(driver_id, drive(5, 9))
+    with pytest.raises(ValueError):
+        store.day(driver_id, "2025-10-09")
+    assert not any(tmp_path.rglob("*.bin"))
+
+def segment_distances(track, simplified):
+    """Distance in meters from each track point to the simplified polyline"""
+    xy = local_meters(np.array([(p[0], p[1]) for p in track]))
+    index = {p: i for i, p in enumerate(track)}
+    distances = np.zeros(len(track))
+    for a, b in zip(simplified, simplified[1:]):
+        first, last = index[a], index[b]
+        segment = xy[last] - xy[first]
+        offsets = xy[first:last + 1] - xy[first]
+        t = np.clip(offsets @ segment / max(segment @ segment, 1e-12), 0, 1)
+        distances[first:last + 1] = np.hypot(*(offsets - np.outer(t, segment)).T)
+    return distances
+
+def test_douglas_peucker_thins_a_straight_road_to_its_ends():
+    track = [(31.0 + i * 0.001, -93.0, 1760000000 + i) for i in range(100)]
+    assert douglas_peucker(track, 5) == [track[0], track[-1]]
+
+def test_douglas_peucker_keeps_corners():
+    leg = [(31.0 + i * 0.001, -93.0, i) for i in range(50)]
+    turn = [(31.049, -93.0 + i * 0.001, 50 + i) for i in range(1, 50)]
+    assert douglas_peucker(leg + turn, 5) == [leg[0], leg[-1], turn[-1]]
+
+@pytest.mark.parametrize("tolerance", [2, 10, 50])
+def test_douglas_peucker_stays_within_tolerance(tolerance):
+    track = drive(2000, 10)
+    simplified = douglas_peucker(track, tolerance)
+
+    assert simplified[0] == track[0] and simplified[-1] == track[-1]
+    assert len(simplified) < len(track)
+    assert segment_distances(track, simplified).max() <= tolerance + 1e-6
+
+def test_douglas_peucker_leaves_short_tracks_alone():
+    track = drive(2, 11)
+    assert douglas_peucker(track, 10) == track
+    assert douglas_peucker(drive(50, 12), 0) == drive(50, 12)
@@ -0,0 +1,84 @@
+from app.driver_assignment import assign_drivers, route_start_seconds, INELIGIBILITY_REASONS
+
+DAY = "2025-10-20"
+VEHICLES = {
+    "truck": {"id": "truck", "vehicle_type": "53ft_reefer"},
+    "van": {"id": "van", "vehicle_type": "16ft_reefer"},
+}
+
+def route(route_id, start="06:00", hours=2.0, vehicle_id="truck", location_id="loc_1", day=DAY, driver_id=None):
+    return {
+        "id": route_id,
+        "date": day,
+        "vehicle_id": vehicle_id,
+        "location_id": location_id,
+        "estimated_duration_hours": hours,
+        "driver_id": driver_id,
+        "stops": [{"estimated_arrival": f"{day}T{start}:00"}],
+    }
+
+def driver(driver_id, location_id="loc_1", licensed=None, shift=("06:00", "20:00")):
+    return {"id": driver_id, "location_id": location_id, "licensed_vehicle_types": licensed,
+            "shift_start": shift[0], "shift_end": shift[1]}
+
+def test_route_start_comes_from_the_first_arrival():
+    assert route_start_seconds(route("r", start="07:30")) == 7.5 * 3600
+    assert route_start_seconds({"stops": [{"estimated_arrival": "12:15"}]}) == 6 * 3600
+
+def test_one_driver_takes_back_to_back_routes_over_several_rounds():
+    routes = [route("early", "06:00"), route("mid", "09:00"), route("late", "12:00")]
+    assignments, unassigned = assign_drivers(routes, [driver("d1")], VEHICLES, [])
+    assert assignments == {"early": "d1", "mid": "d1", "late": "d1"}
+    assert unassigned == {}
+
+def test_overlapping_routes_leave_the_shortest_unassigned():
+    routes = [route("long", "06:00", 6), route("short", "07:00", 1), route("medium", "07:30", 3)]
+    assignments, unassigned = assign_drivers(routes, [driver("d1"), driver("d2")], VEHICLES, [])
+    assert set(assignments) == {"long", "medium"}
+    assert unassigned == {"short": INELIGIBILITY_REASONS[2]}
+
+def test_hours_are_balanced_against_booked_routes():
+    booked = [route("monday", day="2025-10-20", hours=9, driver_id="d1")]
+    routes = [route("tuesday", day="2025-10-21", hours=8)]
+    assignments, _ = assign_drivers(routes, [driver("d1"), driver("d2")], VEHICLES, booked)
+    assert assignments == {"tuesday": "d2"}
+
+def test_booked_routes_block_their_time():
+    booked = [route("booked", "06:00", 4, driver_id="d1")]
+    assignments, unassigned = assign_drivers([route("new", "08:00")], [driver("d1")], VEHICLES, booked)
+    assert assignments == {}
+    assert unassigned == {"new": INELIGIBILITY_REASONS[2]}
+
+def test_routes_that_fit_no_shift_are_rejected():
+    routes = [route("too_long", "06:00", 10)]
+    assignments, unassigned = assign_drivers(routes, [driver("d1", shift=("06:00", "14:00"))], VEHICLES, [])
+    assert assignments == {}
+    assert unassigned == {"too_long": INELIGIBILITY_REASONS[3]}
+
+    assignments, _ = assign_drivers(routes, [driver("d1", shift=("06:00", "14:00")), driver("d2")], VEHICLES, [])
+    assert assignments == {"too_long": "d2"}
+
+def test_branch_and_licence_are_required():
+    drivers = [driver("elsewhere", location_id="loc_2"), driver("van_only", licensed=["16ft_reefer"])]
+    assignments, unassigned = assign_drivers([route("truck_route"), route("van_route", vehicle_id="van")],
+                                             drivers, VEHICLES, [])
+    assert assignments == {"van_route": "van_only"}
+    assert unassigned == {"truck_route": INELIGIBILITY_REASONS[1]}
+
+    assignments, unassigned = assign_drivers([route("r")], [driver("elsewhere", location_id="loc_2")], VEHICLES, [])
+    assert unassigned == {"r": INELIGIBILITY_REASONS[0]}
+
+def test_cross_branch_drivers_only_when_allowed_and_after_local_ones():
+    drivers = [driver("local"), driver("visitor", location_id="loc_2")]
+    routes = [route("a", "06:00", 4), route("b", "07:00", 4)]
+    assignments, _ = assign_drivers(routes, drivers, VEHICLES, [])
+    assert len(assignments) == 1 and set(assignments.values()) == {"local"}
+
+    assignments, unassigned = assign_drivers(routes, drivers, VEHICLES, [], allow_cross_branch=True)
+    assert set(assignments.values()) == {"local", "visitor"} and unassigned == {}
+
+    assignments, _ = assign_drivers([route("c")], drivers, VEHICLES, [], allow_cross_branch=True)
+    assert assignments == {"c": "local"}
+
+def test_no_drivers():
+    assert assign_drivers([route("r")], [], VEHICLES, []) == ({}, {"r": "no active drivers"})
@@ -0,0 +1,146 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from app.eta_model import (
+    EtaModel, extract_legs, hour_of_week, leg_miles, road_class,
+    HOURS_PER_WEEK, MIN_SERVICE_VISITS, ROAD_CLASSES, SHRINKAGE_LEGS
+)
+
+MONDAY_9AM = datetime(2025, 10, 20, 9, 0)
+MILES_PER_DEGREE_LAT = 69.09
+
+def stay(track, lat, lng, start, seconds, every=30):
+    track.extend((lat, lng, start + t) for t in range(0, seconds + 1, every))
+    return start + seconds
+
+def drive(track, start_point, end_point, start, seconds, every=30):
+    for t in range(every, seconds, every):
+        f = t / seconds
+        track.append((start_point[0] + f * (end_point[0] - start_point[0]),
+                      start_point[1] + f * (end_point[1] - start_point[1]), start + t))
+    return start + seconds
+
+def test_legs_run_between_stationary_periods():
+    a, b, c = (31.0, -93.0), (31.0 + 12 / MILES_PER_DEGREE_LAT, -93.0), (31.0 + 15 / MILES_PER_DEGREE_LAT, -93.0)
+    start = int(MONDAY_9AM.timestamp())
+    track = []
+    t = stay(track, *a, start, 600)
+    t = drive(track, a, b, t, 900)
+    arrive_b = t
+    t = stay(track, *b, t, 300)
+    leave_b = t
+    t = drive(track, b, c, t, 600)
+    stay(track, *c, t, 300)
+
+    legs = extract_legs(track)
+
+    assert len(legs) == 2
+    (miles_ab, seconds_ab, hour_ab), (miles_bc, seconds_bc, hour_bc) = legs
+    assert miles_ab == pytest.approx(12, rel=0.01) and seconds_ab == arrive_b - (start + 600)
+    assert miles_bc == pytest.approx(3, rel=0.01) and seconds_bc == t - leave_b
+    assert hour_ab == hour_of_week(MONDAY_9AM) == 9
+    assert hour_bc == 9
+
+def test_short_hops_and_gps_jumps_are_not_legs():
+    a, near, far = (31.0, -93.0), (31.0 + 0.1 / MILES_PER_DEGREE_LAT, -93.0), (32.0, -93.0)
+    start = int(MONDAY_9AM.timestamp())
+    track = []
+    t = stay(track, *a, start, 300)
+    t = drive(track, a, near, t, 120)
+    t = stay(track, *near, t, 300)
+    t = drive(track, near, far, t, 600)  # 69 miles in ten minutes
+    stay(track, *far, t, 300)
+    assert extract_legs(track) == []
+
+def test_fit_shrinks_sparse_cells_towards_the_class_pace():
+    highway = ROAD_CLASSES.index("highway")
+    legs = [(20.0, 20.0 * 60, 10)] * 20 + [(20.0, 20.0 * 90, 11)] * SHRINKAGE_LEGS + [(1.0, 180.0, 10)] * 3
+    model = EtaModel.fit(legs, {})
+
+    assert model.samples[highway, 10] == 20 and model.samples[highway, 11] == SHRINKAGE_LEGS
+    assert model.speeds_mph[highway, 10] == pytest.approx(3600 / (0.8 * 60 + 0.2 * 60))
+    # Half its own 90 s/mile, half the class median of 60 s/mile
+    assert model.speeds_mph[highway, 11] == pytest.approx(3600 / 75)
+    assert model.speeds_mph[highway, 100] == pytest.approx(60)
+    local = ROAD_CLASSES.index("local")
+    assert model.speeds_mph[local, 10] == pytest.approx(3600 / (0.375 * 180 + 0.625 * 180))
+    assert model.samples.sum() == len(legs)
+    assert model.speeds_mph[ROAD_CLASSES.index("arterial")].tolist() == EtaModel().speeds_mph[0].tolist()
+
+def test_service_times_need_enough_visits():
+    dwell = {"regular": [10, 14, 12, 30], "new": [5.0] * (MIN_SERVICE_VISITS - 1)}
+    model = EtaModel.fit([], dwell)
+    assert model.service_minutes == {"regular": 13.0}
+    seconds = model.service_seconds(["regular", "new", "regular"], [None, None, 4])
+    assert seconds.tolist() == [13 * 60, model.service_seconds(["x"], [None])[0], 4 * 60]
+
+def flat_model(mph_by_hour):
+    speeds = np.full((len(ROAD_CLASSES), HOURS_PER_WEEK), 30.0)
+    for hour, mph in mph_by_hour.items():
+        speeds[:, hour] = mph
+    return EtaModel(speeds)
+
+def stops_north(origin, miles):
+    return np.array([(origin[0] + m / MILES_PER_DEGREE_LAT, origin[1]) for m in np.cumsum(miles)])
+
+def test_predict_adds_service_time_cumulatively():
+    origin = (31.0, -93.0)
+    stops = stops_north(origin, [5, 5, 5])
+    miles = leg_miles(np.vstack([origin, stops]))
+    service = np.array([600.0, 900.0, 300.0])
+
+    arrivals = flat_model({}).predict(origin, stops, service, MONDAY_9AM, initial_wait_seconds=120)
+
+    travel = miles / 30 * 3600
+    assert arrivals == pytest.approx(np.cumsum(travel) + np.cumsum([120, 600, 900]))
+    assert road_class(miles).tolist() == [1, 1, 1]
+
+def test_predict_uses_the_hour_each_leg_starts():
+    origin = (31.0, -93.0)
+    stops = stops_north(origin, [10, 10])
+    miles = leg_miles(np.vstack([origin, stops]))
+    start = datetime(2025, 10, 20, 9, 45)
+    model = flat_model({9: 30.0, 10: 60.0})
+
+    arrivals = model.predict(origin, stops, np.array([0.0, 0.0]), start)
+
+    # The first leg leaves at 9:45 at 30 mph and arrives at about 10:05, so the second runs at 60 mph
+    first = miles[0] / 30 * 3600
+    assert arrivals[0] == pytest.approx(first)
+    assert arrivals[1] == pytest.approx(first + miles[1] / 60 * 3600)
+
+def test_predict_wraps_around_the_week():
+    origin = (31.0, -93.0)
+    stops = stops_north(origin, [10, 10])
+    miles = leg_miles(np.vstack([origin, stops]))
+    sunday_night = datetime(2025, 10, 26, 23, 50)
+    assert hour_of_week(sunday_night) == HOURS_PER_WEEK - 1
+    model = flat_model({HOURS_PER_WEEK - 1: 20.0, 0: 50.0})
+
+    arrivals = model.predict(origin, stops, np.array([0.0, 0.0]), sunday_night)
+
+    first = miles[0] / 20 * 3600
+    assert arrivals[1] - arrivals[0] == pytest.approx(miles[1] / 50 * 3600)
+    assert arrivals[0] == pytest.approx(first)
+
+def test_predict_without_stops():
+    assert flat_model({}).predict((31.0, -93.0), np.zeros((0, 2)), np.zeros(0), MONDAY_9AM).size == 0
+
+def test_save_and_load_round_trip(tmp_path):
+    legs = [(20.0, 1200.0, 10)] * 7 + [(5.0, 600.0, 40)] * 3 + [(1.0, 200.0, 100)] * 2
+    model = EtaModel.fit(legs, {"c1": [10, 11, 12]})
+    path = tmp_path / "models" / "eta_model.npz"
+
+    model.save(str(path))
+    loaded = EtaModel.load(str(path))
+
+    assert np.array_equal(loaded.speeds_mph, model.speeds_mph)
+    assert np.array_equal(loaded.samples, model.samples)
+    assert loaded.service_minutes == model.service_minutes
+    assert loaded.trained_at == model.trained_at
+    assert loaded.summary() == model.summary()
+    origin, stops = (31.0, -93.0), stops_north((31.0, -93.0), [1, 6, 25])
+    service = np.array([300.0, 300.0, 300.0])
+    assert np.array_equal(loaded.predict(origin, stops, service, MONDAY_9AM), model.predict(origin, stops, service, MONDAY_9AM))
@@ -0,0 +1,71 @@
+from app.geofencing import (
+    GeofenceEngine, GEOFENCE_EXIT_METERS, GEOFENCE_MAX_ACCURACY_METERS, GEOFENCE_MIN_DWELL_SECONDS,
+    GEOFENCE_RADIUS_METERS
+)
+
+STOP_A = (31.14, -93.26)
+STOP_B = (31.15, -93.26)
+METERS_PER_DEGREE_LAT = 111195
+
+def north_of(point, meters):
+    return point[0] + meters / METERS_PER_DEGREE_LAT, point[1]
+
+def engine_with_route():
+    engine = GeofenceEngine()
+    engine.index_route("r1", [("order_a", 1, "cust_a", *STOP_A), ("order_b", 2, "cust_b", *STOP_B)])
+    return engine
+
+def test_arrival_and_departure_complete_a_stop():
+    engine = engine_with_route()
+    assert engine.check("d1", "r1", *north_of(STOP_A, GEOFENCE_RADIUS_METERS + 20), 0) == []
+
+    arrival, = engine.check("d1", "r1", *north_of(STOP_A, 10), 100)
+    assert (arrival["type"], arrival["stop_id"], arrival["stop_number"]) == ("arrival", "order_a", 1)
+    # Still inside the exit radius, though outside the arrival radius
+    assert engine.check("d1", "r1", *north_of(STOP_A, GEOFENCE_EXIT_METERS - 20), 400) == []
+
+    departure, = engine.check("d1", "r1", *north_of(STOP_A, GEOFENCE_EXIT_METERS + 20), 700)
+    assert (departure["type"], departure["stop_id"], departure["dwell_seconds"]) == ("departure", "order_a", 600)
+    assert engine.dwell_stats("cust_a") == {"visits": 1, "mean_minutes": 10.0, "std_minutes": 0.0}
+    assert engine.check("d1", "r1", *STOP_A, 800) == []
+    assert engine.stats() == {"routes": 1, "fences": 1, "cells": 1, "drivers_at_stop": 0}
+
+def test_short_visits_are_drive_bys_and_keep_the_fence():
+    engine = engine_with_route()
+    engine.check("d1", "r1", *STOP_A, 0)
+    drive_by, = engine.check("d1", "r1", *north_of(STOP_A, GEOFENCE_EXIT_METERS + 20), GEOFENCE_MIN_DWELL_SECONDS - 10)
+    assert drive_by["type"] == "drive_by"
+    assert engine.dwell_stats("cust_a")["visits"] == 0
+    assert engine.check("d1", "r1", *STOP_A, 200)[0]["type"] == "arrival"
+
+def test_only_the_drivers_route_and_accurate_points_count():
+    engine = engine_with_route()
+    engine.index_route("r2", [("order_c", 1, "cust_c", *STOP_A)])
+    assert engine.check("d1", "r2", *STOP_A, 0)[0]["stop_id"] == "order_c"
+    assert engine.check("d2", None, *STOP_A, 0) == []
+    assert engine.check("d3", "r1", *STOP_A, 0, accuracy=GEOFENCE_MAX_ACCURACY_METERS + 1) == []
+    assert engine.stats()["drivers_at_stop"] == 1
+
+def test_renumbered_route_keeps_the_driver_at_their_stop():
+    engine = engine_with_route()
+    engine.check("d1", "r1", *STOP_B, 0)
+    # A replan puts a new stop first; the arrived stop is no longer pending and gets no fence
+    engine.index_route("r1", [("order_new", 1, "cust_new", 31.13, -93.26), ("order_a", 3, "cust_a", *STOP_A)])
+
+    departure, = engine.check("d1", "r1", *north_of(STOP_B, GEOFENCE_EXIT_METERS + 20), 300)
+    assert (departure["type"], departure["stop_id"], departure["customer_id"]) == ("departure", "order_b", "cust_b")
+
+    # A driver at a stop that is still pending moves to its new fence
+    engine.check("d2", "r1", *STOP_A, 0)
+    engine.index_route("r1", [("order_a", 1, "cust_a", *STOP_A)])
+    departure, = engine.check("d2", "r1", *north_of(STOP_A, GEOFENCE_EXIT_METERS + 20), 300)
+    assert (departure["stop_id"], departure["stop_number"]) == ("order_a", 1)
+    assert engine.stats()["fences"] == 0
+
+def test_dropping_a_route_forgets_its_drivers():
+    engine = engine_with_route()
+    engine.check("d1", "r1", *STOP_A, 0)
+    engine.drop_route("r1")
+    assert not engine.is_indexed("r1")
+    assert engine.check("d1", "r1", *north_of(STOP_A, GEOFENCE_EXIT_METERS + 20), 300) == []
+    assert engine.stats() == {"routes": 0, "fences": 0, "cells": 0, "drivers_at_stop": 0}
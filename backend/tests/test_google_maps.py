@@ -0,0 +1,95 @@
+import random
+import time
+
+import pytest
+
+from app.distance_matrix import DistanceMatrixCache, haversine_distance, estimate_travel_seconds, METERS_PER_MILE
+from app.google_maps import (
+    google_maps, matrix_tiles, RateLimiter,
+    MAX_LOCATIONS_PER_SIDE, MAX_ELEMENTS_PER_REQUEST, GEOCODE_REQUESTS_PER_SECOND
+)
+from tests.maps_standin import start_standin_server
+
+def random_points(count, seed):
+    rng = random.Random(seed)
+    # Six decimals survive the client's coordinate formatting unchanged
+    return [(round(31.0 + rng.uniform(-0.5, 0.5), 6), round(-93.2 + rng.uniform(-0.5, 0.5), 6)) for _ in range(count)]
+
+def standin_meters(a, b):
+    return int(haversine_distance(a[0], a[1], b[0], b[1]) * METERS_PER_MILE)
+
+@pytest.fixture
+def standin(monkeypatch):
+    server = start_standin_server()
+    monkeypatch.setenv("GOOGLE_MAPS_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setenv("GOOGLE_MAPS_API_KEY", "AIza-standin")
+    google_maps.reset()
+    yield server
+    server.shutdown()
+    server.server_close()
+    google_maps.reset()
+
+@pytest.mark.parametrize("origins, destinations", [(40, 30), (1, 60), (26, 26), (25, 4)])
+def test_tiles_cover_the_matrix_within_limits(origins, destinations):
+    covered = set()
+    for origin_range, destination_range in matrix_tiles(origins, destinations):
+        assert len(origin_range) <= MAX_LOCATIONS_PER_SIDE
+        assert len(destination_range) <= MAX_LOCATIONS_PER_SIDE
+        assert len(origin_range) * len(destination_range) <= MAX_ELEMENTS_PER_REQUEST
+        cells = {(i, j) for i in origin_range for j in destination_range}
+        assert not covered & cells
+        covered |= cells
+    assert covered == {(i, j) for i in range(origins) for j in range(destinations)}
+
+def test_large_matrix_is_tiled_and_merged(standin):
+    origins, destinations = random_points(40, 1), random_points(30, 2)
+
+    elements = google_maps.distance_matrix(origins, destinations)
+
+    assert standin.request_count == len(matrix_tiles(40, 30)) > 1
+    assert standin.rejected_count == 0
+    assert len(elements) == 40 * 30
+    for (i, j), element in elements.items():
+        meters = standin_meters(origins[i], destinations[j])
+        assert element["distance"]["value"] == meters
+        assert element["duration"]["value"] == estimate_travel_seconds(meters)
+
+def test_matrix_cache_is_filled_from_the_api(standin):
+    cache = DistanceMatrixCache()
+    points = random_points(30, 3)
+
+    distances, times = cache.build(points)
+    requests = standin.request_count
+
+    assert requests > 1
+    assert standin.rejected_count == 0
+    assert len(cache) == 30 * 29
+    for i in range(30):
+        for j in range(30):
+            expected = 0 if i == j else standin_meters(points[i], points[j])
+            assert distances[i][j] == expected
+            assert cache.get(points[i], points[j]) == (None if i == j else (expected, estimate_travel_seconds(expected)))
+
+    assert cache.build(points) == (distances, times)
+    assert standin.request_count == requests
+
+def test_rate_limiter_throttles_after_the_burst():
+    limiter = RateLimiter(rate=100, capacity=10)
+    started = time.monotonic()
+    for _ in range(10):
+        limiter.acquire()
+    assert time.monotonic() - started < 0.05
+
+    limiter.acquire(20)  # more than the capacity: waits for a full bucket
+    limiter.acquire(10)
+    assert time.monotonic() - started >= 0.18
+
+def test_geocoding_has_its_own_request_limit(standin):
+    assert google_maps.geocode_limiter is not google_maps.rate_limiter
+    assert google_maps.geocode_limiter.rate == GEOCODE_REQUESTS_PER_SECOND
+
+    google_maps.rate_limiter.acquire(google_maps.rate_limiter.capacity)  # drain the element bucket
+    started = time.monotonic()
+    assert google_maps.geocode("100 Main St, Leesville, LA") is None
+    assert time.monotonic() - started < 0.5
+    assert standin.request_count == 1
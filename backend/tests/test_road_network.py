@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+from app.road_network import build_contraction_hierarchy, RoadNetwork
+
+def random_road_graph(num_nodes, seed):
+    """Nodes joined to their nearest neighbours; some roads one-way, the others slower in one direction"""
+    rng = np.random.default_rng(seed)
+    coordinates = np.column_stack([31.0 + rng.uniform(0, 0.3, num_nodes), -93.3 + rng.uniform(0, 0.3, num_nodes)])
+    _, neighbours = cKDTree(coordinates).query(coordinates, k=4)
+    edges = []
+    for u in range(num_nodes):
+        for v in neighbours[u, 1:]:
+            meters = float(np.hypot(*(coordinates[u] - coordinates[v])) * 111000)
+            seconds = meters / rng.uniform(8, 30)
+            edges.append((u, int(v), meters, seconds))
+            if rng.random() < 0.8:
+                edges.append((int(v), u, meters, seconds * rng.uniform(1, 1.3)))
+    return coordinates, edges
+
+def dijkstra_seconds(num_nodes, edges, sources, targets):
+    fastest = {}
+    for u, v, _, seconds in edges:
+        fastest[(u, v)] = min(seconds, fastest.get((u, v), np.inf))
+    rows, columns = zip(*fastest)
+    graph = csr_matrix((list(fastest.values()), (rows, columns)), shape=(num_nodes, num_nodes))
+    return dijkstra(graph, indices=sources)[:, targets]
+
+@pytest.mark.parametrize("seed", range(5))
+def test_contraction_hierarchy_matches_dijkstra(seed):
+    num_nodes = 1500
+    coordinates, edges = random_road_graph(num_nodes, seed)
+    network = RoadNetwork(coordinates, build_contraction_hierarchy(num_nodes, edges))
+    sources = list(range(0, num_nodes, 37))
+    targets = list(range(5, num_nodes, 41))
+
+    seconds, meters = network.node_matrix(sources, targets)
+    expected = dijkstra_seconds(num_nodes, edges, sources, targets)
+
+    assert np.array_equal(np.isinf(seconds), np.isinf(expected))
+    reachable = np.isfinite(expected)
+    assert reachable.sum() > len(sources) * len(targets) / 2
+    assert np.allclose(seconds[reachable], expected[reachable])
+    assert np.array_equal(meters[reachable] == 0, seconds[reachable] == 0)
+
+def test_repeated_nodes_keep_their_positions():
+    coordinates, edges = random_road_graph(200, 7)
+    network = RoadNetwork(coordinates, build_contraction_hierarchy(200, edges))
+    seconds, _ = network.node_matrix([3, 9, 3], [9, 3, 3])
+    single, _ = network.node_matrix([3, 9], [9, 3])
+
+    assert seconds[0, 0] == seconds[2, 0] == single[0, 0]
+    assert seconds[1, 1] == single[1, 1]
+    assert seconds[0, 2] == 0
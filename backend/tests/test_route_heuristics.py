@@ -0,0 +1,64 @@
+import random
+import time
+
+import pytest
+
+from app.route_heuristics import (
+    improve_route, nearest_neighbor_routes, project_coordinates, route_length_miles, solve_heuristic
+)
+
+def random_stops(count, seed):
+    rng = random.Random(seed)
+    depot = [(31.14, -93.26)]
+    return depot + [(31.14 + rng.uniform(-0.4, 0.4), -93.26 + rng.uniform(-0.4, 0.4)) for _ in range(count)]
+
+@pytest.mark.parametrize("count, capacities", [(10, [20]), (200, [60, 60, 60, 60]), (500, [100] * 6)])
+def test_every_stop_is_served_once_within_capacity(count, capacities):
+    coordinates = random_stops(count, count)
+    demands = [0] + [random.Random(i).randint(1, 3) for i in range(count)]
+    if sum(demands) > sum(capacities):
+        capacities = [sum(demands)] * len(capacities)
+
+    routes = solve_heuristic(coordinates, demands, capacities)
+
+    served = [stop for route in routes for stop in route]
+    assert sorted(served) == list(range(1, count + 1))
+    assert all(sum(demands[stop] for stop in route) <= capacity for route, capacity in zip(routes, capacities))
+
+def test_stops_that_fit_no_vehicle_are_left_out():
+    coordinates = random_stops(30, 1)
+    demands = [0] + [5] * 30
+    routes = solve_heuristic(coordinates, demands, [20, 20])
+    served = [stop for route in routes for stop in route]
+    assert len(served) == len(set(served)) == 8
+
+def test_weight_capacity_is_respected():
+    coordinates = random_stops(40, 2)
+    routes = solve_heuristic(coordinates, [0] + [1] * 40, [40, 40],
+                             weights=[0] + [100] * 40, vehicle_weight_capacities=[1500, 1500])
+    assert [len(route) for route in routes] == [15, 15]
+
+@pytest.mark.parametrize("seed", range(3))
+def test_improvement_never_lengthens_a_route(seed):
+    coordinates = random_stops(300, seed)
+    demands = [0] + [1] * 300
+    constructed = solve_heuristic(coordinates, demands, [100, 100, 100], improve=False)
+    improved = solve_heuristic(coordinates, demands, [100, 100, 100])
+
+    for before, after in zip(constructed, improved):
+        assert sorted(before) == sorted(after)
+        assert route_length_miles(after, coordinates) <= route_length_miles(before, coordinates) + 1e-9
+    assert sum(map(route_length_miles, improved, [coordinates] * 3)) < sum(map(route_length_miles, constructed, [coordinates] * 3))
+
+@pytest.mark.parametrize("count", [1000, 4000])
+def test_improvement_respects_its_deadline(count):
+    points = project_coordinates(random_stops(count, 5))
+    route = nearest_neighbor_routes(points, [0] + [1] * count, [count])[0]
+    budget = 0.1
+
+    started = time.perf_counter()
+    improved = improve_route(route, points, deadline=started + budget)
+    elapsed = time.perf_counter() - started
+
+    assert sorted(improved) == sorted(route)
+    assert elapsed < budget + 0.05
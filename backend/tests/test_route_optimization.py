@@ -0,0 +1,72 @@
+import asyncio
+import json
+import os
+import random
+
+import httpx
+import pytest
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory):
+    """The API on sample data in a scratch directory, with every customer geocoded"""
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("api"))
+    os.environ["GOOGLE_MAPS_API_KEY"] = ""
+    from app import main
+    rng = random.Random(0)
+    for customer in list(main.customers_db.values()) + main.imported_customers:
+        customer["coordinates"] = {"lat": 31.14 + rng.uniform(-0.1, 0.1), "lng": -93.26 + rng.uniform(-0.1, 0.1)}
+    yield main
+    os.chdir(cwd)
+
+@pytest.fixture
+def fresh_plan(api):
+    """Pending sample orders and no routes; each test runs its own event loop, so it gets new locks"""
+    for order in api.orders_db.values():
+        if order.get("route_id"):
+            order["status"] = "pending"
+            order["route_id"] = None
+    api.routes_db.clear()
+    api.solution_cache.clear()
+    api.optimization_locks.clear()
+    yield api
+
+async def concurrently(main, *urls):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://api") as client:
+        login = await client.post("/api/auth/login", json={"username": "manager", "password": "dev-password-change-in-production"})
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+        responses = await asyncio.gather(*(client.post(url, headers=headers) for url in urls))
+    return [r.json() if r.headers["content-type"].startswith("application/json")
+            else [json.loads(line) for line in r.text.splitlines()][-1] for r in responses]
+
+def assert_one_route_set(main, first, second):
+    route_ids = {route["id"] for route in first["routes"]}
+    assert route_ids and set(main.routes_db) == route_ids
+    routed = [stop["order_id"] for route in main.routes_db.values() for stop in route["stops"]]
+    assert len(routed) == len(set(routed))
+    assert all(main.orders_db[order_id]["route_id"] in route_ids for order_id in routed)
+    vehicles = [route["vehicle_id"] for route in main.routes_db.values()]
+    assert len(vehicles) == len(set(vehicles))
+    assert {route["id"] for route in second["routes"]} in (route_ids, set())
+
+def test_concurrent_optimizations_create_one_route_set(fresh_plan):
+    url = "/api/routes/optimize?location_id=loc_1&time_limit_seconds=1"
+    first, second = asyncio.run(concurrently(fresh_plan, url, url))
+
+    assert first["cached"] is False and second["cached"] is True
+    assert_one_route_set(fresh_plan, first, second)
+
+def test_streamed_and_plain_optimizations_do_not_overlap(fresh_plan):
+    url = "/api/routes/optimize?location_id=loc_1&time_limit_seconds=1"
+    first, second = asyncio.run(concurrently(fresh_plan, url + "&anytime=true", url + "&use_cache=false"))
+
+    assert first["type"] == "result"
+    assert_one_route_set(fresh_plan, first, second)
+
+def test_multi_depot_waits_for_a_branch_optimization(fresh_plan):
+    first, second = asyncio.run(concurrently(
+        fresh_plan,
+        "/api/routes/optimize?location_id=loc_1&time_limit_seconds=1",
+        "/api/routes/optimize-multi-depot?location_ids=loc_1&time_limit_seconds=1",
+    ))
+    assert_one_route_set(fresh_plan, first, second)
@@ -0,0 +1,77 @@
+import random
+from collections import Counter
+from datetime import date
+
+import pytest
+
+from app.territory_planner import (
+    plan_week, plan_week_dates, sheet_weekday, visit_patterns, WEEKDAYS, WORKDAY_HOURS
+)
+
+DEPOT = (31.14, -93.26)
+DAYS = WEEKDAYS[:5]
+
+def customers(count, seed, service_minutes=10, spread=0.15):
+    rng = random.Random(seed)
+    return [
+        {
+            "id": f"c{i}",
+            "name": f"Customer {i}",
+            "coordinates": {"lat": DEPOT[0] + rng.uniform(-spread, spread), "lng": DEPOT[1] + rng.uniform(-spread, spread)},
+            "service_time_minutes": service_minutes,
+            "visits_per_week": rng.choice([1, 1, 1, 2, 3]),
+        }
+        for i in range(count)
+    ]
+
+def fleet(count):
+    vehicles = [{"id": f"v{i}", "location_id": "loc_1", "vehicle_type": "53ft_reefer"} for i in range(count)]
+    return vehicles, [(20, 40000)] * count
+
+def drivers(count):
+    return [{"id": f"d{i}", "location_id": "loc_1", "shift_start": "06:00", "shift_end": "20:00"} for i in range(count)]
+
+def plan(stops, vehicles, driver_count, **kwargs):
+    vehicle_list, capacities = fleet(vehicles)
+    return plan_week(stops, DEPOT, vehicle_list, {}, capacities, DAYS, drivers(driver_count),
+                     route_time_limit_seconds=0.2, **kwargs)
+
+def test_weekday_helpers():
+    assert sheet_weekday("Churchpoint-Tuesday") == "tuesday"
+    assert sheet_weekday("Deliveries") is None
+    assert [[DAYS[i] for i in p] for p in visit_patterns(3, DAYS)] == [["monday", "wednesday", "friday"]]
+    assert all(len(p) == 2 for p in visit_patterns(2, DAYS))
+    assert visit_patterns(2, DAYS, ["tuesday", "friday"]) == [(1, 4)]
+    dates = plan_week_dates(["monday", "friday"], today=date(2025, 10, 15))
+    assert dates == {"monday": date(2025, 10, 20), "friday": date(2025, 10, 24)}
+
+def test_feasible_week_visits_everyone_and_assigns_drivers():
+    stops = customers(120, 1)
+    result = plan(stops, vehicles=4, driver_count=4)
+
+    visits = Counter(stop["customer_id"] for day in result["days"] for route in day["routes"] for stop in route["stops"])
+    assert visits == {c["id"]: c["visits_per_week"] for c in stops}
+    for c in stops:
+        days = [day["day"] for day in result["days"] for route in day["routes"]
+                for stop in route["stops"] if stop["customer_id"] == c["id"]]
+        assert len(set(days)) == c["visits_per_week"]
+    for day in result["days"]:
+        assert len({route["vehicle_id"] for route in day["routes"]}) == len(day["routes"])
+        assert day["capacity_shortfall_hours"] == 0
+    assert result["capacity_shortfall_hours"] == 0
+    assert result["unassigned_routes"] == [] and result["warnings"] == []
+    assert all(route["driver_id"] for day in result["days"] for route in day["routes"])
+
+def test_overloaded_fleet_reports_the_shortfall():
+    stops = customers(400, 2, service_minutes=25, spread=0.3)
+    result = plan(stops, vehicles=2, driver_count=2)
+
+    for day in result["days"]:
+        day_hours = sum(route["workload_hours"] for route in day["routes"])
+        assert len(day["routes"]) <= 2
+        assert day["trucks_needed"] > 2
+        assert day["capacity_shortfall_hours"] == pytest.approx(day_hours - 2 * WORKDAY_HOURS, abs=0.05)
+    assert result["capacity_shortfall_hours"] > 0
+    assert sum(warning.startswith(tuple(DAYS)) for warning in result["warnings"]) == len(DAYS)
+    assert any("no driver" in warning for warning in result["warnings"])
+    assert all(route["overtime"] for day in result["days"] for route in day["routes"])